@@ -1,4 +1,4 @@
-from flask import Flask, render_template, redirect, url_for, session, request, flash, jsonify
+from flask import Flask, render_template, redirect, url_for, session, request, flash, jsonify, g, send_file, copy_current_request_context
 import os
 from dotenv import load_dotenv
 import requests
@@ -6,21 +6,41 @@ import uuid
 import json
 from urllib.parse import quote_plus
 import base64
+import hmac
 import threading
 import subprocess
 import sys
 import time
+from functools import wraps
+from werkzeug.http import parse_options_header
+from qb_client import QB_API_BASE_URL, QuickBooksAPIError, get_client
+from qb_entities import ENTITY_REGISTRY, display_name as entity_display_name, entities_in, line_detail as entity_line_detail, plan_entities, transaction_amount
+from qb_deadline import QB_EXPORT_DEADLINE, QB_REQUEST_DEADLINE, Deadline, client_disconnected, current_deadline, reset_deadline, set_deadline
+from qb_jobs import JobFailed, get_job_manager, report_progress
+from qb_query import InvalidFilter, QueryFilters
+from qb_ratelimit import PRIORITY_BULK, current_priority, request_priority
+from qb_scheduler import QB_SYNC_SCHEDULER_ENABLED, get_sync_scheduler
+from qb_sync import QB_INCREMENTAL_FETCH, QB_SWR_HARD_TTL, QB_SWR_SOFT_TTL, get_sync_engine
+from qb_session import init_session
+from qb_tokens import get_token_manager
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'super-secret-key-change-this-in-production')
 
+# Session data lives server-side; the cookie only carries an opaque session id
+init_session(app)
+
 # QuickBooks API Configuration
 QB_CLIENT_ID = os.getenv('QB_CLIENT_ID')
 QB_CLIENT_SECRET = os.getenv('QB_CLIENT_SECRET')
 QB_SANDBOX = os.getenv('QB_SANDBOX', 'False').lower() == 'true'
 
+# Secret for cross-company admin routes (X-Admin-Token header); without it a
+# connected session only administers its own company
+QB_ADMIN_TOKEN = os.getenv('QB_ADMIN_TOKEN')
+
 # Auto-detect environment and set appropriate redirect URI
 def get_redirect_uri():
     """Get the appropriate redirect URI based on environment"""
@@ -44,11 +64,25 @@ QB_REDIRECT_URI = get_redirect_uri()
 if QB_SANDBOX:
     QB_OAUTH_AUTHORIZE_URL = "https://appcenter.intuit.com/connect/oauth2"
     QB_OAUTH_TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
-    QB_API_BASE_URL = "https://sandbox-quickbooks.api.intuit.com/v3/company"
 else:
     QB_OAUTH_AUTHORIZE_URL = "https://appcenter.intuit.com/connect/oauth2"
     QB_OAUTH_TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
-    QB_API_BASE_URL = "https://quickbooks.api.intuit.com/v3/company"
+
+# Shared pooled HTTP client (QB_API_BASE_URL comes from qb_client)
+qb_client = get_client()
+
+# Server-side OAuth tokens per realm; the client sends the current (refreshed) one
+token_manager = get_token_manager()
+qb_client.tokens = token_manager
+
+# Worker pool producing long exports on disk (see /api/jobs)
+job_manager = get_job_manager()
+
+# Periodic background sync of every connected realm (started in startup())
+sync_scheduler = get_sync_scheduler()
+
+# CDC sync engine holding the local copy of each realm's data
+sync_engine = get_sync_engine()
 
 # Jupyter Configuration
 JUPYTER_PORT = int(os.getenv('JUPYTER_PORT', '8888'))
@@ -300,15 +334,18 @@ def callback():
         "Content-Type": "application/x-www-form-urlencoded"
     }
 
-    response = requests.post(QB_OAUTH_TOKEN_URL, data=token_data, headers=headers)
+    response = qb_client.post(QB_OAUTH_TOKEN_URL, data=token_data, headers=headers)
     
     if response.status_code == 200:
         token_response = response.json()
+        # Refresh token and expiry stay server-side; the cookie only marks the connection
+        token_manager.save(realm_id, token_response)
+        if hasattr(session, 'regenerate'):
+            session.regenerate()
+        # Pull the dashboard's entities into the local mirror while the page loads
+        sync_scheduler.warm(realm_id, entities_in("warm"))
         session["access_token"] = token_response["access_token"]
-        session["refresh_token"] = token_response["refresh_token"]
         session["company_id"] = realm_id
-        session["expires_in"] = token_response["expires_in"]
-        session["x_refresh_token_expires_in"] = token_response["x_refresh_token_expires_in"]
         return redirect("/dashboard")
     else:
         return f"Token exchange failed: {response.status_code} - {response.text}", 400
@@ -328,144 +365,381 @@ def make_quickbooks_api_call(query):
     access_token = session['access_token']
     company_id = session['company_id']
     
-    # Encode the query for URL
-    encoded_query = quote_plus(query)
-    
-    url = f"{QB_API_BASE_URL}/{company_id}/query?query={encoded_query}&minorversion=69"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Accept': 'application/json'
-    }
     try:
         print(f"Making QB query: {query}")
-        print(f"URL: {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        print(f"Response status: {response.status_code}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error making QB request: {response.status_code} - {response.text}")
-        return {"error": str(e), "detail": response.text}, response.status_code
+        data = qb_client.query(company_id, access_token, query)
+        print("Response status: 200")
+        return data
+    except QuickBooksAPIError as e:
+        print(f"Error making QB request: {e.status_code} - {e.detail}")
+        return {"error": str(e), "detail": e.detail}, e.status_code
 
-@app.route('/api/customers')
-def get_customers():
-    data = make_quickbooks_api_call("SELECT * FROM Customer")
+def qb_priority(priority):
+    """Run a view's QuickBooks calls under a scheduler priority class"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return view(*args, **kwargs)
+        wrapper.qb_priority = priority
+        return wrapper
+    return decorator
+
+def realm_admin(view):
+    """Admin route scoped to the caller's realms
+
+    With a valid X-Admin-Token header g.admin_realm is None (every company);
+    otherwise it is the connected session's company_id.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        supplied = request.headers.get('X-Admin-Token', '')
+        if QB_ADMIN_TOKEN and hmac.compare_digest(supplied.encode('utf-8'), QB_ADMIN_TOKEN.encode('utf-8')):
+            g.admin_realm = None
+        elif 'access_token' in session and 'company_id' in session:
+            g.admin_realm = str(session['company_id'])
+        else:
+            return jsonify({"error": "Admin token or QuickBooks connection required"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def start_request_deadline():
+    """Give each API request a deadline budget, cancelled if the browser disconnects"""
+    if not request.path.startswith('/api/'):
+        return
+    
+    view = app.view_functions.get(request.endpoint)
+    seconds = QB_EXPORT_DEADLINE if getattr(view, 'qb_priority', None) == PRIORITY_BULK else QB_REQUEST_DEADLINE
+    environ = request.environ
+    g.deadline_token = set_deadline(Deadline(seconds, is_cancelled=lambda: client_disconnected(environ)))
+
+@app.after_request
+def flag_partial_response(response):
+    """Mark responses missing entities because the deadline ran out or the client left"""
+    if g.get('partial_entities'):
+        response.headers['X-Partial-Response'] = 'true'
+        response.headers['X-Missing-Entities'] = ','.join(g.partial_entities)
+    return response
+
+@app.teardown_request
+def end_request_deadline(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        reset_deadline(token)
+
+def record_partial(entity_type, stale=False):
+    """Note an entity left out because the request deadline ran out or the client left
+
+    stale=True notes an entity served from an out-of-date local copy.
+    """
+    deadline = current_deadline()
+    if stale or (deadline is not None and deadline.done):
+        partial_entities = g.setdefault('partial_entities', [])
+        if entity_type not in partial_entities:
+            partial_entities.append(entity_type)
+
+@app.errorhandler(InvalidFilter)
+def invalid_filter(e):
+    """Filters that are malformed or that QuickBooks could not parse"""
+    return jsonify({"error": str(e), "detail": e.detail}), 400
+
+def partial_info():
+    """partial / missing_entities fields for JSON responses"""
+    missing = g.get('partial_entities', [])
+    return {'partial': bool(missing), 'missing_entities': missing}
+
+def make_quickbooks_api_calls(queries):
+    """Run several QuickBooks queries concurrently, results in query order"""
+    if 'access_token' not in session or 'company_id' not in session:
+        return [({"error": "Not connected to QuickBooks"}, 401) for _ in queries]
+
+    print(f"Making {len(queries)} QB queries concurrently")
+    results = qb_client.query_many(session['company_id'], session['access_token'], queries)
+
+    return [
+        ({"error": str(result), "detail": result.detail}, result.status_code)
+        if isinstance(result, QuickBooksAPIError) else result
+        for result in results
+    ]
+
+def refresh_mirrored_entity(entity_type, filters=None):
+    """Bring a mirrored entity up to date with rows changed since its watermark
+
+    An entity that is not mirrored yet is loaded in full only for unfiltered
+    requests; with filters the caller's filtered query fetches just the
+    matching rows instead. If the refresh fails the stale copy is still
+    served and the entity is reported as partial.
+    """
+    if 'access_token' not in session or 'company_id' not in session:
+        return
+    company_id = session['company_id']
+    report = sync_engine.refresh_entity(company_id, session['access_token'], entity_type, load=not filters)
+    if report is not None and entity_type in report['errors']:
+        print(f"Incremental refresh of {entity_type} failed: {report['errors'][entity_type]}")
+        if sync_engine.store.is_loaded(company_id, entity_type):
+            record_partial(entity_type, stale=True)
+
+def fetch_entity_results(entity_types, filters=None):
+    """Query results per entity, from the synced local copy where available
+
+    Entities the sync engine holds for this realm are served locally; the rest
+    are queried live (concurrently), except entities the realm cannot query,
+    which come back empty. filters (qb_query.QueryFilters) are pushed into the
+    queries, and into the local read; entities they can never match are not
+    fetched. Exports first refresh mirrored entities incrementally
+    (QB_INCREMENTAL_FETCH). Results keep the order of entity_types.
+    """
+    company_id = session.get('company_id')
+    filters = filters or QueryFilters()
+    # Every entity is fetched at most once per request (and filter set), however
+    # many consumers (endpoint + export wrapping it) ask for it
+    fetched = g.setdefault('entity_results', {}).setdefault(filters.key(), {})
+    missing = [entity_type for entity_type in plan_entities(*entity_types) if entity_type not in fetched]
+    live = []
+    
+    for entity_type in missing:
+        if not filters.applies_to(entity_type):
+            fetched[entity_type] = {'QueryResponse': {}}
+            continue
+        if QB_INCREMENTAL_FETCH and current_priority() == PRIORITY_BULK:
+            refresh_mirrored_entity(entity_type, filters)
+        records = sync_engine.get_records(company_id, entity_type, *filters.date_range(entity_type))
+        if records is None:
+            live.append(entity_type)
+        else:
+            fetched[entity_type] = {'QueryResponse': {entity_type: filters.apply(records, entity_type)}}
+    
+    if live and 'access_token' in session:
+        # Entities this realm cannot query are skipped without a round trip
+        queryable = qb_client.supported_entities(company_id, session['access_token'], live)
+        for entity_type in live:
+            if entity_type not in queryable:
+                fetched[entity_type] = {'QueryResponse': {}}
+        live = queryable
+    
+    if live:
+        report_progress(entities_total=len(missing), entity=", ".join(live))
+        live_results = make_quickbooks_api_calls([filters.query(entity_type) for entity_type in live])
+        for entity_type, result in zip(live, live_results):
+            if isinstance(result, tuple):
+                # A bad field list must fail the request, not silently drop the entity
+                filters.check_rejected(entity_type, result[1], result[0].get('detail', ''))
+            if filters and not isinstance(result, tuple) and entity_type in result.get('QueryResponse', {}):
+                # References QuickBooks cannot filter on (e.g. Purchase.EntityRef) are matched here
+                result['QueryResponse'][entity_type] = filters.apply(result['QueryResponse'][entity_type], entity_type)
+            fetched[entity_type] = result
+    
+    for entity_type in missing:
+        result = fetched[entity_type]
+        records = 0 if isinstance(result, tuple) else len(result.get('QueryResponse', {}).get(entity_type, []))
+        report_progress(entity_done=entity_type, pages=int(entity_type in live), records=records)
+    
+    results = [fetched[entity_type] for entity_type in entity_types]
+    for entity_type, result in zip(entity_types, results):
+        if isinstance(result, tuple):
+            record_partial(entity_type)
+    
+    return results
+
+def make_paginated_api_call(entity_type, max_results=1000, incremental=QB_INCREMENTAL_FETCH, filters=None):
+    """Fetch ALL records from QuickBooks with COUNT(*)-planned parallel pagination
+    
+    In incremental mode only rows changed since the last fetch are pulled
+    (WHERE MetaData.LastUpdatedTime > watermark) and upserted into the local mirror.
+    filters (qb_query.QueryFilters) are compiled into the WHERE clause and SELECT list.
+    """
+    if 'access_token' not in session or 'company_id' not in session:
+        return {"error": "Not connected to QuickBooks"}, 401
+
+    access_token = session['access_token']
+    company_id = session['company_id']
+    filters = filters or QueryFilters()
+    
+    # Bring the local copy up to date with rows changed since the entity's watermark
+    if incremental:
+        refresh_mirrored_entity(entity_type, filters)
+    
+    # Serve from the CDC-synced local copy when this realm has one
+    local_records = sync_engine.get_records(company_id, entity_type, *filters.date_range(entity_type))
+    if local_records is not None:
+        local_records = filters.apply(local_records, entity_type)
+        print(f"Using {len(local_records)} synced {entity_type} records")
+        return local_records[:max_results]
+    
+    try:
+        print(f"Fetching {entity_type} (max {max_results} records)")
+        all_records = qb_client.query_all(company_id, access_token, entity_type, max_records=max_results,
+                                          where=filters.where(entity_type), fields=filters.select_fields(entity_type))
+    except QuickBooksAPIError as e:
+        print(f"Error fetching {entity_type}: {str(e)}")
+        print(f"Response: {e.detail}")
+        filters.check_rejected(entity_type, e.status_code, e.detail)
+        record_partial(entity_type)
+        return {"error": str(e), "detail": e.detail}, e.status_code
+    
+    print(f"Total {entity_type} records fetched: {len(all_records)}")
+    return filters.apply(all_records, entity_type)
+
+def make_quickbooks_batch_call(queries):
+    """Run many QuickBooks queries in one /batch round trip, results in query order"""
+    if 'access_token' not in session or 'company_id' not in session:
+        return [({"error": "Not connected to QuickBooks"}, 401) for _ in queries]
+
+    print(f"Making QB batch call with {len(queries)} queries")
+    results = qb_client.batch(session['company_id'], session['access_token'], queries)
+
+    return [
+        ({"error": str(result), "detail": result.detail}, result.status_code)
+        if isinstance(result, QuickBooksAPIError) else result
+        for result in results
+    ]
+
+def get_entity_list(entity_type):
+    """JSON list of one entity, served stale-while-revalidate from the local mirror
+
+    Local data younger than the soft TTL is returned as is; older data is
+    returned immediately while this entity is refreshed in the background,
+    and past the hard TTL (or with ?refresh=true) it is refreshed first.
+    X-Data-Age gives the age of the returned data in seconds.
+    """
+    company_id = session.get('company_id')
+    force = request.args.get('refresh', 'false').lower() == 'true'
+    age = sync_engine.data_age(company_id, entity_type)
+    revalidating = False
+    
+    if 'access_token' in session and (force or (age is not None and age >= QB_SWR_HARD_TTL)):
+        # Only the requested entity; whole-realm syncs stay with the background scheduler
+        try:
+            report = sync_engine.refresh_entity(company_id, session['access_token'], entity_type)
+            if report is not None and entity_type in report['errors']:
+                # Stale data beats no data; the next request tries again
+                print(f"Error refreshing {entity_type}: {report['errors'][entity_type]}")
+        except QuickBooksAPIError as e:
+            print(f"Error refreshing {entity_type}: {e.status_code} - {e.detail}")
+        age = sync_engine.data_age(company_id, entity_type)
+    elif 'access_token' in session and age is not None and age >= QB_SWR_SOFT_TTL:
+        # Served as is; this entity alone is refreshed in the background
+        sync_scheduler.revalidate(company_id, session['access_token'], entity_type)
+        revalidating = True
+    
+    records = sync_engine.get_records(company_id, entity_type)
+    if records is not None:
+        response = jsonify(records)
+        response.headers['X-Data-Age'] = str(int(age or 0))
+        if revalidating:
+            response.headers['X-Data-Revalidating'] = 'true'
+        return response
+    
+    data = make_quickbooks_api_call(f"SELECT * FROM {entity_type}")
     if isinstance(data, tuple):
         return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Customer', []))
+    response = jsonify(data.get('QueryResponse', {}).get(entity_type, []))
+    response.headers['X-Data-Age'] = '0'
+    return response
+
+@app.route('/api/customers')
+def get_customers():
+    return get_entity_list('Customer')
 
 @app.route('/api/invoices')
 def get_invoices():
-    data = make_quickbooks_api_call("SELECT * FROM Invoice")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Invoice', []))
+    return get_entity_list('Invoice')
 
 @app.route('/api/payments')
 def get_payments():
-    data = make_quickbooks_api_call("SELECT * FROM Payment")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Payment', []))
+    return get_entity_list('Payment')
 
 @app.route('/api/items')
 def get_items():
-    data = make_quickbooks_api_call("SELECT * FROM Item")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Item', []))
+    return get_entity_list('Item')
 
 @app.route("/api/classes")
 def get_classes():
-    data = make_quickbooks_api_call("SELECT * FROM Class")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get("QueryResponse", {}).get("Class", []))
+    return get_entity_list("Class")
+
 # Transaction Data Endpoints
 @app.route('/api/journal_entries')
 def get_journal_entries():
-    data = make_quickbooks_api_call("SELECT * FROM JournalEntry")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('JournalEntry', []))
+    return get_entity_list('JournalEntry')
 
 @app.route('/api/deposits')
 def get_deposits():
-    data = make_quickbooks_api_call("SELECT * FROM Deposit")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Deposit', []))
+    return get_entity_list('Deposit')
 
 @app.route('/api/expenses')
 def get_expenses():
-    data = make_quickbooks_api_call("SELECT * FROM Purchase")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Purchase', []))
+    return get_entity_list('Purchase')
 
 @app.route('/api/transfers')
 def get_transfers():
-    data = make_quickbooks_api_call("SELECT * FROM Transfer")
-    if isinstance(data, tuple):
-        return jsonify(data[0]), data[1]
-    return jsonify(data.get('QueryResponse', {}).get('Transfer', []))
+    return get_entity_list('Transfer')
 
 @app.route('/api/sync')
 def sync_data():
-    # Get counts safely
-    customer_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Customer")
-    invoice_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Invoice")
-    item_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Item")
-    payment_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Payment")
-    journal_result = make_quickbooks_api_call("SELECT COUNT(*) FROM JournalEntry")
-    deposit_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Deposit")
-    expense_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Purchase")
-    transfer_result = make_quickbooks_api_call("SELECT COUNT(*) FROM Transfer")
-    
-    # Handle errors safely
-    def safe_get_count(result):
-        if isinstance(result, tuple):
-            return 0  # Return 0 if there's an error
-        return result.get('QueryResponse', {}).get('totalCount', 0)
+    """Incrementally sync the local data copy for this realm via CDC"""
+    if 'access_token' not in session or 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    company_id = session['company_id']
+    full = request.args.get('full', 'false').lower() == 'true'
+    
+    try:
+        report = sync_engine.sync(company_id, session['access_token'], full=full)
+    except QuickBooksAPIError as e:
+        print(f"Error syncing realm {company_id}: {e.status_code} - {e.detail}")
+        return jsonify({"error": str(e), "detail": e.detail, "status": "error"}), e.status_code
+    
+    counts = sync_engine.counts(company_id)
     
     return jsonify({
-        "message": "Data sync initiated",
+        "message": f"{report['mode'].capitalize()} sync complete",
+        "mode": report['mode'],
+        "added": report['added'],
+        "updated": report['updated'],
+        "deleted": report['deleted'],
+        "by_entity": report['by_entity'],
+        "errors": report['errors'],
+        "watermark": report['watermark'],
+        "duration_seconds": report['duration_seconds'],
         "counts": {
-            "customers": safe_get_count(customer_result),
-            "invoices": safe_get_count(invoice_result),
-            "items": safe_get_count(item_result),
-            "payments": safe_get_count(payment_result),
-            "journal_entries": safe_get_count(journal_result),
-            "deposits": safe_get_count(deposit_result),
-            "expenses": safe_get_count(expense_result),
-            "transfers": safe_get_count(transfer_result)
+            ENTITY_REGISTRY[entity_type]['collection']: counts.get(entity_type, 0)
+            for entity_type in entities_in("overview")
         },
         "status": "success"
     })
     
+@app.route('/api/counts')
+def get_counts():
+    """Record counts for the dashboard cards in a single batch call"""
+    entity_types = entities_in("dashboard")
+    results = make_quickbooks_batch_call([f"SELECT COUNT(*) FROM {entity_type}" for entity_type in entity_types])
+    
+    counts = {}
+    for entity_type, result in zip(entity_types, results):
+        if isinstance(result, tuple):
+            counts[entity_type] = None
+        else:
+            counts[entity_type] = result.get('QueryResponse', {}).get('totalCount', 0)
+    
+    return jsonify(counts)
+    
 @app.route("/new_dashboard")
 def new_dashboard():
-    # Get counts safely
-    customer_result = make_quickbooks_api_call("SELECT * FROM Customer")
-    invoice_result = make_quickbooks_api_call("SELECT * FROM Invoice")
-    item_result = make_quickbooks_api_call("SELECT * FROM Item")
-    payment_result = make_quickbooks_api_call("SELECT * FROM Payment")
-    journal_result = make_quickbooks_api_call("SELECT * FROM JournalEntry")
-    deposit_result = make_quickbooks_api_call("SELECT * FROM Deposit")
-    expense_result = make_quickbooks_api_call("SELECT * FROM Purchase")
-    transfer_result = make_quickbooks_api_call("SELECT * FROM Transfer")
-
-
-    return render_template("new_dashboard.html",
-       customer_data=customer_result.get("QueryResponse", {}).get("Customer", []),
-        invoice_data=invoice_result.get("QueryResponse", {}).get("Invoice", []),
-        item_data=item_result.get("QueryResponse", {}).get("Item", []),
-        payment_data=payment_result.get("QueryResponse", {}).get("Payment", []),
-        journal_data=journal_result.get("QueryResponse", {}).get("JournalEntry", []),
-        deposit_data=deposit_result.get("QueryResponse", {}).get("Deposit", []),
-        expense_data=expense_result.get("QueryResponse", {}).get("Purchase", []),
-        transfer_data=transfer_result.get("QueryResponse", {}).get("Transfer", [])
-        )
+    # Fetch every overview entity (registry "overview" group) in one batch round trip
+    entity_types = entities_in("overview")
+    results = make_quickbooks_batch_call([f"SELECT * FROM {entity_type}" for entity_type in entity_types])
+
+    # Errors come back as (error, status) tuples - show them as empty tables
+    def safe_get_rows(result, entity_type):
+        if isinstance(result, tuple):
+            return []
+        return result.get("QueryResponse", {}).get(entity_type, [])
+
+    return render_template("new_dashboard.html", **{
+        f"{ENTITY_REGISTRY[entity_type]['collection']}_data": safe_get_rows(result, entity_type)
+        for entity_type, result in zip(entity_types, results)
+    })
 
 # QBO-Style Transaction Endpoint
 @app.route("/api/transactions/qbo-style")
@@ -672,6 +946,7 @@ def get_transactions_qbo_style():
 
 # QBO-Style CSV Export
 @app.route("/api/transactions/export/qbo-style")
+@qb_priority(PRIORITY_BULK)
 def export_transactions_qbo_style():
     """Export transactions in QBO export format"""
     if "access_token" not in session or "company_id" not in session:
@@ -713,6 +988,11 @@ def get_transactions_pandas():
     if 'access_token' not in session or 'company_id' not in session:
         return jsonify({"error": "Not connected to QuickBooks"}), 401
     
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     import pandas as pd
     from datetime import datetime
     
@@ -733,69 +1013,35 @@ def get_transactions_pandas():
             'last_modified': transaction.get('MetaData', {}).get('LastUpdatedTime', '')
         }
         
-        # Extract amount based on transaction type
+        # Only types with a standardized_label get amount, description and
+        # status; the rest keep the defaults above
+        label = ENTITY_REGISTRY.get(transaction_type, {}).get('standardized_label')
+        if label is None:
+            return base_data
+        
+        base_data['amount'] = transaction_amount(transaction, transaction_type)
+        
         if transaction_type == 'JournalEntry':
-            # Sum up all line amounts
-            total_amount = 0
-            for line in transaction.get('Line', []):
-                if 'Amount' in line:
-                    total_amount += float(line['Amount'])
-            base_data['amount'] = total_amount
-            base_data['description'] = transaction.get('DocNumber', 'Journal Entry')
-            
-        elif transaction_type == 'Deposit':
-            base_data['amount'] = float(transaction.get('TotalAmt', 0))
-            base_data['description'] = f"Deposit - {transaction.get('DocNumber', 'No Ref')}"
-            base_data['status'] = 'Completed'
-            
-        elif transaction_type == 'Purchase':
-            base_data['amount'] = float(transaction.get('TotalAmt', 0))
-            base_data['description'] = f"Expense - {transaction.get('DocNumber', 'No Ref')}"
-            base_data['status'] = 'Completed'
-            
-        elif transaction_type == 'Transfer':
-            base_data['amount'] = float(transaction.get('Amount', 0))
-            base_data['description'] = f"Transfer - {transaction.get('DocNumber', 'No Ref')}"
-            base_data['status'] = 'Completed'
-            
-        elif transaction_type == 'Payment':
-            base_data['amount'] = float(transaction.get('TotalAmt', 0))
-            base_data['description'] = f"Payment - {transaction.get('DocNumber', 'No Ref')}"
-            base_data['status'] = 'Completed'
+            base_data['description'] = transaction.get('DocNumber', label)
+        else:
+            base_data['description'] = f"{label} - {transaction.get('DocNumber', 'No Ref')}"
             
-        elif transaction_type == 'Invoice':
-            base_data['amount'] = float(transaction.get('TotalAmt', 0))
-            base_data['description'] = f"Invoice - {transaction.get('DocNumber', 'No Ref')}"
+        if transaction_type == 'Invoice':
             base_data['status'] = transaction.get('EmailStatus', 'Unknown')
+        elif transaction_type != 'JournalEntry':
+            base_data['status'] = 'Completed'
             
         return base_data
     
-    # Fetch all transaction types
-    transaction_types = [
-        ("JournalEntry", "Journal Entry"),
-        ("Deposit", "Deposit"),
-        ("Purchase", "Bill"),
-        ("Transfer", "Transfer"),
-        ("Payment", "Payment"),
-        ("Invoice", "Invoice"),
-        ("Bill", "Bill"),
-        ("BillPayment", "Bill Payment"),
-        ("Expense", "Expense"),
-        ("RefundReceipt", "Refund Receipt"),
-        ("CreditMemo", "Credit Memo"),
-        ("SalesReceipt", "Sales Receipt"),
-        ('JournalEntry', 'Journal Entries'),
-        ('Deposit', 'Deposits'),
-        ('Purchase', 'Expenses'),
-        ('Transfer', 'Transfers'),
-        ('Payment', 'Payments'),
-        ('Invoice', 'Invoices')
-    ]
+    # Fetch all transaction types (registry "transactions" group)
+    transaction_types = entities_in("transactions")
+    
+    # Local copy where synced, otherwise fetch concurrently; merge in list order
+    results = fetch_entity_results(transaction_types, filters)
     
-    for entity_type, display_name in transaction_types:
+    for entity_type, result in zip(transaction_types, results):
+        display_name = entity_display_name(entity_type)
         try:
-            result = make_quickbooks_api_call(f"SELECT * FROM {entity_type}")
-            
             if isinstance(result, tuple):
                 print(f"Error fetching {display_name}: {result[0]}")
                 continue
@@ -818,7 +1064,9 @@ def get_transactions_pandas():
             'transactions': [],
             'total_count': 0,
             'summary': {},
-            'pandas_info': 'No data available'
+            'pandas_info': 'No data available',
+            'filters': filters.info(),
+            **partial_info()
         })
     
     # Convert date columns to datetime
@@ -852,11 +1100,14 @@ def get_transactions_pandas():
             'shape': df.shape,
             'columns': list(df.columns),
             'memory_usage': f"{df.memory_usage(deep=True).sum() / 1024:.2f} KB"
-        }
+        },
+        'filters': filters.info(),
+        **partial_info()
     })
 
 # Enhanced CSV Export with Pandas
 @app.route('/api/transactions/export/pandas')
+@qb_priority(PRIORITY_BULK)
 def export_transactions_pandas_csv():
     """Export all transactions as CSV using pandas"""
     if 'access_token' not in session or 'company_id' not in session:
@@ -901,11 +1152,6 @@ def export_transactions_pandas_csv():
         headers={'Content-Disposition': 'attachment; filename=quickbooks_transactions_pandas.csv'}
     )
 
-# Excel Export with Pandas
-@app.route('/api/transactions/export/excel')
-
-@app.route("/api/transactions/raw")
-
 @app.route("/raw-data")
 def raw_data_page():
     """Display raw transaction data page"""
@@ -915,49 +1161,32 @@ def raw_data_page():
     
     return render_template("raw_data.html")
 
+@app.route("/api/transactions/raw")
 def get_raw_transactions():
     """Get all raw transaction data in one giant table"""
     if "access_token" not in session or "company_id" not in session:
         return jsonify({"error": "Not connected to QuickBooks"}), 401
     
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     import pandas as pd
     from datetime import datetime
     
     all_transactions = []
     
-    # Define all transaction types to fetch
-    transaction_types = [
-        ("JournalEntry", "Journal Entry"),
-        ("Deposit", "Deposit"),
-        ("Purchase", "Bill"),
-        ("Transfer", "Transfer"),
-        ("Payment", "Payment"),
-        ("Invoice", "Invoice"),
-        ("Bill", "Bill"),
-        ("BillPayment", "Bill Payment"),
-        ("Expense", "Expense"),
-        ("RefundReceipt", "Refund Receipt"),
-        ("CreditMemo", "Credit Memo"),
-        ("SalesReceipt", "Sales Receipt"),
-        ("JournalEntry", "Journal Entry"),
-        ("Deposit", "Deposit"),
-        ("Purchase", "Purchase"),
-        ("Transfer", "Transfer"),
-        ("Payment", "Payment"),
-        ("Invoice", "Invoice"),
-        ("Bill", "Bill"),
-        ("BillPayment", "Bill Payment"),
-        ("Expense", "Expense"),
-        ("RefundReceipt", "Refund Receipt"),
-        ("CreditMemo", "Credit Memo"),
-        ("SalesReceipt", "Sales Receipt")
-    ]
+    # Define all transaction types to fetch (registry "transactions" group)
+    transaction_types = entities_in("transactions")
     
-    for entity_type, display_name in transaction_types:
+    # Fetch every entity type concurrently, then merge in list order
+    print(f"Fetching {len(transaction_types)} transaction types...")
+    results = fetch_entity_results(transaction_types, filters)
+    
+    for entity_type, result in zip(transaction_types, results):
+        display_name = entity_display_name(entity_type)
         try:
-            print(f"Fetching {display_name} transactions...")
-            result = make_quickbooks_api_call(f"SELECT * FROM {entity_type}")
-            
             if isinstance(result, tuple):
                 print(f"Error fetching {display_name}: {result[0]}")
                 continue
@@ -1024,78 +1253,12 @@ def get_raw_transactions():
                             "DetailType": line.get("DetailType", "")
                         }
                         
-                        # Add account info for line items
-                        if "AccountBasedExpenseLineDetail" in line:
-                            account_detail = line["AccountBasedExpenseLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                            # Add Class info from expense line detail
-                            if "ClassRef" in account_detail:
-                                line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
-                                line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
-                            else:
-                                line_detail["Class_ID"] = ""
-                                line_detail["Class_Name"] = ""
-                        if "JournalEntryLineDetail" in line:
-                            account_detail = line["JournalEntryLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                            # Add Class info from journal entry line detail
-                            if "ClassRef" in account_detail:
-                                line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
-                                line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
-                            else:
-                                line_detail["Class_ID"] = ""
-                                line_detail["Class_Name"] = ""
-                        elif "DepositLineDetail" in line:
-                            account_detail = line["DepositLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                            # Add Class info from deposit line detail
-                            if "ClassRef" in account_detail:
-                                line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
-                                line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
-                            else:
-                                line_detail["Class_ID"] = ""
-                                line_detail["Class_Name"] = ""
-                        elif "SalesItemLineDetail" in line:
-                            account_detail = line["SalesItemLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                            # Add Class info from sales item line detail
-                            if "ClassRef" in account_detail:
-                                line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
-                                line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
-                            else:
-                                line_detail["Class_ID"] = ""
-                                line_detail["Class_Name"] = ""
-                        elif "ItemBasedExpenseLineDetail" in line:
-                            account_detail = line["ItemBasedExpenseLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                            # Add Class info from item based expense line detail
-                            if "ClassRef" in account_detail:
-                                line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
-                                line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
-                            else:
-                                line_detail["Class_ID"] = ""
-                                line_detail["Class_Name"] = ""
-                        else:
-                            line_detail["Account_ID"] = ""
-                            line_detail["Account_Name"] = ""
-                            line_detail["Class_ID"] = ""
-                            line_detail["Class_Name"] = ""
-                        if "JournalEntryLineDetail" in line:
-                            account_detail = line["JournalEntryLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                        elif "DepositLineDetail" in line:
-                            account_detail = line["DepositLineDetail"]
-                            line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
-                            line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
-                        else:
-                            line_detail["Account_ID"] = ""
-                            line_detail["Account_Name"] = ""
+                        # Add account and class info from the line's detail payload
+                        account_detail = entity_line_detail(line)
+                        line_detail["Account_ID"] = account_detail.get("AccountRef", {}).get("value", "")
+                        line_detail["Account_Name"] = account_detail.get("AccountRef", {}).get("name", "")
+                        line_detail["Class_ID"] = account_detail.get("ClassRef", {}).get("value", "")
+                        line_detail["Class_Name"] = account_detail.get("ClassRef", {}).get("name", "")
                         
                         line_items.append(line_detail)
                     
@@ -1122,7 +1285,9 @@ def get_raw_transactions():
             "transactions": [],
             "total_count": 0,
             "summary": {},
-            "raw_format": True
+            "raw_format": True,
+            "filters": filters.info(),
+            **partial_info()
         })
     
     # Sort by date (most recent first)
@@ -1155,9 +1320,14 @@ def get_raw_transactions():
         "total_count": len(transactions_list),
         "summary": summary,
         "raw_format": True,
-        "columns": list(df.columns)
+        "columns": list(df.columns),
+        "filters": filters.info(),
+        **partial_info()
     })
 
+# Excel Export with Pandas
+@app.route('/api/transactions/export/excel')
+@qb_priority(PRIORITY_BULK)
 def export_transactions_excel():
     """Export all transactions as Excel file using pandas"""
     if 'access_token' not in session or 'company_id' not in session:
@@ -1217,15 +1387,375 @@ def export_transactions_excel():
         headers={'Content-Disposition': 'attachment; filename=quickbooks_transactions.xlsx'}
     )
 
-def show_tokens():
+# Full exports of every record, paginated per entity
+@app.route('/api/raw-data-all')
+@qb_priority(PRIORITY_BULK)
+def get_all_raw_data():
+    """Get ALL raw data from QuickBooks in one giant pandas DataFrame"""
+    if "access_token" not in session or "company_id" not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    import pandas as pd
+    from datetime import datetime
+    
+    all_data = []
+    
+    # All entity types in QuickBooks (registry "raw_all" group)
+    entity_types = qb_client.supported_entities(session['company_id'], session['access_token'], entities_in("raw_all"))
+    entity_types = [entity_type for entity_type in entity_types if filters.applies_to(entity_type)]
+    
+    report_progress(entities_total=len(entity_types))
+    
+    for entity_type in entity_types:
+        try:
+            report_progress(entity=entity_type)
+            print(f"\n=== Fetching ALL {entity_type} records ===")
+            records = make_paginated_api_call(entity_type, max_results=5000, filters=filters)
+            
+            if isinstance(records, tuple):  # Error case
+                print(f"Error fetching {entity_type}: {records[0]}")
+                report_progress(entity_done=entity_type)
+                continue
+                
+            for record in records:
+                # Add entity type to each record
+                record['_EntityType'] = entity_type
+                all_data.append(record)
+            report_progress(entity_done=entity_type, records=len(records))
+                
+        except InvalidFilter:
+            # Filters QuickBooks rejected fail the export with a 400, not an empty file
+            raise
+        except Exception as e:
+            print(f"Error processing {entity_type}: {str(e)}")
+            continue
+    
+    if not all_data:
+        return jsonify({"error": "No data found"}), 404
+    
+    # Convert to pandas DataFrame
+    df = pd.DataFrame(all_data)
+    
+    # Convert to JSON for API response
+    result = {
+        "total_records": len(df),
+        "columns": list(df.columns),
+        "data": df.to_dict('records'),
+        "summary": {
+            "by_entity_type": df['_EntityType'].value_counts().to_dict() if '_EntityType' in df.columns else {},
+            "total_columns": len(df.columns)
+        },
+        **partial_info()
+    }
+    
+    return jsonify(result)
+
+@app.route('/api/raw-data-csv')
+@qb_priority(PRIORITY_BULK)
+def download_all_raw_data_csv():
+    """Download ALL raw data as CSV file"""
+    if "access_token" not in session or "company_id" not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    import pandas as pd
+    import io
+    from datetime import datetime
+    from flask import Response
+    
+    all_data = []
+    
+    # All entity types in QuickBooks (registry "raw_all" group)
+    entity_types = qb_client.supported_entities(session['company_id'], session['access_token'], entities_in("raw_all"))
+    entity_types = [entity_type for entity_type in entity_types if filters.applies_to(entity_type)]
+    
+    report_progress(entities_total=len(entity_types))
+    
+    for entity_type in entity_types:
+        try:
+            report_progress(entity=entity_type)
+            print(f"\n=== Fetching ALL {entity_type} records ===")
+            records = make_paginated_api_call(entity_type, max_results=5000, filters=filters)
+            
+            if isinstance(records, tuple):  # Error case
+                print(f"Error fetching {entity_type}: {records[0]}")
+                report_progress(entity_done=entity_type)
+                continue
+                
+            for record in records:
+                # Add entity type to each record
+                record['_EntityType'] = entity_type
+                all_data.append(record)
+            report_progress(entity_done=entity_type, records=len(records))
+                
+        except InvalidFilter:
+            # Filters QuickBooks rejected fail the export with a 400, not an empty file
+            raise
+        except Exception as e:
+            print(f"Error processing {entity_type}: {str(e)}")
+            continue
+    
+    if not all_data:
+        return jsonify({"error": "No data found"}), 404
+    
+    # Convert to pandas DataFrame
+    df = pd.DataFrame(all_data)
+    
+    # Create CSV
+    output = io.StringIO()
+    df.to_csv(output, index=False)
+    csv_content = output.getvalue()
+    output.close()
+    
+    return Response(
+        csv_content,
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename=quickbooks_all_raw_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        }
+    )
+
+@app.route('/api/export/all-transactions-csv')
+@qb_priority(PRIORITY_BULK)
+def export_all_transactions_csv():
+    """Export ALL transaction data as CSV with proper pagination"""
+    if "access_token" not in session or "company_id" not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    import pandas as pd
+    import io
+    from datetime import datetime
+    from flask import Response
+    
+    all_data = []
+    
+    # All transaction types in QuickBooks (registry "export" group)
+    transaction_types = qb_client.supported_entities(session['company_id'], session['access_token'], entities_in("export"))
+    transaction_types = [entity_type for entity_type in transaction_types if filters.applies_to(entity_type)]
+    
+    report_progress(entities_total=len(transaction_types))
+    
+    for entity_type in transaction_types:
+        try:
+            report_progress(entity=entity_type)
+            print(f"\n=== Fetching ALL {entity_type} records ===")
+            records = make_paginated_api_call(entity_type, filters=filters)
+            
+            if isinstance(records, tuple):  # Error case
+                print(f"Error fetching {entity_type}: {records[0]}")
+                report_progress(entity_done=entity_type)
+                continue
+                
+            for record in records:
+                # Flatten the record for CSV
+                flat_record = flatten_qb_record(record, entity_type)
+                all_data.append(flat_record)
+            report_progress(entity_done=entity_type, records=len(records))
+                
+        except InvalidFilter:
+            # Filters QuickBooks rejected fail the export with a 400, not an empty file
+            raise
+        except Exception as e:
+            print(f"Error processing {entity_type}: {str(e)}")
+            continue
+    
+    if not all_data:
+        return jsonify({"error": "No transaction data found"}), 404
+    
+    # Convert to DataFrame
+    df = pd.DataFrame(all_data)
+    
+    # Sort by date if available
+    if 'TxnDate' in df.columns:
+        df['TxnDate'] = pd.to_datetime(df['TxnDate'], errors='coerce')
+        df = df.sort_values('TxnDate', ascending=False)
+        df['TxnDate'] = df['TxnDate'].dt.strftime('%Y-%m-%d')
+    
+    # Create CSV
+    output = io.StringIO()
+    df.to_csv(output, index=False)
+    csv_content = output.getvalue()
+    output.close()
+    
+    return Response(
+        csv_content,
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename=quickbooks_all_transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        }
+    )
+
+def flatten_qb_record(record, entity_type):
+    """Flatten a QuickBooks record into a flat dictionary for CSV export"""
+    flat = {
+        'Entity_Type': entity_type,
+        'ID': record.get('Id', ''),
+        'SyncToken': record.get('SyncToken', ''),
+        'TxnDate': record.get('TxnDate', ''),
+        'DocNumber': record.get('DocNumber', ''),
+        'TotalAmt': record.get('TotalAmt', 0),
+        'Balance': record.get('Balance', 0),
+        'CurrencyRef': record.get('CurrencyRef', {}).get('value', ''),
+        'PrivateNote': record.get('PrivateNote', ''),
+        'Memo': record.get('Memo', ''),
+        'TxnStatus': record.get('TxnStatus', ''),
+        'TxnSource': record.get('TxnSource', ''),
+        'LineCount': record.get('LineCount', 0),
+        'CreateTime': record.get('MetaData', {}).get('CreateTime', ''),
+        'LastUpdatedTime': record.get('MetaData', {}).get('LastUpdatedTime', ''),
+    }
+    
+    # Add customer info
+    if 'CustomerRef' in record:
+        flat['Customer_ID'] = record['CustomerRef'].get('value', '')
+        flat['Customer_Name'] = record['CustomerRef'].get('name', '')
+    
+    # Add vendor info
+    if 'VendorRef' in record:
+        flat['Vendor_ID'] = record['VendorRef'].get('value', '')
+        flat['Vendor_Name'] = record['VendorRef'].get('name', '')
+    
+    # Add account info
+    if 'AccountRef' in record:
+        flat['Account_ID'] = record['AccountRef'].get('value', '')
+        flat['Account_Name'] = record['AccountRef'].get('name', '')
+    
+    # Add payment method
+    if 'PaymentMethodRef' in record:
+        flat['PaymentMethod_ID'] = record['PaymentMethodRef'].get('value', '')
+        flat['PaymentMethod_Name'] = record['PaymentMethodRef'].get('name', '')
+    
+    # Process line items
+    if 'Line' in record and record['Line']:
+        line_items = []
+        for i, line in enumerate(record['Line']):
+            line_prefix = f'Line_{i+1}_'
+            flat[f'{line_prefix}ID'] = line.get('Id', '')
+            flat[f'{line_prefix}LineNum'] = line.get('LineNum', '')
+            flat[f'{line_prefix}Description'] = line.get('Description', '')
+            flat[f'{line_prefix}Amount'] = line.get('Amount', 0)
+            flat[f'{line_prefix}DetailType'] = line.get('DetailType', '')
+            
+            # Detail types are listed in the entity registry (LINE_DETAIL_TYPES)
+            detail = entity_line_detail(line)
+            if 'AccountRef' in detail:
+                flat[f'{line_prefix}Account_ID'] = detail['AccountRef'].get('value', '')
+                flat[f'{line_prefix}Account_Name'] = detail['AccountRef'].get('name', '')
+            if 'ItemRef' in detail:
+                flat[f'{line_prefix}Item_ID'] = detail['ItemRef'].get('value', '')
+                flat[f'{line_prefix}Item_Name'] = detail['ItemRef'].get('name', '')
+            if 'ClassRef' in detail:
+                flat[f'{line_prefix}Class_ID'] = detail['ClassRef'].get('value', '')
+                flat[f'{line_prefix}Class_Name'] = detail['ClassRef'].get('name', '')
+    
+    # Add the full JSON as a string for reference
+    flat['Full_JSON'] = str(record)
+    
+    return flat
+
+@app.route('/api/export/summary-csv')
+@qb_priority(PRIORITY_BULK)
+def export_summary_csv():
+    """Export a summary of all transaction types and counts"""
+    if "access_token" not in session or "company_id" not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    try:
+        filters = QueryFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    import pandas as pd
+    import io
+    from datetime import datetime
+    from flask import Response
+    
+    transaction_types = [entity_type for entity_type in entities_in("summary") if filters.applies_to(entity_type)]
+    
+    summary_data = []
+    
+    # Get all counts in one batch round trip, counting only rows matching the filters
+    queries = []
+    for entity_type in transaction_types:
+        where = filters.where(entity_type)
+        queries.append(f"SELECT COUNT(*) FROM {entity_type}" + (f" WHERE {where}" if where else ""))
+    results = make_quickbooks_batch_call(queries)
+    
+    for entity_type, result in zip(transaction_types, results):
+        try:
+            if isinstance(result, tuple):
+                count = 0
+                error = result[0].get('error', 'Unknown error')
+            else:
+                count = result.get('QueryResponse', {}).get('totalCount', 0)
+                error = None
+            
+            summary_data.append({
+                'Entity_Type': entity_type,
+                'Total_Records': count,
+                'Status': 'Success' if error is None else 'Error',
+                'Error_Message': error or ''
+            })
+            
+        except Exception as e:
+            summary_data.append({
+                'Entity_Type': entity_type,
+                'Total_Records': 0,
+                'Status': 'Error',
+                'Error_Message': str(e)
+            })
+    
+    df = pd.DataFrame(summary_data)
+    
+    # Create CSV
+    output = io.StringIO()
+    df.to_csv(output, index=False)
+    csv_content = output.getvalue()
+    output.close()
+    
+    return Response(
+        csv_content,
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename=quickbooks_summary_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        }
+    )
+
+def current_tokens():
+    """Current access/refresh tokens for the connected realm, refreshed if about to expire"""
+    company_id = session.get('company_id')
+    tokens = token_manager.get(company_id) if company_id else None
+    if tokens is None:
+        return {'access_token': session.get('access_token'), 'refresh_token': None,
+                'expires_in': None, 'x_refresh_token_expires_in': None}
+
+    access_token = token_manager.access_token(company_id) or tokens['access_token']
+    tokens = token_manager.get(company_id)
+    now = time.time()
     return {
-        'access_token': session.get('access_token'),
-        'refresh_token': session.get('refresh_token'),
-        'company_id': session.get('company_id'),
-        'expires_in': session.get('expires_in'),
-        'x_refresh_token_expires_in': session.get('x_refresh_token_expires_in')
+        'access_token': access_token,
+        'refresh_token': tokens['refresh_token'],
+        'expires_in': max(int(tokens['expires_at'] - now), 0),
+        'x_refresh_token_expires_in': int(tokens['refresh_expires_at'] - now) if tokens.get('refresh_expires_at') else None
     }
 
+def show_tokens():
+    return {'company_id': session.get('company_id'), **current_tokens()}
+
 @app.route("/config")
 def show_config():
     """Show current OAuth configuration for debugging"""
@@ -1363,17 +1893,244 @@ def debug_session():
         'company_id': session.get('company_id', 'None')
     }
 
+@app.route("/api/mirror/status")
+def mirror_status():
+    """Show what the local SQLite mirror holds for this realm"""
+    if 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    return jsonify({
+        **sync_engine.store.status(session['company_id']),
+        'schedule': sync_scheduler.realm_info(session['company_id'])
+    })
+
+@app.route("/api/sync/progress")
+def sync_progress():
+    """Per-entity state (pending / loading / loaded / error) of this realm's current sync"""
+    if 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    progress = sync_engine.progress(session['company_id'])
+    warm = entities_in("warm")
+    states = progress['entities']
+    return jsonify({
+        **progress,
+        'warm': {entity: states.get(entity, 'loaded' if sync_engine.store.is_loaded(session['company_id'], entity) else 'pending')
+                 for entity in warm},
+        'ready': all(states.get(entity) in (None, 'loaded', 'error') for entity in warm) or not progress['running']
+    })
+
+@app.route("/api/admin/scheduler")
+@realm_admin
+def sync_scheduler_status():
+    """Show the background sync policy, last sync and next sync per realm"""
+    info = sync_scheduler.info()
+    if g.admin_realm is not None:
+        info['realms'] = {company_id: realm for company_id, realm in info['realms'].items()
+                          if company_id == g.admin_realm}
+    return jsonify(info)
+
+@app.route("/api/admin/http-pool")
+@realm_admin
+def http_pool_stats():
+    """Show per-host connection pool stats for the shared QuickBooks client"""
+    return jsonify({
+        "pool_maxsize": qb_client.pool_size,
+        "timeout": qb_client.timeout,
+        "hosts": qb_client.pool_stats()
+    })
+
+@app.route("/api/admin/rate-limit")
+@realm_admin
+def rate_limit_stats():
+    """Show per-realm QuickBooks rate limiter queue depth, waits and 429s"""
+    info = qb_client.scheduler.info()
+    if g.admin_realm is not None:
+        info['realms'] = {company_id: limiter for company_id, limiter in info['realms'].items()
+                          if company_id == g.admin_realm}
+    return jsonify(info)
+
+@app.route("/api/admin/fetch-stats")
+@realm_admin
+def fetch_stats():
+    """Show QuickBooks read retry / hedging counters and query latency percentiles"""
+    return jsonify(qb_client.read_stats())
+
+# Exports that can run as background jobs: job kind -> view endpoint
+EXPORT_JOBS = {
+    'transactions-excel': 'export_transactions_excel',
+    'raw-data-csv': 'download_all_raw_data_csv',
+    'all-transactions-csv': 'export_all_transactions_csv'
+}
+
+def owned_job(job_id):
+    """Job status if it belongs to the connected realm, else None"""
+    job = job_manager.get(job_id)
+    if job is None or job['company_id'] != str(session.get('company_id')):
+        return None
+    return job
+
+@app.route("/api/jobs/exports/<kind>", methods=["POST"])
+def submit_export_job(kind):
+    """Start an export in the background and return its job id immediately"""
+    if 'access_token' not in session or 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+
+    view = app.view_functions.get(EXPORT_JOBS.get(kind))
+    if view is None:
+        return jsonify({"error": f"Unknown export: {kind}", "exports": list(EXPORT_JOBS)}), 404
+
+    @copy_current_request_context
+    def run(job):
+        response = app.make_response(view())
+        if response.status_code != 200:
+            error = response.get_json(silent=True) or {}
+            raise JobFailed(error.get('error') or f"Export returned {response.status_code}")
+        # after_request (X-Partial-Response) does not run here; keep the gaps on the job
+        job.missing_entities = list(g.get('partial_entities', []))
+
+        _, options = parse_options_header(response.headers.get('Content-Disposition', ''))
+        return response.get_data(), options.get('filename', f"{kind}.bin"), response.mimetype
+
+    job_id = job_manager.submit(kind, session['company_id'], run)
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for('export_job_status', job_id=job_id),
+        "download_url": url_for('download_export_job', job_id=job_id)
+    }), 202
+
+@app.route("/api/jobs")
+def list_export_jobs():
+    """Recent export jobs for the connected realm"""
+    if 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    return jsonify({"jobs": job_manager.list(session['company_id'])})
+
+@app.route("/api/jobs/<job_id>")
+def export_job_status(job_id):
+    """State and progress (entities and pages done) of an export job"""
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_export_job(job_id):
+    """Ask a queued or running export job to stop"""
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job_manager.cancel(job_id):
+        return jsonify({"error": f"Job already {job['state']}"}), 409
+    return jsonify(job_manager.get(job_id)), 202
+
+@app.route("/api/jobs/<job_id>/download")
+def download_export_job(job_id):
+    """Download the file produced by a finished export job"""
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    artifact = job_manager.artifact(job_id)
+    if artifact is None:
+        return jsonify({"error": f"Job is {job['state']}, no file to download"}), 409
+
+    path, filename, mimetype = artifact
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True, download_name=filename)
+
+@app.route("/api/admin/sessions")
+@realm_admin
+def session_store_status():
+    """Show the server-side session backend and its cache counters
+
+    Without the admin token only the backend name and aggregate counts are returned.
+    """
+    backend = getattr(app.session_interface, 'backend', None)
+    info = backend.info() if backend is not None else {'backend': 'cookie'}
+    if g.admin_realm is not None:
+        info = {name: value for name, value in info.items() if name == 'backend' or isinstance(value, int)}
+    return jsonify(info)
+
+@app.route("/api/admin/tokens")
+@realm_admin
+def token_status():
+    """Show token expiry and refresh counters per realm (no token values)"""
+    info = token_manager.info()
+    if g.admin_realm is not None:
+        info['realms'] = {company_id: realm for company_id, realm in info['realms'].items()
+                          if company_id == g.admin_realm}
+    return jsonify(info)
+
+@app.route("/api/admin/breakers")
+@realm_admin
+def circuit_breaker_status():
+    """Show the per-realm QuickBooks circuit breaker states"""
+    info = qb_client.breakers.info()
+    if g.admin_realm is not None:
+        info['realms'] = {company_id: breaker for company_id, breaker in info['realms'].items()
+                          if company_id == g.admin_realm}
+    return jsonify(info)
+
+@app.route("/api/admin/cache")
+@realm_admin
+def query_cache_stats():
+    """Show query cache and single-flight counters for QuickBooks queries"""
+    stats = qb_client.cache.info() if qb_client.cache is not None else {"enabled": False}
+    stats["singleflight"] = qb_client.singleflight.info()
+    
+    return jsonify(stats)
+
+@app.route("/api/admin/capabilities")
+def entity_capabilities():
+    """Show which entities the connected realm can query (probing unknown ones)"""
+    if 'access_token' not in session or 'company_id' not in session:
+        return jsonify({"error": "Not connected to QuickBooks"}), 401
+    
+    company_id = session['company_id']
+    if request.args.get('refresh', 'false').lower() == 'true':
+        qb_client.capabilities.clear(company_id)
+    
+    qb_client.discover(company_id, session['access_token'], list(ENTITY_REGISTRY))
+    
+    return jsonify({
+        "company_id": company_id,
+        **qb_client.capabilities.realm_info(company_id),
+        "stats": qb_client.capabilities.info()
+    })
+
+@app.route("/api/admin/cache/invalidate", methods=['POST'])
+@realm_admin
+def invalidate_query_cache():
+    """Invalidate cached query results (optionally per realm and/or entity)"""
+    if qb_client.cache is None:
+        return jsonify({"enabled": False, "invalidated": 0})
+    
+    realm = request.args.get('realm')
+    if g.admin_realm is not None:
+        if realm and realm != g.admin_realm:
+            return jsonify({"error": "Not allowed for another company"}), 403
+        realm = g.admin_realm
+    entity = request.args.get('entity')
+    invalidated = qb_client.cache.invalidate(company_id=realm, entity_type=entity)
+    
+    return jsonify({
+        "invalidated": invalidated,
+        "realm": realm,
+        "entity": entity
+    })
+
 @app.route("/api/tokens")
 def get_tokens_json():
     """Get QuickBooks tokens as JSON for easy copying"""
     if 'access_token' not in session:
         return jsonify({"error": "Not authenticated. Please connect to QuickBooks first."}), 401
     
+    tokens = current_tokens()
     return jsonify({
-        "access_token": session.get('access_token'),
+        "access_token": tokens['access_token'],
         "company_id": session.get('company_id'),
-        "expires_in": session.get('expires_in'),
-        "refresh_token": session.get('refresh_token'),
+        "expires_in": tokens['expires_in'],
+        "refresh_token": tokens['refresh_token'],
         "status": "success",
         "message": "Copy these tokens to your Jupyter notebook"
     })
@@ -1384,7 +2141,7 @@ def display_tokens():
     if 'access_token' not in session:
         return redirect(url_for('auth'))
     
-    access_token = session.get('access_token')
+    access_token = current_tokens()['access_token']
     company_id = session.get('company_id')
     
     # Detect if we're on Railway
@@ -1815,10 +2572,15 @@ def startup():
     jupyter_thread = threading.Thread(target=start_jupyter_background, daemon=True)
     jupyter_thread.start()
 
+    # Keep each connected realm's local copy warm
+    if QB_SYNC_SCHEDULER_ENABLED:
+        sync_scheduler.start()
+
 import atexit
 
 def cleanup():
     """Cleanup when Flask shuts down"""
+    sync_scheduler.stop()
     stop_jupyter_server()
 
 atexit.register(cleanup)
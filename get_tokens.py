@@ -28,7 +28,7 @@ def get_tokens_from_flask_app(flask_url="http://localhost:5000"):
     
     try:
         # Try to get session info from Flask app
-        response = requests.get(f"{flask_url}/api/session-info")
+        response = requests.get(f"{flask_url}/api/session-info", timeout=10)
         
         if response.status_code == 200:
             session_data = response.json()
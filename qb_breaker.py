@@ -0,0 +1,169 @@
+"""
+QuickBooks Circuit Breaker
+
+Per-realm circuit breaker around QuickBooks reads, so that during a
+QuickBooks incident endpoints fail fast (or serve cached data) instead of
+every request waiting out full network timeouts for each of its queries.
+
+    closed    - calls flow; outcomes are recorded in a sliding window
+    open      - the failure rate (errors, 5xx and very slow calls) crossed
+                the threshold: calls are rejected without a network round
+                trip until the cool-down passes
+    half_open - a few trial calls are let through; if they all succeed the
+                breaker closes, any failure re-opens it
+
+Call latency is the HTTP round trip only; throttling (429) is counted
+separately and never opens the breaker.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+QB_BREAKER_ENABLED = os.getenv('QB_BREAKER_ENABLED', 'True').lower() == 'true'
+QB_BREAKER_WINDOW = int(os.getenv('QB_BREAKER_WINDOW', '20'))
+QB_BREAKER_MIN_CALLS = int(os.getenv('QB_BREAKER_MIN_CALLS', '10'))
+QB_BREAKER_FAILURE_RATE = float(os.getenv('QB_BREAKER_FAILURE_RATE', '0.5'))
+QB_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('QB_BREAKER_SLOW_CALL_SECONDS', '15'))
+QB_BREAKER_OPEN_SECONDS = float(os.getenv('QB_BREAKER_OPEN_SECONDS', '30'))
+QB_BREAKER_HALF_OPEN_CALLS = int(os.getenv('QB_BREAKER_HALF_OPEN_CALLS', '3'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one realm"""
+
+    def __init__(self, window=QB_BREAKER_WINDOW, min_calls=QB_BREAKER_MIN_CALLS,
+                 failure_rate=QB_BREAKER_FAILURE_RATE, slow_call_seconds=QB_BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds=QB_BREAKER_OPEN_SECONDS, half_open_calls=QB_BREAKER_HALF_OPEN_CALLS):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)   # True = healthy call
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+        self.stats = {'rejected': 0, 'throttled': 0, 'opened': 0, 'last_opened': None, 'last_failure': None}
+
+    def allow(self):
+        """True if a call may go out now (False = fail fast)"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = HALF_OPEN
+                self._trials = 0
+                self._trial_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    self.stats['rejected'] += 1
+                    return False
+                self._trials += 1
+
+            return True
+
+    def record(self, healthy, latency=None, failure=None):
+        """Record a call's outcome; slow calls count as failures"""
+        if healthy and latency is not None and latency > self.slow_call_seconds:
+            healthy = False
+            failure = f"slow call ({latency:.1f}s)"
+
+        with self._lock:
+            if not healthy:
+                self.stats['last_failure'] = failure
+
+            if self.state == HALF_OPEN:
+                if not healthy:
+                    self._open()
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._outcomes.clear()
+                return
+
+            if self.state == OPEN:
+                return
+
+            self._outcomes.append(healthy)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def throttled(self, count=1):
+        """QuickBooks answered 429: counted, but neither a failure nor a healthy call"""
+        with self._lock:
+            self.stats['throttled'] += count
+
+    def abandon(self):
+        """A call was let through but never produced an outcome (e.g. deadline)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats['opened'] += 1
+        self.stats['last_opened'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def retry_after(self):
+        """Seconds until an open breaker lets trial calls through"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def info(self):
+        retry_after = self.retry_after()
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            return {
+                'state': self.state,
+                'window_calls': calls,
+                'window_failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'retry_after_seconds': round(retry_after, 1),
+                **self.stats
+            }
+
+
+class BreakerRegistry:
+    """One circuit breaker per realm"""
+
+    def __init__(self, enabled=QB_BREAKER_ENABLED):
+        self.enabled = enabled
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, company_id):
+        with self._lock:
+            breaker = self._breakers.get(company_id)
+            if breaker is None:
+                breaker = CircuitBreaker()
+                self._breakers[company_id] = breaker
+            return breaker
+
+    def info(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            'enabled': self.enabled,
+            'failure_rate_threshold': QB_BREAKER_FAILURE_RATE,
+            'slow_call_seconds': QB_BREAKER_SLOW_CALL_SECONDS,
+            'open_seconds': QB_BREAKER_OPEN_SECONDS,
+            'realms': {company_id: breaker.info() for company_id, breaker in breakers.items()}
+        }
@@ -0,0 +1,558 @@
+"""
+QuickBooks Query Result Cache
+
+Bounded in-process cache for QuickBooks query responses so opening several
+dashboard tabs or exports in quick succession does not re-run the same
+SELECT against QuickBooks.
+
+Entries are keyed by (company_id, normalized query, minorversion) and hold
+the raw JSON bytes of the response, so every hit parses a fresh copy that
+callers can modify safely. Entries expire after a TTL, the least recently
+used entries are evicted once the entry count or memory cap is reached, and
+entries can be invalidated per realm or per entity.
+
+SingleFlight sits in front of the HTTP call: concurrent identical queries
+(e.g. two tabs of the same realm) share one in-flight request. Waiters keep
+to their own request deadline, and take over when the leader gave up on its
+own deadline.
+
+DiskCache is an optional second tier under QueryCache: compressed,
+checksummed entries on disk, bounded by total size with LRU eviction, so
+cached results survive restarts and deploys (and are shared by worker
+processes). Its index is built lazily on first use from file metadata only.
+
+CapabilityCache remembers, per realm, which entities QuickBooks accepts in
+its query API, so entities it rejects (e.g. Expense) are skipped without a
+round trip until the answer expires.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from qb_deadline import CANCEL_POLL_INTERVAL, current_deadline
+from qb_store import QB_DATA_DIR
+
+QB_CACHE_ENABLED = os.getenv('QB_CACHE_ENABLED', 'True').lower() == 'true'
+QB_CACHE_TTL = float(os.getenv('QB_CACHE_TTL', '300'))
+QB_CACHE_MAX_ENTRIES = int(os.getenv('QB_CACHE_MAX_ENTRIES', '512'))
+QB_CACHE_MAX_BYTES = int(os.getenv('QB_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+QB_CAPABILITY_TTL = float(os.getenv('QB_CAPABILITY_TTL', str(24 * 3600)))
+QB_DISK_CACHE_ENABLED = os.getenv('QB_DISK_CACHE_ENABLED', 'True').lower() == 'true'
+QB_DISK_CACHE_DIR = os.getenv('QB_DISK_CACHE_DIR', os.path.join(QB_DATA_DIR, 'query_cache'))
+QB_DISK_CACHE_MAX_BYTES = int(os.getenv('QB_DISK_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+FROM_PATTERN = re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE)
+
+# Fault markers QuickBooks returns when an entity is not queryable
+UNSUPPORTED_ENTITY_MARKERS = ('QueryParserError', 'Invalid context declaration', '"code": "4000"')
+
+# Plain SELECT * / SELECT COUNT(*) (optionally paged): the only queries whose
+# parser faults can be blamed on the entity rather than on fields or filters
+PROBE_QUERY_PATTERN = re.compile(
+    r'^SELECT\s+(?:\*|COUNT\(\*\))\s+FROM\s+\w+(?:\s+STARTPOSITION\s+\d+)?(?:\s+MAXRESULTS\s+\d+)?$',
+    re.IGNORECASE
+)
+
+
+def normalize_query(query):
+    """Collapse whitespace and drop a trailing semicolon"""
+    return ' '.join(query.split()).rstrip(';').strip()
+
+
+def query_key(company_id, query, minorversion):
+    """Identity of a QuickBooks query: (company_id, normalized query, minorversion)"""
+    return (str(company_id), normalize_query(query), str(minorversion))
+
+
+def query_entity(query):
+    """Entity a query reads from (SELECT ... FROM <Entity>)"""
+    match = FROM_PATTERN.search(query)
+    return match.group(1) if match else None
+
+
+class QueryCache:
+    """TTL + LRU cache of QuickBooks query responses with a memory cap"""
+
+    def __init__(self, ttl=QB_CACHE_TTL, max_entries=QB_CACHE_MAX_ENTRIES, max_bytes=QB_CACHE_MAX_BYTES, l2=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.l2 = l2
+
+        self._entries = OrderedDict()   # key -> (payload bytes, expires_at, entity)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'l2_hits': 0
+        }
+
+    def make_key(self, company_id, query, minorversion):
+        return query_key(company_id, query, minorversion)
+
+    def get(self, key, allow_stale=False):
+        """Cached payload bytes, or None on a miss
+
+        Expired entries stay in the cache until evicted or refreshed, so
+        allow_stale=True can still serve them (e.g. while QuickBooks is down).
+        Memory misses fall through to the disk tier, whose hits are promoted.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                payload, expires_at, _ = entry
+                if expires_at > time.monotonic() or allow_stale:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return payload
+                self.stats['expirations'] += 1
+
+        if self.l2 is not None:
+            found = self.l2.get(key, allow_stale=allow_stale)
+            if found is not None:
+                payload, expires_at = found
+                remaining = expires_at - time.time()
+                if remaining > 0:
+                    self._store(key, payload, remaining)
+                with self._lock:
+                    self.stats['hits'] += 1
+                    self.stats['l2_hits'] += 1
+                return payload
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, key, payload, ttl=None, persist=True):
+        """Cache a payload; persist=False keeps it out of the disk tier"""
+        ttl = self.ttl if ttl is None else ttl
+        self._store(key, payload, ttl)
+        if self.l2 is not None and persist:
+            self.l2.set(key, payload, time.time() + ttl)
+
+    def _store(self, key, payload, ttl):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            expires_at = time.monotonic() + ttl
+            self._entries[key] = (payload, expires_at, query_entity(key[1]))
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, company_id=None, entity_type=None):
+        """Drop entries for a realm, an entity (in every realm) or both; returns count"""
+        with self._lock:
+            doomed = [
+                key for key, (_, _, entity) in self._entries.items()
+                if (company_id is None or key[0] == str(company_id))
+                and (entity_type is None or (entity or '').lower() == entity_type.lower())
+            ]
+            for key in doomed:
+                self._remove(key)
+
+            self.stats['invalidations'] += len(doomed)
+
+        if self.l2 is not None:
+            self.l2.invalidate(company_id, entity_type)
+        return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.l2 is not None:
+            self.l2.clear()
+
+    def _remove(self, key):
+        payload, _, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hit_ratio': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+                **self.stats,
+                'l2': self.l2.info() if self.l2 is not None else {'enabled': False}
+            }
+
+
+class DiskCache:
+    """Compressed, checksummed query results on disk with a size-bounded LRU
+
+    One file per entry under <directory>/<realm>/, named after the entity
+    and a hash of the cache key. Each file is a JSON header line (key,
+    expiry as wall-clock time, CRC32 and size of the payload) followed by
+    the zlib-compressed payload. Entries that fail their checksum are
+    dropped. LRU order is kept through file modification times, so it
+    survives restarts.
+    """
+
+    SUFFIX = '.qbc'
+
+    def __init__(self, directory=QB_DISK_CACHE_DIR, max_bytes=QB_DISK_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self._index = None   # path -> size on disk, in LRU order (built lazily)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'corrupt': 0, 'loaded_at_boot': 0}
+
+    def _realm_dir(self, company_id):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_-]', '_', str(company_id)))
+
+    def _path(self, key):
+        entity = (query_entity(key[1]) or 'query').lower()
+        digest = hashlib.sha256(json.dumps(list(key)).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self._realm_dir(key[0]), f"{entity}-{digest}{self.SUFFIX}")
+
+    def _ensure_index(self):
+        """Build the LRU index from file metadata the first time the cache is used"""
+        if self._index is not None:
+            return
+
+        found = []
+        if os.path.isdir(self.directory):
+            for realm in os.scandir(self.directory):
+                if not realm.is_dir():
+                    continue
+                for entry in os.scandir(realm.path):
+                    if entry.name.endswith(self.SUFFIX):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.path, stat.st_size))
+
+        self._index = OrderedDict((path, size) for _, path, size in sorted(found))
+        self._bytes = sum(self._index.values())
+        self.stats['loaded_at_boot'] = len(self._index)
+        if found:
+            print(f"💾 Disk query cache: {len(found)} entries ({self._bytes / 1024 / 1024:.1f} MB) from {self.directory}")
+
+    def get(self, key, allow_stale=False):
+        """(payload bytes, expires_at wall-clock time), or None on a miss"""
+        path = self._path(key)
+        with self._lock:
+            self._ensure_index()
+
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                payload = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return self._miss(path)
+        except (OSError, ValueError, zlib.error):
+            return self._corrupt(path)
+
+        if header.get('key') != list(key):
+            return self._miss(path)
+        if zlib.crc32(payload) != header.get('crc32') or len(payload) != header.get('size'):
+            return self._corrupt(path)
+        if header['expires_at'] <= time.time() and not allow_stale:
+            return self._miss(path)
+
+        with self._lock:
+            if path not in self._index:
+                # Written by another worker process
+                self._index[path] = os.path.getsize(path)
+                self._bytes += self._index[path]
+            self._index.move_to_end(path)
+            self.stats['hits'] += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return payload, header['expires_at']
+
+    def _miss(self, path):
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def _corrupt(self, path):
+        print(f"⚠️ Dropping corrupt disk cache entry {os.path.basename(path)}")
+        with self._lock:
+            self.stats['corrupt'] += 1
+            self.stats['misses'] += 1
+            self._discard(path)
+        return None
+
+    def set(self, key, payload, expires_at):
+        compressed = zlib.compress(payload, 6)
+        header = json.dumps({'key': list(key), 'expires_at': expires_at,
+                             'crc32': zlib.crc32(payload), 'size': len(payload)}).encode('utf-8')
+        size = len(header) + 1 + len(compressed)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._ensure_index()
+
+        path = self._path(key)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(partial, 'wb') as f:
+                f.write(header + b'\n' + compressed)
+            os.replace(partial, path)
+        except OSError as e:
+            print(f"⚠️ Disk cache write failed: {str(e)}")
+            return
+
+        with self._lock:
+            self._bytes -= self._index.pop(path, 0)
+            self._index[path] = size
+            self._bytes += size
+            self.stats['writes'] += 1
+
+            while self._bytes > self.max_bytes and self._index:
+                self._discard(next(iter(self._index)))
+                self.stats['evictions'] += 1
+
+    def _discard(self, path):
+        self._bytes -= self._index.pop(path, 0) if self._index is not None else 0
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def invalidate(self, company_id=None, entity_type=None):
+        """Delete entries for a realm, an entity (in every realm) or both; returns count
+
+        Scans the directories on disk rather than the index, so entries other
+        worker processes wrote are deleted too.
+        """
+        prefix = f"{entity_type.lower()}-" if entity_type else ''
+        if company_id is not None:
+            realm_dirs = [self._realm_dir(company_id)]
+        elif os.path.isdir(self.directory):
+            realm_dirs = [realm.path for realm in os.scandir(self.directory) if realm.is_dir()]
+        else:
+            realm_dirs = []
+
+        removed = 0
+        with self._lock:
+            self._ensure_index()
+            for realm_dir in realm_dirs:
+                try:
+                    entries = list(os.scandir(realm_dir))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if entry.name.endswith(self.SUFFIX) and entry.name.startswith(prefix):
+                        self._discard(entry.path)
+                        removed += 1
+        return removed
+
+    def clear(self):
+        return self.invalidate()
+
+    def info(self):
+        with self._lock:
+            self._ensure_index()
+            return {
+                'enabled': True,
+                'directory': self.directory,
+                'entries': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                **self.stats
+            }
+
+
+class _Call:
+    """One in-flight execution that waiters can block on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into a single in-flight execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is running wait for it and receive the same result (or exception).
+
+    Waiters wait only as long as their own request deadline allows
+    (check_deadline raises once it is spent or cancelled). If the leader
+    failed with one of local_errors - its own deadline or cancellation, not
+    a QuickBooks answer - a waiter runs the function itself instead.
+    """
+
+    def __init__(self, check_deadline=None, local_errors=()):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._check_deadline = check_deadline
+        self._local_errors = tuple(local_errors)
+        self.stats = {'executions': 0, 'coalesced': 0, 'taken_over': 0}
+
+    def do(self, key, fn):
+        """Run fn once per concurrent key; returns (result, shared)"""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.stats['executions'] += 1
+                else:
+                    self.stats['coalesced'] += 1
+
+            if leader:
+                break
+
+            self._wait(call)
+            if call.error is None:
+                return call.result, True
+            if not isinstance(call.error, self._local_errors):
+                raise call.error
+            # The leader gave up for its own reasons; this caller's budget may allow the call
+            with self._lock:
+                self.stats['taken_over'] += 1
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result, False
+
+    def _wait(self, call):
+        """Block until the call finishes or the caller's deadline is done"""
+        deadline = current_deadline()
+        if deadline is None:
+            call.event.wait()
+            return
+
+        # Short slices so a cancelled request (client gone) stops waiting too
+        while not call.event.wait(min(deadline.remaining(), CANCEL_POLL_INTERVAL)):
+            if self._check_deadline is not None:
+                self._check_deadline(deadline)
+            elif deadline.done:
+                raise TimeoutError("Deadline passed waiting for an in-flight call")
+
+    def info(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), **self.stats}
+
+
+def is_probe_query(query):
+    """True for a bare SELECT * / SELECT COUNT(*) of an entity, without fields or WHERE"""
+    return bool(PROBE_QUERY_PATTERN.match(normalize_query(query)))
+
+
+def is_query_parser_fault(status_code, detail):
+    """True when QuickBooks could not parse or resolve a query"""
+    return status_code == 400 and any(marker in (detail or '') for marker in UNSUPPORTED_ENTITY_MARKERS)
+
+
+def is_unsupported_entity_fault(status_code, detail, query):
+    """True when a failed query means the entity itself is not queryable
+
+    Only probe queries count: a parser fault from a query with a field list
+    or WHERE clause may just as well be about those, and must not hide the
+    entity from later requests.
+    """
+    return is_probe_query(query) and is_query_parser_fault(status_code, detail)
+
+
+class CapabilityCache:
+    """Per-realm record of which entities are queryable, expiring after a TTL
+
+    Both answers are cached: unsupported entities are skipped without a
+    network call, supported ones are not probed again until they expire.
+    """
+
+    def __init__(self, ttl=QB_CAPABILITY_TTL):
+        self.ttl = ttl
+        self._entries = {}   # (realm, entity) -> (supported, expires_at, reason)
+        self._lock = threading.Lock()
+        self.stats = {'probes': 0, 'skipped': 0}
+
+    def get(self, company_id, entity_type):
+        """True / False when known, None when unknown or expired"""
+        key = (str(company_id), entity_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[0]
+
+    def unknown(self, company_id, entities):
+        """Entities without a cached answer (a non-empty result counts as a probe)"""
+        missing = [entity for entity in entities if self.get(company_id, entity) is None]
+        if missing:
+            with self._lock:
+                self.stats['probes'] += 1
+        return missing
+
+    def is_unsupported(self, company_id, entity_type):
+        """True when the entity is known to be unqueryable (counts as a skip)"""
+        if self.get(company_id, entity_type) is not False:
+            return False
+        with self._lock:
+            self.stats['skipped'] += 1
+        return True
+
+    def set(self, company_id, entity_type, supported, reason=''):
+        with self._lock:
+            self._entries[(str(company_id), entity_type)] = (supported, time.monotonic() + self.ttl, reason)
+
+    def clear(self, company_id=None):
+        with self._lock:
+            for key in [key for key in self._entries if company_id is None or key[0] == str(company_id)]:
+                del self._entries[key]
+
+    def realm_info(self, company_id):
+        now = time.monotonic()
+        with self._lock:
+            entries = {key[1]: entry for key, entry in self._entries.items()
+                       if key[0] == str(company_id) and entry[1] > now}
+        return {
+            'supported': sorted(entity for entity, entry in entries.items() if entry[0]),
+            'unsupported': {entity: entry[2] for entity, entry in sorted(entries.items()) if not entry[0]}
+        }
+
+    def info(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'realms': len({key[0] for key in self._entries}),
+                **self.stats
+            }
@@ -0,0 +1,839 @@
+"""
+QuickBooks HTTP Client
+
+Shared, connection-pooled HTTP client used for every call DataRift makes to
+QuickBooks Online and the Intuit OAuth endpoints (Flask app, OAuth helpers
+and the Jupyter notebook).
+
+A single requests.Session is kept per process so TCP/TLS connections to
+quickbooks.api.intuit.com are reused across pages, entities and requests
+instead of paying a fresh handshake for every call.
+
+Usage:
+    from qb_client import get_client
+
+    client = get_client()
+    data = client.query(company_id, access_token, "SELECT * FROM Invoice")
+    print(client.pool_stats())
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextvars import copy_context
+from urllib.parse import quote_plus
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from qb_cache import (QB_CACHE_ENABLED, QB_DISK_CACHE_ENABLED, CapabilityCache, DiskCache, QueryCache, SingleFlight,
+                      is_unsupported_entity_fault, query_entity, query_key)
+from qb_breaker import BreakerRegistry
+from qb_deadline import current_deadline
+from qb_jobs import report_progress
+from qb_ratelimit import RateScheduler, SlotTimeout, backoff_delay
+
+QB_SANDBOX = os.getenv('QB_SANDBOX', 'False').lower() == 'true'
+
+if QB_SANDBOX:
+    QB_API_BASE_URL = "https://sandbox-quickbooks.api.intuit.com/v3/company"
+else:
+    QB_API_BASE_URL = "https://quickbooks.api.intuit.com/v3/company"
+
+QB_MINOR_VERSION = os.getenv('QB_MINOR_VERSION', '69')
+
+# Connection pool configuration
+QB_HTTP_POOL_SIZE = int(os.getenv('QB_HTTP_POOL_SIZE', '20'))
+QB_HTTP_CONNECT_TIMEOUT = float(os.getenv('QB_HTTP_CONNECT_TIMEOUT', '5'))
+QB_HTTP_READ_TIMEOUT = float(os.getenv('QB_HTTP_READ_TIMEOUT', '60'))
+
+# QuickBooks allows at most 10 concurrent requests per realm
+QB_MAX_CONCURRENT_REQUESTS = 10
+
+# Company (realm) id inside an API URL, used to apply per-realm rate limits
+REALM_URL_PATTERN = re.compile(r'/v3/company/([^/?]+)')
+QB_FANOUT_WORKERS = min(int(os.getenv('QB_FANOUT_WORKERS', '10')), QB_MAX_CONCURRENT_REQUESTS)
+
+# The /batch endpoint accepts at most 30 operations per call
+QB_BATCH_MAX_ITEMS = 30
+
+# Pagination (QuickBooks accepts MAXRESULTS up to 1000)
+QB_PAGE_SIZE = min(int(os.getenv('QB_PAGE_SIZE', '100')), 1000)
+
+# Retries for idempotent reads (queries, batch queries, CDC)
+QB_MAX_RETRIES = int(os.getenv('QB_MAX_RETRIES', '3'))
+QB_RETRY_BACKOFF_BASE = float(os.getenv('QB_RETRY_BACKOFF_BASE', '0.5'))
+QB_RETRY_STATUSES = {500, 502, 503, 504}
+
+# Hedged queries: send a duplicate once the first is slower than the observed p95
+QB_HEDGE_ENABLED = os.getenv('QB_HEDGE_ENABLED', 'False').lower() == 'true'
+QB_HEDGE_PERCENTILE = float(os.getenv('QB_HEDGE_PERCENTILE', '95'))
+QB_HEDGE_MIN_SAMPLES = 20
+
+
+class QuickBooksAPIError(Exception):
+    """Raised when a QuickBooks API call fails"""
+
+    def __init__(self, message, status_code=500, detail=""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CircuitOpen(QuickBooksAPIError):
+    """QuickBooks is failing for this realm; calls are rejected until the breaker recovers"""
+
+    def __init__(self, company_id, retry_after):
+        super().__init__(f"QuickBooks circuit open for company {company_id}, retry in {retry_after:.0f}s",
+                         status_code=503, detail="circuit open")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(QuickBooksAPIError):
+    """The request's deadline budget ran out before this call could complete"""
+
+    def __init__(self, message="Request deadline exceeded"):
+        super().__init__(message, status_code=504, detail="deadline exceeded")
+
+
+class RequestCancelled(QuickBooksAPIError):
+    """The client went away; remaining QuickBooks calls are skipped"""
+
+    def __init__(self, message="Request cancelled by client"):
+        super().__init__(message, status_code=499, detail="client disconnected")
+
+
+class LatencyTracker:
+    """Sliding window of recent response times with percentile lookups"""
+
+    def __init__(self, size=500, min_samples=QB_HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """p-th percentile in seconds, or None until enough samples are in"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def info(self):
+        with self._lock:
+            count = len(self._samples)
+        return {
+            'samples': count,
+            **{f'p{p}_seconds': round(value, 3) if value is not None else None
+               for p, value in ((p, self.percentile(p)) for p in (50, 95, 99))}
+        }
+
+
+def map_in_context(pool, fn, items):
+    """pool.map() where each call runs in a copy of the caller's context
+
+    Keeps the request's priority class and deadline in worker threads.
+    Results are returned in item order.
+    """
+    futures = [pool.submit(copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def _where(where):
+    return f" WHERE {where}" if where else ""
+
+
+def _select(fields):
+    return ", ".join(fields) if fields else "*"
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request"""
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class QuickBooksClient:
+    """Pooled, keep-alive HTTP client for QuickBooks Online"""
+
+    def __init__(self, api_base_url=QB_API_BASE_URL, pool_size=QB_HTTP_POOL_SIZE,
+                 timeout=(QB_HTTP_CONNECT_TIMEOUT, QB_HTTP_READ_TIMEOUT), cache=None, scheduler=None):
+        self.api_base_url = api_base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache = cache
+        self.singleflight = SingleFlight(self._check_deadline, local_errors=(DeadlineExceeded, RequestCancelled))
+        self.capabilities = CapabilityCache()
+        self.scheduler = scheduler or RateScheduler(max_concurrent=QB_MAX_CONCURRENT_REQUESTS)
+
+        self.breakers = BreakerRegistry()
+        self.tokens = None  # optional qb_tokens.TokenManager, see _authorize
+        self.latency = LatencyTracker()
+        self.hedge_enabled = QB_HEDGE_ENABLED
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='qb-hedge')
+        self._stats_lock = threading.Lock()
+        self.fetch_stats = {
+            'retries': 0,
+            'retries_exhausted': 0,
+            'hedges': 0,
+            'hedge_wins': 0
+        }
+
+        self.adapter = TimeoutHTTPAdapter(
+            timeout=timeout,
+            pool_connections=4,  # API host, OAuth host, sandbox host, spare
+            pool_maxsize=pool_size,
+            pool_block=False
+        )
+
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the pooled session
+
+        Company API calls are admitted by the per-realm rate scheduler (rate
+        and adaptive concurrency limit) and retried after HTTP 429
+        (honouring Retry-After); OAuth calls go straight through. Inside a
+        deadline scope the wait and HTTP timeouts are capped to the time
+        left, and no call starts once the deadline is spent or cancelled.
+
+        With a token manager attached, the realm's current access token is
+        sent (refreshed ahead of expiry) and a 401 triggers one refresh and
+        a transparent retry.
+
+        The returned response carries qb_round_trip, the seconds its own HTTP
+        exchange took (without queueing or back-off), and qb_throttled, the
+        number of 429 answers received on the way.
+        """
+        match = REALM_URL_PATTERN.search(url)
+        if match is None:
+            sent = time.monotonic()
+            response = self.session.request(method, url, **kwargs)
+            response.qb_round_trip, response.qb_throttled = time.monotonic() - sent, 0
+            return response
+
+        company_id = match.group(1)
+        deadline = current_deadline()
+        self._authorize(company_id, kwargs)
+        reauthorized = False
+        attempt = 0
+        throttled = 0
+
+        while True:
+            timeout = self._check_deadline(deadline)
+            if timeout is not None:
+                kwargs['timeout'] = self._bounded_timeout(timeout)
+
+            try:
+                with self.scheduler.slot(company_id, timeout=timeout) as outcome:
+                    sent = time.monotonic()
+                    response = self.session.request(method, url, **kwargs)
+                    response.qb_round_trip = time.monotonic() - sent
+                    outcome['status'] = response.status_code
+            except SlotTimeout as e:
+                raise DeadlineExceeded(str(e)) from e
+
+            throttled += response.status_code == 429
+            response.qb_throttled = throttled
+
+            if response.status_code == 401 and not reauthorized and self._authorize(company_id, kwargs, refresh=True):
+                reauthorized = True
+                continue
+
+            if response.status_code != 429 or attempt == self.scheduler.max_retries:
+                return response
+
+            delay = self.scheduler.throttled(company_id, attempt, response.headers.get('Retry-After'))
+            if deadline is not None and delay >= deadline.remaining():
+                raise DeadlineExceeded(f"Throttled by QuickBooks; retry in {delay:.1f}s is past the deadline")
+            print(f"⏳ Throttled by QuickBooks for company {company_id}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def _authorize(self, company_id, kwargs, refresh=False):
+        """Put the token manager's access token for the realm on the request
+
+        Returns True if the Authorization header now carries a different
+        token than before (refresh=True forces a refresh of the rejected one).
+        """
+        if self.tokens is None:
+            return False
+
+        headers = dict(kwargs.get('headers') or {})
+        current = headers.get('Authorization', '')[len('Bearer '):]
+        if refresh:
+            token = self.tokens.refresh(company_id, stale_token=current)
+        else:
+            token = self.tokens.access_token(company_id)
+        if not token or token == current:
+            return False
+
+        headers['Authorization'] = f'Bearer {token}'
+        kwargs['headers'] = headers
+        return True
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.fetch_stats[name] += 1
+
+    def _read(self, method, url, hedge=False, **kwargs):
+        """Send an idempotent read, retrying network errors and 5xx responses
+
+        Retries use exponential backoff with jitter, up to QB_MAX_RETRIES,
+        and never sleep past the request deadline. The last failure is
+        returned/raised as-is so callers report it instead of truncating.
+        """
+        deadline = current_deadline()
+
+        for attempt in range(QB_MAX_RETRIES + 1):
+            try:
+                response = self._hedged(method, url, **kwargs) if hedge else self._timed(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                failure = f"{type(e).__name__}: {e}"
+                if attempt == QB_MAX_RETRIES:
+                    self._count('retries_exhausted')
+                    raise
+            else:
+                if response.status_code not in QB_RETRY_STATUSES:
+                    return response
+                failure = f"HTTP {response.status_code}"
+                if attempt == QB_MAX_RETRIES:
+                    self._count('retries_exhausted')
+                    return response
+
+            delay = backoff_delay(attempt, base=QB_RETRY_BACKOFF_BASE)
+            if deadline is not None and delay >= deadline.remaining():
+                raise DeadlineExceeded(f"{failure}; retry in {delay:.1f}s is past the deadline")
+
+            self._count('retries')
+            print(f"🔁 QuickBooks read failed ({failure}), retry {attempt + 1}/{QB_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _timed(self, method, url, **kwargs):
+        """One attempt through the realm's circuit breaker, recording its latency"""
+        match = REALM_URL_PATTERN.search(url)
+        breaker = self.breakers.get(match.group(1)) if match and self.breakers.enabled else None
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpen(match.group(1), breaker.retry_after())
+
+        try:
+            response = self.request(method, url, **kwargs)
+        except requests.exceptions.Timeout as e:
+            deadline = current_deadline()
+            if deadline is None or not deadline.expired:
+                if breaker is not None:
+                    breaker.record(False, failure=f"{type(e).__name__}: {e}")
+                raise
+            # The read timeout was capped to the request's own deadline
+            if breaker is not None:
+                breaker.abandon()
+            raise DeadlineExceeded(f"Request deadline exceeded waiting for QuickBooks ({e})") from e
+        except requests.exceptions.RequestException as e:
+            if breaker is not None:
+                breaker.record(False, failure=f"{type(e).__name__}: {e}")
+            raise
+        except QuickBooksAPIError:
+            # Deadline / cancellation: says nothing about QuickBooks' health
+            if breaker is not None:
+                breaker.abandon()
+            raise
+
+        # Only the final HTTP exchange is timed: rate-limit queueing and 429
+        # back-off are local waits, not QuickBooks latency
+        round_trip = response.qb_round_trip
+        if breaker is not None:
+            if response.qb_throttled:
+                breaker.throttled(response.qb_throttled)
+            if response.status_code == 429:
+                breaker.abandon()
+            else:
+                breaker.record(response.status_code < 500, latency=round_trip, failure=f"HTTP {response.status_code}")
+        if response.status_code == 200:
+            self.latency.observe(round_trip)
+        return response
+
+    def _hedged(self, method, url, **kwargs):
+        """Send the request; if it is slower than the observed p95, race a duplicate
+
+        The hedge timer starts when the primary actually begins, so time spent
+        queued for a hedge pool worker never triggers a duplicate request.
+        Once both are in flight the first success wins; a leg that fails
+        (network error, open circuit, spent deadline) only fails the call if
+        the other leg fails too.
+        """
+        hedge_after = self.latency.percentile(QB_HEDGE_PERCENTILE) if self.hedge_enabled else None
+        if hedge_after is None:
+            return self._timed(method, url, **kwargs)
+
+        started = threading.Event()
+
+        def run_primary():
+            started.set()
+            return self._timed(method, url, **kwargs)
+
+        primary = self._hedge_pool.submit(copy_context().run, run_primary)
+        started.wait()
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        self._count('hedges')
+        backup = self._hedge_pool.submit(copy_context().run, self._timed, method, url, **kwargs)
+
+        error = None
+        for future in as_completed([primary, backup]):
+            try:
+                response = future.result()
+            except (requests.exceptions.RequestException, QuickBooksAPIError) as e:
+                error = error or e
+                continue
+            if future is backup:
+                self._count('hedge_wins')
+            return response
+        raise error
+
+    def read_stats(self):
+        """Retry / hedging counters and observed query latency"""
+        with self._stats_lock:
+            stats = dict(self.fetch_stats)
+        return {
+            'max_retries': QB_MAX_RETRIES,
+            'hedge_enabled': self.hedge_enabled,
+            'hedge_percentile': QB_HEDGE_PERCENTILE,
+            **stats,
+            'latency': self.latency.info()
+        }
+
+    def _check_deadline(self, deadline):
+        """Seconds left on the current deadline (None without one); raises once it is spent"""
+        if deadline is None:
+            return None
+        if deadline.cancelled:
+            raise RequestCancelled()
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return remaining
+
+    def _bounded_timeout(self, remaining):
+        """HTTP (connect, read) timeout capped to the time left on the deadline"""
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return (min(connect, remaining), min(read, remaining))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def query(self, company_id, access_token, query, minorversion=QB_MINOR_VERSION, use_cache=True):
+        """Run a QuickBooks query and return the parsed JSON response
+
+        Responses are served from the query cache when one is configured;
+        use_cache=False always goes to QuickBooks (and refreshes the in-memory
+        entry, not the disk tier).
+        Concurrent identical queries share one in-flight HTTP call. While the
+        realm's circuit breaker is open, an expired cached copy is served if
+        there is one.
+        """
+        self._check_queryable(company_id, query_entity(query))
+        key = query_key(company_id, query, minorversion)
+
+        payload = self.cache.get(key) if self.cache is not None and use_cache else None
+        if payload is None:
+            try:
+                payload, _ = self.singleflight.do(
+                    ('query', use_cache) + key,
+                    lambda: self._fetch_query(company_id, access_token, query, minorversion, key, use_cache)
+                )
+            except CircuitOpen:
+                # QuickBooks is down for this realm: fall back to an expired cached copy
+                payload = self.cache.get(key, allow_stale=True) if self.cache is not None else None
+                if payload is None:
+                    raise
+                print(f"⚡ Circuit open for company {company_id}, serving stale cached result")
+
+        # Every caller parses its own copy, so shared payloads are never mutated
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise QuickBooksAPIError(f"Invalid JSON from QuickBooks: {e}", status_code=502,
+                                     detail=payload[:500].decode('utf-8', 'replace')) from e
+
+    def _fetch_query(self, company_id, access_token, query, minorversion, key, use_cache=True):
+        """GET /query and return the raw response bytes (cached on success)
+
+        Uncached reads (use_cache=False, e.g. sync pages) refresh the memory
+        tier only, so they do not write a disk file per page.
+        """
+        encoded_query = quote_plus(query)
+        url = f"{self.api_base_url}/{company_id}/query?query={encoded_query}&minorversion={minorversion}"
+        headers = {'Authorization': f'Bearer {access_token}'}
+
+        try:
+            response = self._read('GET', url, hedge=True, headers=headers)
+        except requests.exceptions.RequestException as e:
+            raise QuickBooksAPIError(str(e), status_code=503) from e
+
+        if response.status_code != 200:
+            self._learn_capability(company_id, query, response.status_code, response.text)
+            raise QuickBooksAPIError(
+                f"{response.status_code} Error for query: {query}",
+                status_code=response.status_code,
+                detail=response.text
+            )
+
+        self._learn_capability(company_id, query, 200)
+        if self.cache is not None:
+            self.cache.set(key, response.content, persist=use_cache)
+
+        return response.content
+
+    def _check_queryable(self, company_id, entity_type):
+        """Fail fast, without a round trip, for entities this realm rejects"""
+        if entity_type and self.capabilities.is_unsupported(company_id, entity_type):
+            raise QuickBooksAPIError(f"{entity_type} is not queryable for company {company_id}",
+                                     status_code=400, detail="Unsupported entity (cached)")
+
+    def _learn_capability(self, company_id, query, status_code, detail=''):
+        """Record whether a query result shows the entity is queryable"""
+        entity_type = query_entity(query)
+        if not entity_type:
+            return
+        if status_code == 200:
+            if self.capabilities.get(company_id, entity_type) is None:
+                self.capabilities.set(company_id, entity_type, True)
+        elif is_unsupported_entity_fault(status_code, detail, query):
+            print(f"🚫 {entity_type} is not queryable for company {company_id}, skipping it from now on")
+            self.capabilities.set(company_id, entity_type, False, reason=(detail or '')[:200])
+
+    def discover(self, company_id, access_token, entities):
+        """Probe which entities a realm can query; returns {entity: True/False/None}
+
+        Entities without a cached answer are probed with one batched
+        SELECT COUNT(*) per entity. None means the probe itself failed
+        (network, auth), so the entity is treated as queryable.
+        """
+        unknown = self.capabilities.unknown(company_id, entities)
+
+        if unknown:
+            print(f"🔎 Probing {len(unknown)} entities for company {company_id}")
+            # batch() records each item's outcome in the capability cache
+            self.batch(company_id, access_token, [f"SELECT COUNT(*) FROM {entity}" for entity in unknown])
+
+        return {entity: self.capabilities.get(company_id, entity) for entity in entities}
+
+    def supported_entities(self, company_id, access_token, entities):
+        """The entities (in order) this realm can query, probing unknown ones first"""
+        capabilities = self.discover(company_id, access_token, entities)
+        return [entity for entity in entities if capabilities[entity] is not False]
+
+    def query_many(self, company_id, access_token, queries, max_workers=QB_FANOUT_WORKERS, use_cache=True):
+        """Run several queries concurrently and return results in query order
+
+        Each result is either the parsed JSON response or the QuickBooksAPIError
+        raised for that query, so one failing entity never hides the others.
+        Set QB_FANOUT_WORKERS=1 to fetch sequentially.
+        """
+        def run(query):
+            try:
+                return self.query(company_id, access_token, query, use_cache=use_cache)
+            except QuickBooksAPIError as e:
+                return e
+
+        workers = max(1, min(max_workers, QB_MAX_CONCURRENT_REQUESTS, len(queries)))
+        if workers == 1:
+            return [run(query) for query in queries]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qb-fetch') as pool:
+            # Results come back in submission order, so the merge is deterministic
+            return map_in_context(pool, run, queries)
+
+    def batch(self, company_id, access_token, queries, minorversion=QB_MINOR_VERSION):
+        """Run many queries through the /batch endpoint, results in query order
+
+        Queries are sent 30 per call (chunks run concurrently when there are more).
+        Each result is the item's {"QueryResponse": ...} payload, shaped like a
+        normal query response, or a QuickBooksAPIError for faulted items.
+        """
+        # Entities this realm is known to reject are answered without sending them
+        skipped = {}
+        for i, query in enumerate(queries):
+            try:
+                self._check_queryable(company_id, query_entity(query))
+            except QuickBooksAPIError as e:
+                skipped[i] = e
+        sent = [query for i, query in enumerate(queries) if i not in skipped]
+
+        chunks = [sent[i:i + QB_BATCH_MAX_ITEMS] for i in range(0, len(sent), QB_BATCH_MAX_ITEMS)]
+
+        def run(chunk):
+            try:
+                return self._batch_chunk(company_id, access_token, chunk, minorversion)
+            except QuickBooksAPIError as e:
+                return [e] * len(chunk)
+
+        if len(chunks) <= 1:
+            chunk_results = [run(chunk) for chunk in chunks]
+        else:
+            workers = min(len(chunks), QB_FANOUT_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qb-batch') as pool:
+                chunk_results = map_in_context(pool, run, chunks)
+
+        results = iter([result for chunk in chunk_results for result in chunk])
+        return [skipped[i] if i in skipped else next(results) for i in range(len(queries))]
+
+    def _batch_chunk(self, company_id, access_token, queries, minorversion):
+        """POST up to 30 queries to /batch in one round trip"""
+        url = f"{self.api_base_url}/{company_id}/batch?minorversion={minorversion}"
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        payload = {
+            'BatchItemRequest': [
+                {'bId': f"bid{i}", 'Query': query}
+                for i, query in enumerate(queries)
+            ]
+        }
+
+        try:
+            response = self._read('POST', url, headers=headers, data=json.dumps(payload))
+        except requests.exceptions.RequestException as e:
+            raise QuickBooksAPIError(str(e), status_code=503) from e
+
+        if response.status_code != 200:
+            raise QuickBooksAPIError(
+                f"{response.status_code} Error for batch of {len(queries)} queries",
+                status_code=response.status_code,
+                detail=response.text
+            )
+
+        try:
+            items = response.json().get('BatchItemResponse', [])
+        except ValueError as e:
+            raise QuickBooksAPIError(f"Invalid JSON from QuickBooks: {e}", status_code=502,
+                                     detail=response.text[:500]) from e
+
+        by_id = {item.get('bId'): item for item in items}
+        results = []
+        for i, query in enumerate(queries):
+            item = by_id.get(f"bid{i}")
+            if item is None:
+                results.append(QuickBooksAPIError(f"Missing batch item for query: {query}", status_code=502))
+            elif 'Fault' in item:
+                detail = json.dumps(item['Fault'])
+                self._learn_capability(company_id, query, 400, detail)
+                results.append(QuickBooksAPIError(f"Batch fault for query: {query}", status_code=400,
+                                                  detail=detail))
+            else:
+                self._learn_capability(company_id, query, 200)
+                results.append({'QueryResponse': item.get('QueryResponse', {})})
+
+        return results
+
+    def cdc(self, company_id, access_token, entities, changed_since, minorversion=QB_MINOR_VERSION):
+        """Call the Change Data Capture endpoint and return {entity: [records]}
+
+        changed_since is an ISO 8601 timestamp (QuickBooks looks back at most 30
+        days). Deleted records are included with "status": "Deleted".
+        """
+        url = f"{self.api_base_url}/{company_id}/cdc"
+        headers = {'Authorization': f'Bearer {access_token}'}
+        params = {
+            'entities': ','.join(entities),
+            'changedSince': changed_since,
+            'minorversion': minorversion
+        }
+
+        try:
+            response = self._read('GET', url, headers=headers, params=params)
+        except requests.exceptions.RequestException as e:
+            raise QuickBooksAPIError(str(e), status_code=503) from e
+
+        if response.status_code != 200:
+            raise QuickBooksAPIError(
+                f"{response.status_code} Error for CDC since {changed_since}",
+                status_code=response.status_code,
+                detail=response.text
+            )
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise QuickBooksAPIError(f"Invalid JSON from QuickBooks: {e}", status_code=502,
+                                     detail=response.text[:500]) from e
+
+        changes = {entity: [] for entity in entities}
+        for cdc_response in data.get('CDCResponse', []):
+            for query_response in cdc_response.get('QueryResponse', []):
+                for entity in entities:
+                    changes[entity].extend(query_response.get(entity, []))
+
+        return changes
+
+    def count(self, company_id, access_token, entity_type, use_cache=True, where=None):
+        """Return SELECT COUNT(*) for an entity (optionally filtered by a WHERE clause)"""
+        data = self.query(company_id, access_token, f"SELECT COUNT(*) FROM {entity_type}{_where(where)}",
+                          use_cache=use_cache)
+        return data.get('QueryResponse', {}).get('totalCount', 0)
+
+    def plan_pages(self, total_count, page_size=QB_PAGE_SIZE, max_records=None):
+        """Compute (STARTPOSITION, MAXRESULTS) windows covering total_count rows
+
+        Only a max_records cap shrinks the final window; uncapped plans always ask
+        for full pages so a full final page reliably signals rows added since COUNT(*).
+        """
+        limit = total_count if max_records is None else min(total_count, max_records)
+        return [
+            (start, page_size if max_records is None else min(page_size, max_records - start + 1))
+            for start in range(1, limit + 1, page_size)
+        ]
+
+    def query_all(self, company_id, access_token, entity_type, page_size=QB_PAGE_SIZE,
+                  max_records=None, max_workers=QB_FANOUT_WORKERS, use_cache=True, where=None, fields=None):
+        """Fetch every record of an entity using COUNT(*)-planned parallel pages
+
+        Issues SELECT COUNT(*) first, computes all page windows up front, fetches
+        them concurrently and reassembles them in STARTPOSITION order. max_records
+        is a hard cap on the number of rows returned. Falls back to walking pages
+        sequentially when the entity does not support COUNT(*). where restricts
+        both the COUNT(*) and the pages to matching rows; fields narrows the
+        pages to a SELECT list.
+
+        Concurrent identical calls share one fetch; each caller gets its own
+        shallow copies of the records.
+        """
+        key = ('query_all', str(company_id), entity_type, page_size, max_records, use_cache, where,
+               tuple(fields or ()))
+        records, shared = self.singleflight.do(
+            key,
+            lambda: self._query_all(company_id, access_token, entity_type, page_size,
+                                    max_records, max_workers, use_cache, where, fields)
+        )
+        return [dict(record) for record in records] if shared else records
+
+    def _query_all(self, company_id, access_token, entity_type, page_size, max_records, max_workers, use_cache,
+                   where=None, fields=None):
+        self._check_queryable(company_id, entity_type)
+
+        try:
+            total_count = self.count(company_id, access_token, entity_type, use_cache=use_cache, where=where)
+        except QuickBooksAPIError as e:
+            print(f"COUNT(*) unavailable for {entity_type} ({e.status_code}), walking pages")
+            return self._walk_pages(company_id, access_token, entity_type, 1, page_size, max_records, use_cache,
+                                    where, fields)
+
+        windows = self.plan_pages(total_count, page_size, max_records)
+        print(f"Planned {len(windows)} pages for {entity_type} ({total_count} records)")
+
+        queries = [
+            f"SELECT {_select(fields)} FROM {entity_type}{_where(where)} STARTPOSITION {start} MAXRESULTS {size}"
+            for start, size in windows
+        ]
+        pages = self.query_many(company_id, access_token, queries, max_workers=max_workers, use_cache=use_cache)
+
+        records = []
+        last_page = []
+        for page in pages:
+            if isinstance(page, QuickBooksAPIError):
+                raise page
+            last_page = page.get('QueryResponse', {}).get(entity_type, [])
+            records.extend(last_page)
+        report_progress(pages=len(pages))
+
+        # Rows added after the COUNT(*) spill past the last planned page
+        if windows and len(last_page) == page_size and (max_records is None or len(records) < max_records):
+            remaining = None if max_records is None else max_records - len(records)
+            records.extend(self._walk_pages(company_id, access_token, entity_type,
+                                            windows[-1][0] + page_size, page_size, remaining, use_cache,
+                                            where, fields))
+
+        return records if max_records is None else records[:max_records]
+
+    def _walk_pages(self, company_id, access_token, entity_type, start_position, page_size, max_records,
+                    use_cache=True, where=None, fields=None):
+        """Sequentially walk STARTPOSITION pages until a short page comes back"""
+        records = []
+
+        while max_records is None or len(records) < max_records:
+            query = (f"SELECT {_select(fields)} FROM {entity_type}{_where(where)} "
+                     f"STARTPOSITION {start_position} MAXRESULTS {page_size}")
+            data = self.query(company_id, access_token, query, use_cache=use_cache)
+            page = data.get('QueryResponse', {}).get(entity_type, [])
+            records.extend(page)
+            report_progress(pages=1)
+
+            if len(page) < page_size:
+                break
+            start_position += page_size
+
+        return records if max_records is None else records[:max_records]
+
+    def pool_stats(self):
+        """Per-host connection pool statistics (connection reuse)"""
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            opened = pool.num_connections
+            served = pool.num_requests
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                'connections_opened': opened,
+                'requests': served,
+                'reused_requests': max(served - opened, 0),
+                'reuse_ratio': round(1 - opened / served, 3) if served else 0.0,
+                'pool_maxsize': self.pool_size
+            }
+
+        return stats
+
+    def close(self):
+        self._hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide QuickBooks client"""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                l2 = DiskCache() if QB_DISK_CACHE_ENABLED else None
+                _client = QuickBooksClient(cache=QueryCache(l2=l2) if QB_CACHE_ENABLED else None)
+
+    return _client
@@ -0,0 +1,122 @@
+"""
+Request Deadlines and Cancellation
+
+Every Flask request that talks to QuickBooks gets a deadline budget. The
+QuickBooks client reads the current deadline before each call: it caps the
+HTTP read timeout to the time left and refuses to start new calls once the
+budget is spent or the browser has disconnected, so abandoned requests stop
+fetching instead of pinning a worker.
+
+The deadline lives in a context variable; thread pools that fan out
+QuickBooks calls copy the caller's context so workers share the budget.
+
+Usage:
+    deadline = Deadline(60, is_cancelled=lambda: client_disconnected(environ))
+    with deadline_scope(deadline):
+        ...  # QuickBooks calls made here respect the deadline
+"""
+
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+QB_REQUEST_DEADLINE = float(os.getenv('QB_REQUEST_DEADLINE', '60'))
+QB_EXPORT_DEADLINE = float(os.getenv('QB_EXPORT_DEADLINE', '300'))
+
+# How often the disconnect check may actually touch the socket
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class Deadline:
+    """Time budget for one request, optionally cancelled by a callback"""
+
+    def __init__(self, seconds, is_cancelled=None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self._is_cancelled = is_cancelled
+        self._cancelled = threading.Event()
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        if self._cancelled.is_set():
+            return True
+        if self._is_cancelled is None:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_poll < CANCEL_POLL_INTERVAL:
+                return False
+            self._last_poll = now
+
+        if self._is_cancelled():
+            print("🛑 Request cancelled, skipping pending QuickBooks calls")
+            self._cancelled.set()
+            return True
+        return False
+
+    @property
+    def done(self):
+        """True once the budget is spent or the request was cancelled"""
+        return self.expired or self.cancelled
+
+
+_current_deadline = ContextVar('qb_deadline', default=None)
+
+
+def current_deadline():
+    """Deadline of the current request, or None outside a deadline scope"""
+    return _current_deadline.get()
+
+
+def set_deadline(deadline):
+    """Install a deadline for the current context; returns a token for reset_deadline"""
+    return _current_deadline.set(deadline)
+
+
+def reset_deadline(token):
+    _current_deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    token = set_deadline(deadline)
+    try:
+        yield deadline
+    finally:
+        reset_deadline(token)
+
+
+def client_disconnected(environ):
+    """True when the browser behind a WSGI request has closed its connection
+
+    Peeks at the request socket the server exposes (werkzeug dev server,
+    gunicorn); a readable socket with no data means the peer hung up.
+    Servers that do not expose the socket are never reported disconnected.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+
+    try:
+        data = sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except (BlockingIOError, InterruptedError):
+        return False
+    except OSError:
+        return True
+    return data == b''
@@ -0,0 +1,236 @@
+"""
+QuickBooks Entity Registry
+
+Single declarative list of the QuickBooks entities DataRift reads, with how
+each one is displayed and interpreted:
+
+    display_name  - label used in tables and exports
+    category      - "list" (names/reference data) or "transaction"
+    amount_field  - where the transaction amount lives ("Line" = sum of lines)
+    party_ref     - reference to the customer/vendor on the record, if any
+    line_details  - line DetailType payloads that carry account/class refs
+    cdc           - whether the entity is kept in the synced local mirror
+    groups        - which endpoint/export fetch lists include the entity
+                    ("warm" = prefetched first right after connecting)
+
+Optional keys:
+
+    collection         - plural key of the entity's data in the overview
+                         dashboard and the sync counts ("overview" group)
+    standardized_label - description prefix in the standardized transaction
+                         view; entities without one keep amount 0 and
+                         status 'Unknown' there
+
+Endpoints build their fetch lists from this registry with entities_in() /
+plan_entities(), which return each entity exactly once.
+"""
+
+# Every line DetailType that carries AccountRef / ClassRef
+LINE_DETAIL_TYPES = [
+    "AccountBasedExpenseLineDetail",
+    "JournalEntryLineDetail",
+    "DepositLineDetail",
+    "SalesItemLineDetail",
+    "ItemBasedExpenseLineDetail"
+]
+
+ENTITY_REGISTRY = {
+    # Lists / reference data
+    "Customer": {
+        "display_name": "Customer", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": True,
+        "collection": "customers",
+        "groups": ("raw_all", "dashboard", "warm", "overview")
+    },
+    "Vendor": {
+        "display_name": "Vendor", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": True,
+        "groups": ("raw_all",)
+    },
+    "Item": {
+        "display_name": "Item", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": True,
+        "collection": "items",
+        "groups": ("raw_all", "dashboard", "warm", "overview")
+    },
+    "Account": {
+        "display_name": "Account", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": True,
+        "groups": ("raw_all", "warm")
+    },
+    "Class": {
+        "display_name": "Class", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": True,
+        "groups": ("raw_all", "dashboard", "warm")
+    },
+    "Department": {
+        "display_name": "Department", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": False,
+        "groups": ("raw_all",)
+    },
+
+    # Transactions
+    "JournalEntry": {
+        "display_name": "Journal Entry", "category": "transaction", "amount_field": "Line",
+        "party_ref": None, "line_details": ["JournalEntryLineDetail"], "cdc": True,
+        "collection": "journal_entries", "standardized_label": "Journal Entry",
+        "groups": ("transactions", "export", "summary", "raw_all", "overview")
+    },
+    "Invoice": {
+        "display_name": "Invoice", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": ["SalesItemLineDetail"], "cdc": True,
+        "collection": "invoices", "standardized_label": "Invoice",
+        "groups": ("transactions", "export", "summary", "raw_all", "dashboard", "warm", "overview")
+    },
+    "Payment": {
+        "display_name": "Payment", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": [], "cdc": True,
+        "collection": "payments", "standardized_label": "Payment",
+        "groups": ("transactions", "export", "summary", "raw_all", "dashboard", "warm", "overview")
+    },
+    "Bill": {
+        "display_name": "Bill", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "VendorRef", "line_details": ["AccountBasedExpenseLineDetail", "ItemBasedExpenseLineDetail"],
+        "cdc": True, "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "BillPayment": {
+        "display_name": "Bill Payment", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "VendorRef", "line_details": [], "cdc": True,
+        "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "Deposit": {
+        "display_name": "Deposit", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": None, "line_details": ["DepositLineDetail"], "cdc": True,
+        "collection": "deposits", "standardized_label": "Deposit",
+        "groups": ("transactions", "export", "summary", "raw_all", "overview")
+    },
+    "Purchase": {
+        "display_name": "Purchase", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "EntityRef", "line_details": ["AccountBasedExpenseLineDetail", "ItemBasedExpenseLineDetail"],
+        "cdc": True, "collection": "expenses", "standardized_label": "Expense",
+        "groups": ("transactions", "export", "summary", "raw_all", "overview")
+    },
+    "Expense": {
+        "display_name": "Expense", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "VendorRef", "line_details": ["AccountBasedExpenseLineDetail"], "cdc": False,
+        "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "Transfer": {
+        "display_name": "Transfer", "category": "transaction", "amount_field": "Amount",
+        "party_ref": None, "line_details": [], "cdc": True,
+        "collection": "transfers", "standardized_label": "Transfer",
+        "groups": ("transactions", "export", "summary", "raw_all", "overview")
+    },
+    "CreditMemo": {
+        "display_name": "Credit Memo", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": ["SalesItemLineDetail"], "cdc": True,
+        "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "SalesReceipt": {
+        "display_name": "Sales Receipt", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": ["SalesItemLineDetail"], "cdc": True,
+        "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "RefundReceipt": {
+        "display_name": "Refund Receipt", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": ["SalesItemLineDetail"], "cdc": True,
+        "groups": ("transactions", "export", "summary", "raw_all")
+    },
+    "VendorCredit": {
+        "display_name": "Vendor Credit", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "VendorRef", "line_details": ["AccountBasedExpenseLineDetail", "ItemBasedExpenseLineDetail"],
+        "cdc": True, "groups": ("export", "summary", "raw_all")
+    },
+    "Estimate": {
+        "display_name": "Estimate", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": ["SalesItemLineDetail"], "cdc": True,
+        "groups": ("raw_all",)
+    },
+    "EstimateLinkedTxn": {
+        "display_name": "Estimate Linked Txn", "category": "transaction", "amount_field": "TotalAmt",
+        "party_ref": "CustomerRef", "line_details": [], "cdc": False,
+        "groups": ("export",)
+    },
+
+    # Tax / company settings
+    "TaxRate": {
+        "display_name": "Tax Rate", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": False,
+        "groups": ("raw_all",)
+    },
+    "TaxCode": {
+        "display_name": "Tax Code", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": False,
+        "groups": ("raw_all",)
+    },
+    "Currency": {
+        "display_name": "Currency", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": False,
+        "groups": ("raw_all",)
+    },
+    "CompanyInfo": {
+        "display_name": "Company Info", "category": "list", "amount_field": None,
+        "party_ref": None, "line_details": [], "cdc": False,
+        "groups": ("raw_all",)
+    }
+}
+
+
+def get_entity(entity_type):
+    """Registry entry for an entity (KeyError if unknown)"""
+    return ENTITY_REGISTRY[entity_type]
+
+
+def display_name(entity_type):
+    spec = ENTITY_REGISTRY.get(entity_type)
+    return spec["display_name"] if spec else entity_type
+
+
+def entities_in(group):
+    """Entities belonging to a fetch group, in registry order"""
+    return [name for name, spec in ENTITY_REGISTRY.items() if group in spec["groups"]]
+
+
+def cdc_entities():
+    """Entities kept in the CDC-synced local mirror"""
+    return [name for name, spec in ENTITY_REGISTRY.items() if spec["cdc"]]
+
+
+def plan_entities(*groups_or_names):
+    """Deduplicated fetch plan for several consumers
+
+    Accepts group names and/or entity names and returns each entity once, in
+    registry order, so one request never pulls the same entity twice.
+    """
+    wanted = set()
+    for item in groups_or_names:
+        if item in ENTITY_REGISTRY:
+            wanted.add(item)
+        else:
+            wanted.update(entities_in(item))
+    return [name for name in ENTITY_REGISTRY if name in wanted]
+
+
+def transaction_amount(record, entity_type):
+    """Amount of a transaction according to the entity's amount_field"""
+    spec = ENTITY_REGISTRY.get(entity_type, {})
+    amount_field = spec.get("amount_field") or "TotalAmt"
+
+    if amount_field == "Line":
+        return sum(float(line.get("Amount", 0)) for line in record.get("Line", []) if "Amount" in line)
+    return float(record.get(amount_field, 0) or 0)
+
+
+def party(record, entity_type):
+    """(value, name) of the customer/vendor the record refers to"""
+    spec = ENTITY_REGISTRY.get(entity_type, {})
+    ref = record.get(spec.get("party_ref") or "", {}) or {}
+    return ref.get("value", ""), ref.get("name", "")
+
+
+def line_detail(line):
+    """The account/class carrying detail payload of a transaction line"""
+    for detail_type in LINE_DETAIL_TYPES:
+        if detail_type in line:
+            return line[detail_type]
+    return {}
@@ -0,0 +1,334 @@
+"""
+Background Export Jobs
+
+Long exports (Excel, raw-data CSV and all-transactions CSV; see EXPORT_JOBS
+in app.py) used to do all the fetching, flattening and serialization inside
+the HTTP request, so large companies hit proxy timeouts. Submitting an
+export now returns a job id immediately; a small worker pool produces the
+artifact on disk and the browser polls for status and progress, then
+downloads the file.
+
+Job state lives in SQLite so any worker process can answer status, cancel
+and download requests. Inside a job, report_progress() records entities and
+pages done, and a cancel request stops further QuickBooks calls through the
+job's deadline (see qb_deadline). Entities the export had to leave out go
+in job.missing_entities; the job still succeeds but reports partial: true.
+
+Usage:
+    from qb_jobs import get_job_manager
+
+    jobs = get_job_manager()
+    job_id = jobs.submit('transactions-excel', company_id, run)   # run(job) -> (bytes, filename, mimetype)
+    jobs.get(job_id)
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from qb_deadline import Deadline, deadline_scope
+from qb_ratelimit import PRIORITY_BULK, request_priority
+from qb_store import QB_DATA_DIR
+
+QB_JOB_WORKERS = int(os.getenv('QB_JOB_WORKERS', '2'))
+QB_JOB_DIR = os.getenv('QB_JOB_DIR', os.path.join(QB_DATA_DIR, 'jobs'))
+QB_JOB_DB = os.getenv('QB_JOB_DB', os.path.join(QB_DATA_DIR, 'qb_jobs.db'))
+QB_JOB_DEADLINE = float(os.getenv('QB_JOB_DEADLINE', '3600'))
+QB_JOB_RETENTION = float(os.getenv('QB_JOB_RETENTION', str(24 * 3600)))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Progress is written to SQLite at most this often while a job runs
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class JobFailed(Exception):
+    """The export finished without producing an artifact"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once a cancel was requested"""
+
+
+class Job:
+    """A running job as seen from its worker thread"""
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.id = job_id
+        self.progress = {'entities_total': None, 'entities_done': 0, 'current_entity': None,
+                         'pages_done': 0, 'records': 0}
+        self.missing_entities = []
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @property
+    def cancel_requested(self):
+        return self.manager.cancel_requested(self.id)
+
+    def report(self, entities_total=None, entity=None, entity_done=None, pages=0, records=0):
+        with self._lock:
+            if entities_total is not None:
+                self.progress['entities_total'] = entities_total
+            if entity is not None:
+                self.progress['current_entity'] = entity
+            if entity_done is not None:
+                self.progress['entities_done'] += 1
+            self.progress['pages_done'] += pages
+            self.progress['records'] += records
+
+            now = time.monotonic()
+            if now - self._last_flush < PROGRESS_FLUSH_INTERVAL:
+                return
+            self._last_flush = now
+            progress = dict(self.progress)
+
+        self.manager._update(self.id, progress=json.dumps(progress))
+
+
+_current_job = ContextVar('qb_job', default=None)
+
+
+def current_job():
+    """Job running in this context, or None outside a background job"""
+    return _current_job.get()
+
+
+def report_progress(**progress):
+    """Record progress on the current job (no-op outside a job)"""
+    job = _current_job.get()
+    if job is not None:
+        job.report(**progress)
+
+
+class JobManager:
+    """Runs export jobs on a worker pool and tracks them in SQLite"""
+
+    def __init__(self, workers=QB_JOB_WORKERS, directory=QB_JOB_DIR, path=QB_JOB_DB,
+                 deadline=QB_JOB_DEADLINE, retention=QB_JOB_RETENTION):
+        self.directory = directory
+        self.path = path
+        self.deadline = deadline
+        self.retention = retention
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qb-job')
+        self._local = threading.local()
+        self._running = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                realm TEXT NOT NULL,
+                state TEXT NOT NULL,
+                progress TEXT,
+                error TEXT,
+                artifact TEXT,
+                filename TEXT,
+                mimetype TEXT,
+                size INTEGER,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                pid INTEGER,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                missing_entities TEXT
+            )
+        """)
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'missing_entities' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN missing_entities TEXT")
+        conn.commit()
+        self._fail_orphans()
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections are not shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _update(self, job_id, **fields):
+        conn = self._conn()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+    def _fail_orphans(self):
+        """Jobs left queued/running by a process that no longer exists will never finish"""
+        conn = self._conn()
+        rows = conn.execute("SELECT id, pid FROM jobs WHERE state IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        for row in rows:
+            if row['pid'] == os.getpid() or _pid_alive(row['pid']):
+                continue
+            self._update(row['id'], state=FAILED, error="Interrupted (worker restarted)", finished_at=_now())
+
+    def submit(self, kind, company_id, run):
+        """Queue run(job) -> (content bytes, filename, mimetype) and return the job id"""
+        self.purge()
+        job = Job(self, uuid.uuid4().hex)
+        job_id = job.id
+        conn = self._conn()
+        conn.execute("""
+            INSERT INTO jobs (id, kind, realm, state, progress, pid, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, kind, str(company_id), QUEUED, json.dumps(job.progress), os.getpid(), _now()))
+        conn.commit()
+
+        with self._lock:
+            self._running[job_id] = job
+        self._pool.submit(self._run, job, run)
+        print(f"📦 Queued {kind} export job {job_id} for company {company_id}")
+        return job_id
+
+    def _run(self, job, run):
+        if job.cancel_requested:
+            with self._lock:
+                self._running.pop(job.id, None)
+            self._update(job.id, state=CANCELLED, finished_at=_now())
+            return
+
+        self._update(job.id, state=RUNNING, started_at=_now())
+        started = time.monotonic()
+        token = _current_job.set(job)
+        try:
+            deadline = Deadline(self.deadline, is_cancelled=lambda: job.cancel_requested)
+            with deadline_scope(deadline), request_priority(PRIORITY_BULK):
+                content, filename, mimetype = run(job)
+
+            if job.cancel_requested:
+                raise JobCancelled()
+
+            artifact = os.path.join(self.directory, f"{job.id}{os.path.splitext(filename)[1]}")
+            partial = artifact + '.part'
+            with open(partial, 'wb') as f:
+                f.write(content)
+            os.replace(partial, artifact)
+
+            self._update(job.id, state=SUCCEEDED, artifact=artifact, filename=filename, mimetype=mimetype,
+                         size=len(content), progress=json.dumps(job.progress),
+                         missing_entities=json.dumps(job.missing_entities), finished_at=_now())
+            print(f"✅ Export job {job.id} done in {time.monotonic() - started:.1f}s ({len(content)} bytes)"
+                  + (f", missing {', '.join(job.missing_entities)}" if job.missing_entities else ""))
+        except JobCancelled:
+            self._update(job.id, state=CANCELLED, progress=json.dumps(job.progress), finished_at=_now())
+            print(f"🛑 Export job {job.id} cancelled")
+        except Exception as e:
+            self._update(job.id, state=FAILED, error=str(e), progress=json.dumps(job.progress), finished_at=_now())
+            print(f"❌ Export job {job.id} failed: {str(e)}")
+        finally:
+            _current_job.reset(token)
+            with self._lock:
+                self._running.pop(job.id, None)
+
+    def get(self, job_id):
+        """Job status dict, or None if unknown"""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        running = self._running.get(job_id)
+        progress = dict(running.progress) if running is not None else json.loads(job['progress'] or '{}')
+        missing = json.loads(job['missing_entities'] or '[]')
+        return {
+            'job_id': job['id'],
+            'kind': job['kind'],
+            'company_id': job['realm'],
+            'state': job['state'],
+            'progress': progress,
+            'error': job['error'],
+            'partial': bool(missing),
+            'missing_entities': missing,
+            'filename': job['filename'],
+            'size': job['size'],
+            'cancel_requested': bool(job['cancel_requested']),
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+
+    def artifact(self, job_id):
+        """(path, filename, mimetype) of a finished job's file, or None"""
+        row = self._conn().execute("SELECT state, artifact, filename, mimetype FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+        if row is None or row['state'] != SUCCEEDED or not row['artifact'] or not os.path.exists(row['artifact']):
+            return None
+        return row['artifact'], row['filename'], row['mimetype']
+
+    def list(self, company_id, limit=20):
+        rows = self._conn().execute("SELECT id FROM jobs WHERE realm = ? ORDER BY created_at DESC LIMIT ?",
+                                    (str(company_id), limit)).fetchall()
+        return [self.get(row['id']) for row in rows]
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns False if it already finished"""
+        conn = self._conn()
+        cursor = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state IN (?, ?)",
+                              (job_id, QUEUED, RUNNING))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def cancel_requested(self, job_id):
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def purge(self):
+        """Drop finished jobs (and their files) older than the retention period"""
+        cutoff = datetime.fromtimestamp(time.time() - self.retention, timezone.utc).isoformat(timespec='seconds')
+        conn = self._conn()
+        rows = conn.execute("SELECT id, artifact FROM jobs WHERE state IN (?, ?, ?) AND created_at < ?",
+                            (*FINISHED_STATES, cutoff)).fetchall()
+        for row in rows:
+            if row['artifact'] and os.path.exists(row['artifact']):
+                os.remove(row['artifact'])
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row['id'],))
+        conn.commit()
+        return len(rows)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager"""
+    global _manager
+
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+
+    return _manager
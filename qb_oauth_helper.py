@@ -20,8 +20,8 @@ from urllib.parse import urlencode, parse_qs, urlparse
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import threading
 import time
-import requests
 from dotenv import load_dotenv
+from qb_client import get_client
 
 # Load environment variables
 load_dotenv()
@@ -208,7 +208,7 @@ class QuickBooksOAuth:
         }
         
         try:
-            response = requests.post(self.token_url, headers=headers, data=data)
+            response = get_client().post(self.token_url, headers=headers, data=data)
             
             if response.status_code == 200:
                 token_data = response.json()
@@ -244,7 +244,7 @@ class QuickBooksOAuth:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = get_client().get(url, headers=headers, params=params)
             
             if response.status_code == 200:
                 print("✅ API connection successful!")
@@ -0,0 +1,191 @@
+"""
+QuickBooks Query Pushdown
+
+Compiles endpoint filters into QuickBooks queries so filtering happens at
+the source: QuickBooks returns only the matching rows and columns instead
+of every record of every entity being fetched and then filtered in pandas.
+
+Query parameters (all optional):
+    start_date / end_date  - TxnDate range, YYYY-MM-DD, inclusive
+    customer / vendor      - Id of the customer / vendor (CustomerRef / VendorRef)
+    fields                 - comma-separated SELECT list (Id, and TxnDate on
+                             transactions, are always selected)
+
+Entity types whose records can never match a customer/vendor filter are not
+queried at all. Malformed filters, and filtered queries QuickBooks cannot
+parse (e.g. an unknown field), raise InvalidFilter so the request gets a 400
+instead of silently missing the entity.
+
+The same filters work on records read from the local mirror: the date range
+is applied by the store, references and fields by apply().
+
+Usage:
+    from qb_query import QueryFilters
+
+    filters = QueryFilters.from_args(request.args)   # InvalidFilter on bad input
+    filters.query("Invoice")
+    # SELECT * FROM Invoice WHERE TxnDate >= '2025-01-01' AND CustomerRef = '42'
+"""
+
+import re
+from datetime import datetime
+from qb_cache import is_query_parser_fault
+from qb_entities import ENTITY_REGISTRY
+
+FIELD_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9]*$')
+REF_ID_PATTERN = re.compile(r'^\d+$')
+
+# Filter parameter -> (reference field compiled into WHERE, EntityRef type it matches)
+PARTY_FILTERS = {
+    'customer': ('CustomerRef', 'Customer'),
+    'vendor': ('VendorRef', 'Vendor')
+}
+
+# References QuickBooks cannot filter on; matched after fetching
+UNFILTERABLE_REFS = ('EntityRef',)
+
+
+class InvalidFilter(ValueError):
+    """Filters that are malformed or that QuickBooks rejected (answered with a 400)"""
+
+    def __init__(self, message, detail=''):
+        super().__init__(message)
+        self.detail = detail
+
+
+def _is_transaction(entity_type):
+    return ENTITY_REGISTRY.get(entity_type, {}).get('category') == 'transaction'
+
+
+def _party_ref(entity_type):
+    return ENTITY_REGISTRY.get(entity_type, {}).get('party_ref')
+
+
+def _date(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise InvalidFilter(f"{name} must be a date (YYYY-MM-DD)")
+
+
+class QueryFilters:
+    """Date range, customer/vendor and field list for one request's queries"""
+
+    def __init__(self, start_date=None, end_date=None, customer=None, vendor=None, fields=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.parties = {name: value for name, value in (('customer', customer), ('vendor', vendor)) if value}
+        self.fields = list(fields or [])
+
+    @classmethod
+    def from_args(cls, args):
+        """Filters from request arguments (InvalidFilter describing the first bad one)"""
+        start_date = _date(args.get('start_date'), 'start_date')
+        end_date = _date(args.get('end_date'), 'end_date')
+        if start_date and end_date and start_date > end_date:
+            raise InvalidFilter("start_date is after end_date")
+
+        parties = {}
+        for name in PARTY_FILTERS:
+            value = (args.get(name) or '').strip()
+            if value and not REF_ID_PATTERN.match(value):
+                raise InvalidFilter(f"{name} must be a QuickBooks {name} Id")
+            parties[name] = value or None
+
+        fields = [field.strip() for field in (args.get('fields') or '').split(',') if field.strip()]
+        invalid = [field for field in fields if not FIELD_PATTERN.match(field)]
+        if invalid:
+            raise InvalidFilter(f"Invalid field name(s): {', '.join(invalid)}")
+
+        return cls(start_date, end_date, fields=fields, **parties)
+
+    def __bool__(self):
+        return bool(self.start_date or self.end_date or self.parties or self.fields)
+
+    def key(self):
+        """Hashable identity, e.g. for per-request result memoization"""
+        return (self.start_date, self.end_date, tuple(sorted(self.parties.items())), tuple(self.fields))
+
+    def applies_to(self, entity_type):
+        """False when a customer/vendor filter can never match the entity (it is then not fetched)"""
+        party_ref = _party_ref(entity_type)
+        return all(party_ref in (PARTY_FILTERS[name][0], *UNFILTERABLE_REFS) for name in self.parties)
+
+    def date_range(self, entity_type):
+        """(start_date, end_date) to apply to an entity; (None, None) for entities without TxnDate"""
+        if not _is_transaction(entity_type):
+            return None, None
+        return self.start_date, self.end_date
+
+    def where(self, entity_type):
+        """WHERE clause (without the keyword) for an entity, or None"""
+        start_date, end_date = self.date_range(entity_type)
+        conditions = []
+        if start_date:
+            conditions.append(f"TxnDate >= '{start_date}'")
+        if end_date:
+            conditions.append(f"TxnDate <= '{end_date}'")
+
+        party_ref = _party_ref(entity_type)
+        for name, value in self.parties.items():
+            if party_ref == PARTY_FILTERS[name][0]:
+                conditions.append(f"{party_ref} = '{value}'")
+
+        return " AND ".join(conditions) or None
+
+    def select_fields(self, entity_type):
+        """Fields to SELECT for an entity, or None for SELECT *"""
+        if not self.fields:
+            return None
+
+        fields = ['Id']
+        if _is_transaction(entity_type):
+            fields.append('TxnDate')
+        party_ref = _party_ref(entity_type)
+        if self.parties and party_ref in UNFILTERABLE_REFS:
+            # Needed to match the customer/vendor after fetching
+            fields.append(party_ref)
+        return list(dict.fromkeys(fields + self.fields))
+
+    def query(self, entity_type):
+        fields = self.select_fields(entity_type)
+        where = self.where(entity_type)
+        query = f"SELECT {', '.join(fields) if fields else '*'} FROM {entity_type}"
+        return f"{query} WHERE {where}" if where else query
+
+    def check_rejected(self, entity_type, status_code, detail):
+        """Raise InvalidFilter if QuickBooks could not parse this entity's filtered query"""
+        if (self.fields or self.where(entity_type)) and is_query_parser_fault(status_code, detail):
+            raise InvalidFilter(f"QuickBooks rejected the fields/filters for {entity_type}", detail=detail)
+
+    def apply(self, records, entity_type):
+        """Filter and project records that did not come from query() (local mirror, EntityRef matches)"""
+        if not self:
+            return records
+
+        start_date, end_date = self.date_range(entity_type)
+        party_ref = _party_ref(entity_type) or ''
+        wanted = [(PARTY_FILTERS[name][1], value) for name, value in self.parties.items()]
+        fields = self.select_fields(entity_type)
+
+        matched = []
+        for record in records:
+            txn_date = record.get('TxnDate') or ''
+            if (start_date and txn_date < start_date) or (end_date and txn_date > end_date):
+                continue
+            ref = record.get(party_ref) or {}
+            if not all(ref.get('value') == value and ref.get('type', kind) == kind for kind, value in wanted):
+                continue
+            matched.append({field: record[field] for field in fields if field in record} if fields else record)
+
+        return matched
+
+    def info(self):
+        return {
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            **self.parties,
+            'fields': self.fields
+        }
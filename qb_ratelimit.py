@@ -0,0 +1,442 @@
+"""
+QuickBooks Rate Limiting
+
+Central scheduler for QuickBooks API traffic. QuickBooks Online throttles
+each company (realm) to roughly 500 requests per minute and 10 concurrent
+requests, answering HTTP 429 beyond that.
+
+Every API request goes through a per-realm limiter:
+    - a token bucket paces requests to the per-minute allowance
+    - an adaptive (AIMD) limit caps the number of requests in flight: it
+      grows by one per window of healthy responses and halves on 429s,
+      5xx errors, network failures or latency spikes (never above 10)
+    - a 429 pauses the whole realm for Retry-After (or a jittered
+      exponential backoff) before the request is retried
+
+Requests carry a priority class (interactive, background sync, bulk
+export). Queued requests are admitted by smooth weighted round robin, so
+dashboard queries jump ahead of queued export pages while bulk work still
+gets a guaranteed share and is never starved.
+
+Queue depth and wait times are tracked per realm so exports can run at the
+full allowed speed and it is visible when requests start queueing.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+QB_RATE_LIMIT_PER_MINUTE = float(os.getenv('QB_RATE_LIMIT_PER_MINUTE', '500'))
+QB_RATE_LIMIT_BURST = int(os.getenv('QB_RATE_LIMIT_BURST', '20'))
+QB_MAX_429_RETRIES = int(os.getenv('QB_MAX_429_RETRIES', '5'))
+QB_BACKOFF_BASE = float(os.getenv('QB_BACKOFF_BASE', '1'))
+QB_BACKOFF_MAX = float(os.getenv('QB_BACKOFF_MAX', '60'))
+
+# Adaptive concurrency: starting limit, and how much slower than the usual
+# latency a response must be to count as a latency spike
+QB_AIMD_INITIAL_LIMIT = int(os.getenv('QB_AIMD_INITIAL_LIMIT', '4'))
+QB_AIMD_LATENCY_FACTOR = float(os.getenv('QB_AIMD_LATENCY_FACTOR', '3'))
+
+# Priority classes and their share of admissions while requests are queued
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_SYNC = 'sync'
+PRIORITY_BULK = 'bulk'
+
+PRIORITY_WEIGHTS = {
+    PRIORITY_INTERACTIVE: int(os.getenv('QB_PRIORITY_WEIGHT_INTERACTIVE', '8')),
+    PRIORITY_SYNC: int(os.getenv('QB_PRIORITY_WEIGHT_SYNC', '3')),
+    PRIORITY_BULK: int(os.getenv('QB_PRIORITY_WEIGHT_BULK', '1'))
+}
+
+_current_priority = ContextVar('qb_priority', default=PRIORITY_INTERACTIVE)
+
+
+def current_priority():
+    """Priority class of QuickBooks calls made from the current context"""
+    return _current_priority.get()
+
+
+@contextmanager
+def request_priority(priority):
+    """Run the enclosed QuickBooks calls under a priority class"""
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown priority class: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SlotTimeout(Exception):
+    """No rate token / concurrency slot became available within the timeout"""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt, base=QB_BACKOFF_BASE, cap=QB_BACKOFF_MAX):
+    """Exponential backoff with jitter: half fixed, half random"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking
+
+    reserve() always takes a token (the balance may go negative) and returns
+    how long the caller must wait before using it, so waiting callers are
+    served in arrival order without polling.
+    """
+
+    def __init__(self, rate_per_minute=QB_RATE_LIMIT_PER_MINUTE, capacity=QB_RATE_LIMIT_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take one token; returns the seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def refund(self):
+        """Give back a reserved token that will not be used"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        """Hold every reservation back for `seconds` (after a 429) and drop the burst"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, now + seconds)
+
+
+class _Waiter:
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit (additive increase, multiplicative decrease)
+
+    Each healthy response raises the limit by 1/limit, i.e. by one request
+    per full window of successes. A congestion signal halves it, at most
+    once per typical response time so one burst of 429s counts once.
+
+    Requests that find the limit reached wait in one queue per priority
+    class; freed slots go to the classes by smooth weighted round robin.
+    """
+
+    def __init__(self, initial=QB_AIMD_INITIAL_LIMIT, min_limit=1, max_limit=10,
+                 latency_factor=QB_AIMD_LATENCY_FACTOR, weights=PRIORITY_WEIGHTS):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.latency_factor = latency_factor
+        self.weights = dict(weights)
+
+        self.in_flight = 0
+        self.latency = None   # moving average of healthy response times
+        self._last_decrease = 0.0
+        self._waiting = {priority: deque() for priority in self.weights}
+        self._credit = {priority: 0 for priority in self.weights}
+        self._cond = threading.Condition()
+        self.stats = {'increases': 0, 'decreases': 0, 'latency_spikes': 0}
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Take a slot; returns False if none was granted within timeout seconds"""
+        with self._cond:
+            if self.in_flight < int(self.limit) and not any(self._waiting.values()):
+                self.in_flight += 1
+                return True
+
+            waiter = _Waiter()
+            self._waiting[priority].append(waiter)
+            give_up_at = None if timeout is None else time.monotonic() + timeout
+            try:
+                while not waiter.granted:
+                    if give_up_at is None:
+                        self._cond.wait()
+                        continue
+                    left = give_up_at - time.monotonic()
+                    if left <= 0:
+                        self._waiting[priority].remove(waiter)
+                        return False
+                    self._cond.wait(left)
+                return True
+            except BaseException:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                else:
+                    self._waiting[priority].remove(waiter)
+                raise
+
+    def _pick(self):
+        """Smooth weighted round robin over the classes that have waiters"""
+        ready = [priority for priority, queue in self._waiting.items() if queue]
+        total = sum(self.weights[priority] for priority in ready)
+        for priority in ready:
+            self._credit[priority] += self.weights[priority]
+        chosen = max(ready, key=lambda priority: self._credit[priority])
+        self._credit[chosen] -= total
+        return chosen
+
+    def _dispatch(self):
+        """Hand free slots to queued requests (caller holds the condition)"""
+        granted = False
+        while self.in_flight < int(self.limit) and any(self._waiting.values()):
+            self._waiting[self._pick()].popleft().granted = True
+            self.in_flight += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Return a slot without feedback (request never sent)"""
+        with self._cond:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def queue_depths(self):
+        with self._cond:
+            return {priority: len(queue) for priority, queue in self._waiting.items()}
+
+    def release(self, latency=None, congested=False):
+        """Return a slot and adjust the limit from the request's outcome"""
+        with self._cond:
+            self.in_flight -= 1
+
+            spike = (not congested and latency is not None and self.latency is not None
+                     and latency > self.latency * self.latency_factor)
+            if spike:
+                self.stats['latency_spikes'] += 1
+
+            if congested or spike:
+                self._decrease()
+            else:
+                if latency is not None:
+                    self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+                if self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self.stats['increases'] += 1
+
+            self._dispatch()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.stats['decreases'] += 1
+
+    def info(self):
+        with self._cond:
+            return {
+                'concurrency_limit': int(self.limit),
+                'concurrency_limit_exact': round(self.limit, 2),
+                'avg_latency_seconds': round(self.latency, 3) if self.latency is not None else None,
+                **self.stats
+            }
+
+
+class RealmLimiter:
+    """Token bucket, adaptive concurrency limit and queue metrics for one realm"""
+
+    def __init__(self, rate_per_minute, burst, max_concurrent):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.concurrency = AdaptiveLimit(max_limit=max_concurrent)
+        self.max_concurrent = max_concurrent
+
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'retries': 0,
+            'max_queue_depth': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0
+        }
+        self.by_priority = {
+            priority: {'requests': 0, 'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for priority in PRIORITY_WEIGHTS
+        }
+
+    def _enter(self):
+        with self._lock:
+            self.queued += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.queued)
+
+    def _admitted(self, priority, waited):
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            for stats in (self.stats, self.by_priority[priority]):
+                stats['requests'] += 1
+                stats['total_wait_seconds'] += waited
+                stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+
+    def _left_queue(self):
+        with self._lock:
+            self.queued -= 1
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def info(self):
+        queue_depths = self.concurrency.queue_depths()
+        with self._lock:
+            requests = self.stats['requests']
+            return {
+                'queue_depth': self.queued,
+                'in_flight': self.in_flight,
+                'max_concurrent': self.max_concurrent,
+                'avg_wait_seconds': round(self.stats['total_wait_seconds'] / requests, 3) if requests else 0.0,
+                **{name: round(value, 3) if isinstance(value, float) else value
+                   for name, value in self.stats.items()},
+                **self.concurrency.info(),
+                'by_priority': {
+                    priority: {
+                        'queue_depth': queue_depths[priority],
+                        'requests': stats['requests'],
+                        'avg_wait_seconds': round(stats['total_wait_seconds'] / stats['requests'], 3)
+                        if stats['requests'] else 0.0,
+                        'max_wait_seconds': round(stats['max_wait_seconds'], 3)
+                    }
+                    for priority, stats in self.by_priority.items()
+                }
+            }
+
+
+class RateScheduler:
+    """Per-realm admission control for QuickBooks API requests"""
+
+    def __init__(self, rate_per_minute=QB_RATE_LIMIT_PER_MINUTE, burst=QB_RATE_LIMIT_BURST,
+                 max_concurrent=10, max_retries=QB_MAX_429_RETRIES):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+
+        self._realms = {}
+        self._lock = threading.Lock()
+
+    def realm(self, company_id):
+        with self._lock:
+            limiter = self._realms.get(company_id)
+            if limiter is None:
+                limiter = RealmLimiter(self.rate_per_minute, self.burst, self.max_concurrent)
+                self._realms[company_id] = limiter
+            return limiter
+
+    @contextmanager
+    def slot(self, company_id, priority=None, timeout=None):
+        """Wait for a concurrency slot (by priority) and a rate token, then hold the slot
+
+        The slot is taken first so queued requests are ordered by priority
+        and at most `limit` requests hold rate reservations at a time.
+        Raises SlotTimeout when admission would take longer than timeout.
+        Yields a dict; set its 'status' to the response status code so the
+        adaptive limit can react (an exception counts as congestion).
+        """
+        priority = priority or current_priority()
+        limiter = self.realm(company_id)
+        started = time.monotonic()
+        limiter._enter()
+
+        try:
+            if not limiter.concurrency.acquire(priority, timeout):
+                raise SlotTimeout(f"No QuickBooks request slot for company {company_id} within {timeout:.1f}s")
+        except BaseException:
+            limiter._left_queue()
+            raise
+
+        try:
+            wait = limiter.bucket.reserve()
+            if timeout is not None and wait > timeout - (time.monotonic() - started):
+                # The request is not sent, so later callers should not wait for its token
+                limiter.bucket.refund()
+                raise SlotTimeout(f"QuickBooks rate limit for company {company_id} needs {wait:.1f}s")
+            if wait > 0:
+                time.sleep(wait)
+        except BaseException:
+            limiter._left_queue()
+            limiter.concurrency.cancel()
+            raise
+
+        limiter._admitted(priority, time.monotonic() - started)
+        outcome = {'status': None}
+        sent = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome['status'] = 'error'
+            raise
+        finally:
+            status = outcome['status']
+            congested = status == 'error' or status == 429 or (isinstance(status, int) and status >= 500)
+            limiter._done()
+            limiter.concurrency.release(latency=time.monotonic() - sent, congested=congested)
+
+    def throttled(self, company_id, attempt, retry_after=None):
+        """Record a 429, pause the realm and return how long to wait before retrying"""
+        limiter = self.realm(company_id)
+        delay = parse_retry_after(retry_after)
+        delay = backoff_delay(attempt) if delay is None else delay + random.uniform(0, 0.5)
+
+        limiter.bucket.pause(delay)
+        with limiter._lock:
+            limiter.stats['throttled'] += 1
+            limiter.stats['retries'] += 1
+        return delay
+
+    def info(self):
+        with self._lock:
+            realms = dict(self._realms)
+        return {
+            'rate_per_minute': self.rate_per_minute,
+            'burst': self.burst,
+            'max_concurrent': self.max_concurrent,
+            'max_retries': self.max_retries,
+            'realms': {company_id: limiter.info() for company_id, limiter in realms.items()}
+        }
@@ -0,0 +1,269 @@
+"""
+Background Sync Scheduler
+
+A daemon thread that keeps each connected realm's local mirror warm by
+running the CDC sync engine periodically, so the first dashboard visit after
+an idle period reads local data instead of waiting on a cold pull.
+
+Connected realms are those with server-side tokens (qb_tokens). Each realm
+is synced every QB_SYNC_INTERVAL seconds, randomised by +/- QB_SYNC_JITTER so
+realms (and worker processes) do not all fire at once. Syncs run at sync
+priority through the rate scheduler, are deferred while the realm has
+requests queued or its circuit breaker is open, and back off after failures.
+A realm another worker process synced recently is skipped. warm() syncs a
+newly connected realm immediately, loading the dashboard's entities first;
+revalidate() refreshes a single stale entity without syncing the realm.
+
+Usage:
+    from qb_scheduler import get_sync_scheduler
+
+    scheduler = get_sync_scheduler()
+    scheduler.start()
+    scheduler.info()
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from qb_ratelimit import PRIORITY_SYNC, backoff_delay, request_priority
+from qb_sync import get_sync_engine
+from qb_tokens import get_token_manager
+
+QB_SYNC_SCHEDULER_ENABLED = os.getenv('QB_SYNC_SCHEDULER_ENABLED', 'True').lower() == 'true'
+QB_SYNC_INTERVAL = float(os.getenv('QB_SYNC_INTERVAL', '900'))
+QB_SYNC_JITTER = float(os.getenv('QB_SYNC_JITTER', '0.2'))
+
+# How long to wait before re-checking a realm that was busy
+BUSY_RETRY_SECONDS = 30
+
+# How often the thread looks for newly connected realms
+REALM_POLL_SECONDS = 60
+
+
+class SyncScheduler:
+    """Periodic per-realm background sync with jitter and failure backoff"""
+
+    def __init__(self, engine=None, tokens=None, interval=QB_SYNC_INTERVAL, jitter=QB_SYNC_JITTER):
+        self.engine = engine or get_sync_engine()
+        self.tokens = tokens or get_token_manager()
+        self.interval = interval
+        self.jitter = jitter
+
+        self._realms = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._warming = {}
+        self._revalidating = {}
+
+    def _next_delay(self):
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _state(self, company_id):
+        state = self._realms.get(company_id)
+        if state is None:
+            # First sync soon after start, spread out by the jitter
+            state = {
+                'next_due': time.monotonic() + random.uniform(0, self.interval * self.jitter),
+                'last_sync': self.engine.store.status(company_id)['last_sync'],
+                'last_result': None,
+                'last_error': None,
+                'runs': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'deferred': 0
+            }
+            self._realms[company_id] = state
+        return state
+
+    def start(self):
+        """Start the scheduler thread (no-op if it is already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='qb-sync-scheduler', daemon=True)
+        self._thread.start()
+        print(f"⏰ Background sync every {self.interval:.0f}s (±{self.jitter:.0%}) for connected companies")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def sync_soon(self, company_id):
+        """Schedule a realm's sync to run right away"""
+        with self._lock:
+            self._state(company_id)['next_due'] = time.monotonic()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            for company_id in self.tokens.realms():
+                with self._lock:
+                    self._state(company_id)
+
+            now = time.monotonic()
+            with self._lock:
+                due = [company_id for company_id, state in self._realms.items() if state['next_due'] <= now]
+                upcoming = [state['next_due'] for state in self._realms.values()]
+
+            for company_id in due:
+                if self._stop.is_set():
+                    return
+                self._run(company_id)
+
+            wait = min([REALM_POLL_SECONDS] + [due_at - time.monotonic() for due_at in upcoming])
+            self._wake.wait(max(wait, 1))
+            self._wake.clear()
+
+    def _defer(self, state, seconds, reason):
+        state['next_due'] = time.monotonic() + seconds
+        state['deferred'] += 1
+        state['last_result'] = f"deferred: {reason}"
+
+    def _run(self, company_id):
+        with self._lock:
+            state = self._state(company_id)
+
+        client = self.engine.client
+        if client.scheduler.realm(company_id).queued:
+            # Interactive traffic is waiting on the rate limiter; don't add to it
+            return self._defer(state, BUSY_RETRY_SECONDS, "requests queued")
+        if client.breakers.enabled and client.breakers.get(company_id).retry_after() > 0:
+            return self._defer(state, client.breakers.get(company_id).retry_after(), "circuit open")
+
+        last_sync = self.engine.store.status(company_id)['last_sync']
+        if last_sync:
+            age = (datetime.now(timezone.utc) - datetime.fromisoformat(last_sync)).total_seconds()
+            if age < self.interval * (1 - self.jitter):
+                # Synced recently (by a request or another worker process)
+                state['last_sync'] = last_sync
+                state['next_due'] = time.monotonic() + self._next_delay() - age
+                return
+
+        self._sync(company_id, state)
+
+    def warm(self, company_id, entities=()):
+        """Sync a realm right away in its own thread, loading entities first
+
+        Used after connecting a company so the dashboard's entities land in
+        the local mirror before the user asks for them, and to revalidate
+        stale data. A realm already being warmed is not warmed twice.
+        """
+        with self._lock:
+            thread = self._warming.get(company_id)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            state = self._state(company_id)
+            state['next_due'] = time.monotonic() + self._next_delay()
+            thread = threading.Thread(target=self._sync, args=(company_id, state, entities),
+                                      name=f'qb-warm-{company_id}', daemon=True)
+            self._warming[company_id] = thread
+
+        thread.start()
+        first = f" ({', '.join(entities)} first)" if entities else ""
+        print(f"🔥 Warming local data for company {company_id}{first}")
+        return thread
+
+    def revalidate(self, company_id, access_token, entity_type):
+        """Refresh one entity of a realm in its own thread
+
+        Used when a list endpoint serves data past the soft TTL: only that
+        entity's changed rows are fetched, at sync priority. An entity already
+        being refreshed for the realm is not refreshed twice.
+        """
+        key = (company_id, entity_type)
+        with self._lock:
+            thread = self._revalidating.get(key)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            thread = threading.Thread(target=self._refresh_entity, args=(company_id, access_token, entity_type),
+                                      name=f'qb-revalidate-{company_id}-{entity_type}', daemon=True)
+            self._revalidating[key] = thread
+
+        thread.start()
+        return thread
+
+    def _refresh_entity(self, company_id, access_token, entity_type):
+        try:
+            with request_priority(PRIORITY_SYNC):
+                report = self.engine.refresh_entity(company_id, access_token, entity_type)
+        except Exception as e:
+            print(f"❌ Background refresh of {entity_type} failed for company {company_id}: {str(e)}")
+            return
+
+        if report is not None and entity_type in report['errors']:
+            print(f"❌ Background refresh of {entity_type} failed for company {company_id}: "
+                  f"{report['errors'][entity_type]}")
+
+    def _sync(self, company_id, state, first=()):
+        access_token = self.tokens.access_token(company_id)
+        if access_token is None:
+            state['last_error'] = "No usable token (reconnect required)"
+            state['next_due'] = time.monotonic() + self._next_delay()
+            return
+
+        try:
+            report = self.engine.sync(company_id, access_token, first=first)
+        except Exception as e:
+            state['runs'] += 1
+            state['failures'] += 1
+            state['consecutive_failures'] += 1
+            state['last_error'] = str(e)
+            delay = min(backoff_delay(state['consecutive_failures'], base=BUSY_RETRY_SECONDS), self.interval)
+            state['next_due'] = time.monotonic() + delay
+            print(f"❌ Background sync failed for company {company_id}: {str(e)} (retry in {delay:.0f}s)")
+            return
+
+        state['runs'] += 1
+        state['consecutive_failures'] = 0
+        state['last_sync'] = self.engine.store.status(company_id)['last_sync']
+        state['last_result'] = {key: report[key] for key in ('mode', 'added', 'updated', 'deleted', 'duration_seconds')}
+        state['last_error'] = next(iter(report['errors'].values()), None)
+        state['next_due'] = time.monotonic() + self._next_delay()
+        print(f"⏰ Background {report['mode']} sync for company {company_id}: "
+              f"+{report['added']} ~{report['updated']} -{report['deleted']}")
+
+    def realm_info(self, company_id):
+        with self._lock:
+            state = dict(self._state(company_id))
+        return {
+            'policy': {'interval_seconds': self.interval, 'jitter': self.jitter},
+            'last_sync': state['last_sync'],
+            'next_sync_in_seconds': max(round(state['next_due'] - time.monotonic()), 0),
+            'last_result': state['last_result'],
+            'last_error': state['last_error'],
+            'runs': state['runs'],
+            'failures': state['failures'],
+            'deferred': state['deferred']
+        }
+
+    def info(self):
+        with self._lock:
+            realms = list(self._realms)
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'jitter': self.jitter,
+            'realms': {company_id: self.realm_info(company_id) for company_id in realms}
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_sync_scheduler():
+    """Return the process-wide sync scheduler"""
+    global _scheduler
+
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = SyncScheduler()
+
+    return _scheduler
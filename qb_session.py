@@ -0,0 +1,274 @@
+"""
+Server-Side Sessions
+
+Replaces Flask's signed-cookie session: the cookie carries only an opaque,
+random session id and the session data lives server-side, so dashboard
+requests no longer ship and HMAC-verify a multi-kilobyte cookie.
+
+Backends are pluggable (QB_SESSION_BACKEND):
+    sqlite - SQLite file shared by all worker processes, fronted by a small
+             in-memory LRU (default)
+    memory - in-memory LRU only (single process, e.g. local development)
+    cookie - Flask's built-in signed cookie session
+
+Usage:
+    from qb_session import init_session
+
+    init_session(app)
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from qb_store import QB_DATA_DIR
+
+QB_SESSION_BACKEND = os.getenv('QB_SESSION_BACKEND', 'sqlite').lower()
+QB_SESSION_DB = os.getenv('QB_SESSION_DB', os.path.join(QB_DATA_DIR, 'qb_sessions.db'))
+QB_SESSION_CACHE_SIZE = int(os.getenv('QB_SESSION_CACHE_SIZE', '1024'))
+
+# Unmodified sessions only have their expiry pushed back this often
+SESSION_TOUCH_INTERVAL = 300
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict that knows its server-side id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        self.rotated_from = None
+
+    def regenerate(self):
+        """Issue a fresh id for the same data (call after login to avoid session fixation)"""
+        if not self.new and self.rotated_from is None:
+            self.rotated_from = self.sid
+        self.sid = new_session_id()
+        self.modified = True
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class MemorySessionBackend:
+    """Bounded LRU of serialized sessions, local to this process"""
+
+    def __init__(self, max_entries=QB_SESSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # sid -> (data, expires_at)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def info(self):
+        with self._lock:
+            return {'backend': 'memory', 'cached_sessions': len(self._entries), 'max_entries': self.max_entries}
+
+
+class SQLiteSessionBackend:
+    """Sessions in SQLite (shared across worker processes) with an LRU in front
+
+    The LRU holds each session's serialized data together with its row
+    version; a read only fetches the blob from SQLite when another
+    process has written a newer version.
+    """
+
+    def __init__(self, path=QB_SESSION_DB, cache_size=QB_SESSION_CACHE_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self._cache = OrderedDict()   # sid -> (version, data, expires_at)
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self.stats = {'cache_hits': 0, 'db_reads': 0, 'writes': 0, 'purged': 0}
+        self._last_purge = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        conn.commit()
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections are not shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, sid, version, data, expires_at):
+        with self._lock:
+            self._cache[sid] = (version, data, expires_at)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def load(self, sid):
+        conn = self._conn()
+        row = conn.execute("SELECT version, expires_at FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None or row[1] <= time.time():
+            with self._lock:
+                self._cache.pop(sid, None)
+            return None
+
+        version, expires_at = row
+        with self._lock:
+            cached = self._cache.get(sid)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(sid)
+                self.stats['cache_hits'] += 1
+                return cached[1], expires_at
+
+        row = conn.execute("SELECT data, version FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        self.stats['db_reads'] += 1
+        self._remember(sid, row[1], row[0], expires_at)
+        return row[0], expires_at
+
+    def save(self, sid, data, expires_at):
+        conn = self._conn()
+        conn.execute("""
+            INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(sid) DO UPDATE SET
+                data = excluded.data, expires_at = excluded.expires_at, version = version + 1
+        """, (sid, data, expires_at))
+        version = conn.execute("SELECT version FROM sessions WHERE sid = ?", (sid,)).fetchone()[0]
+        conn.commit()
+        self.stats['writes'] += 1
+        self._remember(sid, version, data, expires_at)
+        self._purge_expired(conn)
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def _purge_expired(self, conn):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        purged = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        conn.commit()
+        self.stats['purged'] += purged
+
+    def info(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        with self._lock:
+            cached = len(self._cache)
+        return {'backend': 'sqlite', 'path': self.path, 'sessions': count,
+                'cached_sessions': cached, 'cache_size': self.cache_size, **self.stats}
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface storing session data in a backend, keyed by an opaque cookie id"""
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.backend.load(sid)
+            if entry is not None:
+                data, expires_at = entry
+                session = self.session_class(self.serializer.loads(data), sid=sid)
+                session.expires_at = expires_at
+                return session
+
+        return self.session_class(sid=new_session_id(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.rotated_from is not None:
+            self.backend.delete(session.rotated_from)
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        expires_at = time.time() + lifetime
+        stale = expires_at - getattr(session, 'expires_at', 0) > SESSION_TOUCH_INTERVAL
+        if not (session.modified or session.new or stale):
+            return
+
+        self.backend.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def create_backend(name=QB_SESSION_BACKEND):
+    if name == 'memory':
+        return MemorySessionBackend()
+    if name == 'sqlite':
+        return SQLiteSessionBackend()
+    raise ValueError(f"Unknown session backend: {name}")
+
+
+def init_session(app, backend=QB_SESSION_BACKEND):
+    """Install the configured session backend on a Flask app; returns the interface"""
+    if backend == 'cookie':
+        return app.session_interface
+
+    app.session_interface = ServerSideSessionInterface(create_backend(backend))
+    print(f"🍪 Server-side sessions enabled ({backend})")
+    return app.session_interface
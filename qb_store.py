@@ -0,0 +1,286 @@
+"""
+QuickBooks Local Mirror
+
+SQLite mirror of QuickBooks entities so dashboard views and exports read
+local data in milliseconds instead of pulling from QuickBooks every time.
+
+One table per entity type, keyed by (realm, Id, SyncToken), holding the raw
+QuickBooks JSON for the latest version of each record. The database runs in
+WAL mode so readers never block the sync writer.
+
+Besides the realm-wide CDC watermark, each (realm, entity) has its own
+watermark for incremental MetaData.LastUpdatedTime queries (see qb_sync).
+
+Usage:
+    from qb_store import get_store
+
+    store = get_store()
+    store.replace_entity(company_id, "Invoice", invoices)
+    invoices = store.get_records(company_id, "Invoice")
+"""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+QB_DATA_DIR = os.getenv('QB_DATA_DIR', 'data')
+QB_MIRROR_DB = os.getenv('QB_MIRROR_DB', os.path.join(QB_DATA_DIR, 'qb_mirror.db'))
+
+ENTITY_NAME_PATTERN = re.compile(r'^[A-Za-z]+$')
+
+
+class EntityStore:
+    """SQLite (WAL) mirror with one table per QuickBooks entity type"""
+
+    def __init__(self, path=QB_MIRROR_DB):
+        self.path = path
+        self._local = threading.local()
+        self._tables = set()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                realm TEXT PRIMARY KEY,
+                watermark TEXT,
+                last_sync TEXT
+            );
+            CREATE TABLE IF NOT EXISTS loaded_entities (
+                realm TEXT NOT NULL,
+                entity TEXT NOT NULL,
+                loaded_at TEXT NOT NULL,
+                PRIMARY KEY (realm, entity)
+            );
+            CREATE TABLE IF NOT EXISTS entity_watermarks (
+                realm TEXT NOT NULL,
+                entity TEXT NOT NULL,
+                watermark TEXT NOT NULL,
+                refreshed_at TEXT NOT NULL,
+                PRIMARY KEY (realm, entity)
+            );
+        """)
+        conn.commit()
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections are not shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _table(self, entity_type):
+        if not ENTITY_NAME_PATTERN.match(entity_type):
+            raise ValueError(f"Invalid entity type: {entity_type}")
+
+        table = f"entity_{entity_type.lower()}"
+        if table not in self._tables:
+            with self._lock:
+                conn = self._conn()
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        realm TEXT NOT NULL,
+                        id TEXT NOT NULL,
+                        sync_token TEXT NOT NULL,
+                        txn_date TEXT,
+                        last_updated TEXT,
+                        data TEXT NOT NULL,
+                        PRIMARY KEY (realm, id, sync_token)
+                    )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_realm_id ON {table} (realm, id)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_realm_txn_date ON {table} (realm, txn_date)")
+                conn.commit()
+                self._tables.add(table)
+        return table
+
+    def _row(self, realm, record):
+        return (
+            realm,
+            str(record.get('Id', '')),
+            str(record.get('SyncToken', '')),
+            record.get('TxnDate'),
+            record.get('MetaData', {}).get('LastUpdatedTime'),
+            json.dumps(record)
+        )
+
+    def _versions(self, conn, table, realm):
+        return dict(conn.execute(f"SELECT id, sync_token FROM {table} WHERE realm = ?", (realm,)).fetchall())
+
+    def replace_entity(self, realm, entity_type, records):
+        """Replace every stored record of an entity; returns (added, updated, deleted)"""
+        table = self._table(entity_type)
+        conn = self._conn()
+
+        with conn:
+            existing = self._versions(conn, table, realm)
+            fresh = {str(record.get('Id', '')): str(record.get('SyncToken', '')) for record in records}
+
+            conn.execute(f"DELETE FROM {table} WHERE realm = ?", (realm,))
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)",
+                [self._row(realm, record) for record in records]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO loaded_entities VALUES (?, ?, ?)",
+                (realm, entity_type, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            )
+
+        added = sum(1 for record_id in fresh if record_id not in existing)
+        updated = sum(1 for record_id, token in fresh.items()
+                      if record_id in existing and existing[record_id] != token)
+        deleted = sum(1 for record_id in existing if record_id not in fresh)
+        return added, updated, deleted
+
+    def apply_changes(self, realm, entity_type, records):
+        """Apply changed/deleted records (CDC style); returns (added, updated, deleted)"""
+        table = self._table(entity_type)
+        conn = self._conn()
+        added = updated = deleted = 0
+
+        with conn:
+            existing = self._versions(conn, table, realm)
+
+            for record in records:
+                record_id = str(record.get('Id', ''))
+
+                if record.get('status') == 'Deleted':
+                    if record_id in existing:
+                        conn.execute(f"DELETE FROM {table} WHERE realm = ? AND id = ?", (realm, record_id))
+                        existing.pop(record_id)
+                        deleted += 1
+                    continue
+
+                if record_id in existing:
+                    if existing[record_id] == str(record.get('SyncToken', '')):
+                        continue
+                    conn.execute(f"DELETE FROM {table} WHERE realm = ? AND id = ?", (realm, record_id))
+                    updated += 1
+                else:
+                    added += 1
+
+                conn.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)",
+                             self._row(realm, record))
+                existing[record_id] = str(record.get('SyncToken', ''))
+
+        return added, updated, deleted
+
+    def unload_entity(self, realm, entity_type):
+        """Mark an entity's local copy incomplete so the next sync reloads it (rows are kept)"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM loaded_entities WHERE realm = ? AND entity = ?", (realm, entity_type))
+            conn.execute("DELETE FROM entity_watermarks WHERE realm = ? AND entity = ?", (realm, entity_type))
+
+    def get_records(self, realm, entity_type, start_date=None, end_date=None):
+        """Stored records of an entity, optionally only those with TxnDate in [start_date, end_date]"""
+        table = self._table(entity_type)
+        conditions, params = ["realm = ?"], [realm]
+        if start_date:
+            conditions.append("txn_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("txn_date <= ?")
+            params.append(end_date)
+        rows = self._conn().execute(
+            f"SELECT data FROM {table} WHERE {' AND '.join(conditions)} ORDER BY CAST(id AS INTEGER)", params
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, realm, entity_type):
+        table = self._table(entity_type)
+        return self._conn().execute(f"SELECT COUNT(*) FROM {table} WHERE realm = ?", (realm,)).fetchone()[0]
+
+    def loaded_entities(self, realm):
+        rows = self._conn().execute("SELECT entity FROM loaded_entities WHERE realm = ?", (realm,)).fetchall()
+        return {row[0] for row in rows}
+
+    def is_loaded(self, realm, entity_type):
+        row = self._conn().execute(
+            "SELECT 1 FROM loaded_entities WHERE realm = ? AND entity = ?", (realm, entity_type)
+        ).fetchone()
+        return row is not None
+
+    def synced_at(self, realm, entity_type):
+        """When an entity's local copy was last brought up to date (ISO time), or None if not loaded"""
+        row = self._conn().execute("""
+            SELECT l.loaded_at, s.last_sync, w.refreshed_at FROM loaded_entities l
+            LEFT JOIN sync_state s ON s.realm = l.realm
+            LEFT JOIN entity_watermarks w ON w.realm = l.realm AND w.entity = l.entity
+            WHERE l.realm = ? AND l.entity = ?
+        """, (realm, entity_type)).fetchone()
+        if row is None:
+            return None
+        return max(value for value in row if value)
+
+    def get_watermark(self, realm):
+        row = self._conn().execute("SELECT watermark FROM sync_state WHERE realm = ?", (realm,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, realm, watermark):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                (realm, watermark, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            )
+
+    def get_entity_watermark(self, realm, entity_type):
+        row = self._conn().execute(
+            "SELECT watermark FROM entity_watermarks WHERE realm = ? AND entity = ?", (realm, entity_type)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_entity_watermark(self, realm, entity_type, watermark):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entity_watermarks VALUES (?, ?, ?, ?)",
+                (realm, entity_type, watermark, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            )
+
+    def entity_watermarks(self, realm):
+        rows = self._conn().execute(
+            "SELECT entity, watermark FROM entity_watermarks WHERE realm = ?", (realm,)
+        ).fetchall()
+        return dict(rows)
+
+    def status(self, realm):
+        row = self._conn().execute(
+            "SELECT watermark, last_sync FROM sync_state WHERE realm = ?", (realm,)
+        ).fetchone()
+        return {
+            'realm': realm,
+            'watermark': row[0] if row else None,
+            'last_sync': row[1] if row else None,
+            'entities': {entity: self.count(realm, entity) for entity in sorted(self.loaded_entities(realm))},
+            'entity_watermarks': self.entity_watermarks(realm)
+        }
+
+    def realms(self):
+        return [row[0] for row in self._conn().execute("SELECT realm FROM sync_state").fetchall()]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide mirror store"""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EntityStore()
+
+    return _store
@@ -0,0 +1,296 @@
+"""
+QuickBooks Incremental Sync Engine
+
+Keeps the local SQLite mirror (qb_store) of each connected company's
+QuickBooks data up to date with the Change Data Capture (CDC) endpoint, so
+endpoints no longer re-download the entire company history on every call.
+
+The first sync for a realm (or one whose watermark is older than the 30-day
+CDC window) does a full load. Later syncs ask /cdc for everything changed
+since the realm's watermark and apply adds, updates and deletions.
+
+refresh_entity() brings a single entity up to date without CDC's lookback
+limit: it queries WHERE MetaData.LastUpdatedTime > '<watermark>' using the
+entity's own watermark and upserts the changed rows by Id/SyncToken. Queries
+do not return deleted records, so deletions are still picked up by CDC syncs
+and full reloads.
+
+Usage:
+    from qb_sync import get_sync_engine
+
+    engine = get_sync_engine()
+    report = engine.sync(company_id, access_token)
+    engine.refresh_entity(company_id, access_token, "Invoice")
+    engine.refresh_entity(company_id, access_token, "Invoice", load=False)   # only if mirrored
+    invoices = engine.get_records(company_id, "Invoice")
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from qb_client import QuickBooksAPIError, get_client
+from qb_entities import cdc_entities
+from qb_ratelimit import PRIORITY_SYNC, request_priority
+from qb_store import get_store
+
+# Entities kept in the local copy (CDC accepts any of these)
+SYNC_ENTITIES = cdc_entities()
+
+# QuickBooks only answers CDC requests up to 30 days back
+CDC_MAX_LOOKBACK = timedelta(days=30)
+
+# CDC returns at most 1000 changed objects per entity per call
+CDC_MAX_RESULTS = 1000
+
+# Overlap each watermark slightly so clock skew never drops a change
+WATERMARK_SKEW = timedelta(seconds=60)
+
+# Stale-while-revalidate for list endpoints: past the soft TTL local data is
+# served and refreshed in the background, past the hard TTL it is refreshed first
+QB_SWR_SOFT_TTL = float(os.getenv('QB_SWR_SOFT_TTL', '300'))
+QB_SWR_HARD_TTL = float(os.getenv('QB_SWR_HARD_TTL', '3600'))
+
+# Bring synced entities up to date with LastUpdatedTime queries before serving them
+QB_INCREMENTAL_FETCH = os.getenv('QB_INCREMENTAL_FETCH', 'True').lower() == 'true'
+
+
+class SyncEngine:
+    """CDC-driven incremental sync into the per-realm local mirror"""
+
+    def __init__(self, client=None, store=None, entities=SYNC_ENTITIES):
+        self.client = client or get_client()
+        self.store = store or get_store()
+        self.entities = list(entities)
+
+        self._lock = threading.Lock()
+        self._realm_locks = {}
+        self._progress = {}
+
+    def _realm_lock(self, company_id):
+        with self._lock:
+            return self._realm_locks.setdefault(company_id, threading.Lock())
+
+    def has_synced(self, company_id):
+        return self.store.get_watermark(company_id) is not None
+
+    def watermark(self, company_id):
+        return self.store.get_watermark(company_id)
+
+    def get_records(self, company_id, entity_type, start_date=None, end_date=None):
+        """Records of one entity from the local mirror (optionally a TxnDate range), or None if not synced"""
+        if entity_type not in self.entities or not company_id:
+            return None
+        # A loaded entity is a complete snapshot, usable before the first sync finishes
+        if not self.store.is_loaded(company_id, entity_type):
+            return None
+
+        return self.store.get_records(company_id, entity_type, start_date, end_date)
+
+    def data_age(self, company_id, entity_type):
+        """Seconds since an entity's local copy was brought up to date, or None if not loaded"""
+        if not company_id:
+            return None
+        synced_at = self.store.synced_at(company_id, entity_type)
+        if synced_at is None:
+            return None
+        return max((datetime.now(timezone.utc) - datetime.fromisoformat(synced_at)).total_seconds(), 0.0)
+
+    def counts(self, company_id):
+        return {entity: self.store.count(company_id, entity) for entity in self.entities}
+
+    def progress(self, company_id):
+        """Per-entity state of the realm's current (or last) sync"""
+        with self._lock:
+            progress = self._progress.get(company_id)
+            if progress is None:
+                return {'running': False, 'mode': None, 'entities': {}}
+            return {**progress, 'entities': dict(progress['entities'])}
+
+    def _set_progress(self, company_id, entity_type, state):
+        with self._lock:
+            progress = self._progress.get(company_id)
+            if progress is not None:
+                progress['entities'][entity_type] = state
+
+    def sync(self, company_id, access_token, full=False, first=()):
+        """Bring the local mirror for a realm up to date and report what changed
+
+        A full load fetches the entities in first before the others, so the
+        ones a user looks at first become readable soonest.
+        """
+        with self._realm_lock(company_id), request_priority(PRIORITY_SYNC):
+            started = datetime.now(timezone.utc)
+            watermark = self.store.get_watermark(company_id)
+            watermark = datetime.fromisoformat(watermark) if watermark else None
+            full = full or watermark is None or started - watermark > CDC_MAX_LOOKBACK
+
+            entities = [entity for entity in first if entity in self.entities]
+            entities += [entity for entity in self.entities if entity not in entities]
+            with self._lock:
+                self._progress[company_id] = {
+                    'running': True,
+                    'mode': 'full' if full else 'incremental',
+                    'started_at': started.isoformat(timespec='seconds'),
+                    'entities': {entity: 'pending' for entity in entities}
+                }
+
+            try:
+                if full:
+                    report = self._full_sync(company_id, access_token, entities)
+                else:
+                    report = self._incremental_sync(company_id, access_token, watermark)
+            finally:
+                with self._lock:
+                    self._progress[company_id]['running'] = False
+
+            watermark = (started - WATERMARK_SKEW).isoformat(timespec='seconds')
+            self.store.set_watermark(company_id, watermark)
+            for entity_type in self.store.loaded_entities(company_id) - set(report['errors']):
+                self.store.set_entity_watermark(company_id, entity_type, watermark)
+            report['watermark'] = self.watermark(company_id)
+            report['duration_seconds'] = round((datetime.now(timezone.utc) - started).total_seconds(), 2)
+            return report
+
+    def refresh_entity(self, company_id, access_token, entity_type, load=True):
+        """Fetch one entity's rows changed since its watermark into the local mirror
+
+        Loads the entity in full the first time, unless load is False. Returns
+        a sync report, or None when the entity is not mirrored (and not to be
+        loaded) or a sync of the realm is already running (the local copy is
+        served as is meanwhile).
+        """
+        if entity_type not in self.entities or not company_id:
+            return None
+        if not load and not self.store.is_loaded(company_id, entity_type):
+            return None
+
+        lock = self._realm_lock(company_id)
+        if not lock.acquire(blocking=False):
+            if self.store.is_loaded(company_id, entity_type):
+                return None
+            lock.acquire()
+
+        try:
+            started = datetime.now(timezone.utc)
+            watermark = self.store.get_entity_watermark(company_id, entity_type)
+            report = self._new_report(company_id, 'incremental-query')
+
+            if watermark is None or not self.store.is_loaded(company_id, entity_type):
+                if not load:
+                    return None
+                report['mode'] = 'full'
+                self._reload_entity(company_id, access_token, entity_type, report)
+            else:
+                self._refresh_changed(company_id, access_token, entity_type, watermark, report)
+
+            if entity_type not in report['errors']:
+                self.store.set_entity_watermark(company_id, entity_type,
+                                                (started - WATERMARK_SKEW).isoformat(timespec='seconds'))
+            report['watermark'] = self.store.get_entity_watermark(company_id, entity_type)
+            report['duration_seconds'] = round((datetime.now(timezone.utc) - started).total_seconds(), 2)
+            return report
+        finally:
+            lock.release()
+
+    def _refresh_changed(self, company_id, access_token, entity_type, watermark, report):
+        try:
+            records = self.client.query_all(company_id, access_token, entity_type, use_cache=False,
+                                            where=f"MetaData.LastUpdatedTime > '{watermark}'")
+        except QuickBooksAPIError as e:
+            print(f"   ❌ {entity_type}: {str(e)}")
+            report['errors'][entity_type] = str(e)
+            return
+
+        added, updated, deleted = self.store.apply_changes(company_id, entity_type, records)
+        self._record(report, entity_type, added, updated, deleted)
+        print(f"🔄 {entity_type} for realm {company_id}: {len(records)} changed since {watermark}")
+
+    def _full_sync(self, company_id, access_token, entities):
+        print(f"🔄 Full sync for realm {company_id} ({len(entities)} entities)")
+        report = self._new_report(company_id, 'full')
+
+        for entity_type in entities:
+            self._reload_entity(company_id, access_token, entity_type, report)
+
+        return report
+
+    def _incremental_sync(self, company_id, access_token, watermark):
+        changed_since = watermark.isoformat(timespec='seconds')
+        print(f"🔄 CDC sync for realm {company_id} since {changed_since}")
+        report = self._new_report(company_id, 'incremental')
+
+        changes = self.client.cdc(company_id, access_token, self.entities, changed_since)
+        loaded = self.store.loaded_entities(company_id)
+
+        for entity_type in self.entities:
+            if entity_type not in changes:
+                self._set_progress(company_id, entity_type, 'loaded')
+
+        for entity_type, records in changes.items():
+            if entity_type not in loaded:
+                # Never loaded successfully (e.g. failed during the full sync)
+                self._reload_entity(company_id, access_token, entity_type, report)
+            elif len(records) >= CDC_MAX_RESULTS:
+                # CDC truncated this entity - reload it rather than miss changes
+                print(f"   {entity_type}: {len(records)} changes (CDC limit), reloading")
+                self._reload_entity(company_id, access_token, entity_type, report)
+            else:
+                added, updated, deleted = self.store.apply_changes(company_id, entity_type, records)
+                self._record(report, entity_type, added, updated, deleted)
+                self._set_progress(company_id, entity_type, 'loaded')
+
+        return report
+
+    def _reload_entity(self, company_id, access_token, entity_type, report):
+        self._set_progress(company_id, entity_type, 'loading')
+        try:
+            records = self.client.query_all(company_id, access_token, entity_type, use_cache=False)
+        except QuickBooksAPIError as e:
+            print(f"   ❌ {entity_type}: {str(e)}")
+            report['errors'][entity_type] = str(e)
+            self._set_progress(company_id, entity_type, 'error')
+            # The realm watermark still advances, so changes in this window would be
+            # lost; an unloaded entity is reloaded in full by the next sync instead
+            self.store.unload_entity(company_id, entity_type)
+            return
+
+        added, updated, deleted = self.store.replace_entity(company_id, entity_type, records)
+        self._record(report, entity_type, added, updated, deleted)
+        self._set_progress(company_id, entity_type, 'loaded')
+
+    def _new_report(self, company_id, mode):
+        return {
+            'company_id': company_id,
+            'mode': mode,
+            'added': 0,
+            'updated': 0,
+            'deleted': 0,
+            'by_entity': {},
+            'errors': {}
+        }
+
+    def _record(self, report, entity_type, added, updated, deleted):
+        report['added'] += added
+        report['updated'] += updated
+        report['deleted'] += deleted
+        if added or updated or deleted:
+            report['by_entity'][entity_type] = {'added': added, 'updated': updated, 'deleted': deleted}
+            # Cached live query results for this entity are now stale
+            if self.client.cache is not None:
+                self.client.cache.invalidate(report['company_id'], entity_type)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_sync_engine():
+    """Return the process-wide sync engine"""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = SyncEngine()
+
+    return _engine
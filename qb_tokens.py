@@ -0,0 +1,298 @@
+"""
+QuickBooks Token Manager
+
+Server-side store of each realm's OAuth tokens. Tokens are persisted in
+SQLite (shared by all worker processes) and the access token is refreshed
+proactively shortly before it expires, so long exports never hit a 401
+halfway through.
+
+Refreshes are single-flight: concurrent requests for the same realm wait on
+one refresh (a per-realm lock in this process, a short-lived claim on the
+realm's row across processes) and then reuse its result. The call to the
+OAuth endpoint happens outside any database transaction, and waiting on
+someone else's refresh never outlasts the current request's deadline.
+
+Usage:
+    from qb_tokens import get_token_manager
+
+    tokens = get_token_manager()
+    tokens.save(company_id, token_response)   # after the OAuth callback
+    access_token = tokens.access_token(company_id)
+"""
+
+import os
+import base64
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from qb_client import DeadlineExceeded, get_client
+from qb_deadline import current_deadline
+from qb_store import QB_DATA_DIR
+
+QB_TOKEN_DB = os.getenv('QB_TOKEN_DB', os.path.join(QB_DATA_DIR, 'qb_tokens.db'))
+
+# Refresh the access token this many seconds before it expires
+QB_TOKEN_REFRESH_MARGIN = float(os.getenv('QB_TOKEN_REFRESH_MARGIN', '300'))
+
+QB_OAUTH_TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
+
+# A refresh claim older than this is presumed abandoned (its process died)
+REFRESH_CLAIM_SECONDS = 90
+# How often a process waiting on another process's refresh re-reads the row
+REFRESH_POLL_INTERVAL = 0.2
+
+
+class TokenManager:
+    """Per-realm OAuth tokens with proactive, single-flight refresh"""
+
+    def __init__(self, client=None, client_id=None, client_secret=None, path=QB_TOKEN_DB,
+                 token_url=QB_OAUTH_TOKEN_URL, refresh_margin=QB_TOKEN_REFRESH_MARGIN):
+        self.client = client or get_client()
+        self.client_id = client_id if client_id is not None else os.getenv('QB_CLIENT_ID')
+        self.client_secret = client_secret if client_secret is not None else os.getenv('QB_CLIENT_SECRET')
+        self.path = path
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+
+        self._local = threading.local()
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._realm_locks = {}
+        self.stats = {'refreshes': 0, 'proactive_refreshes': 0, 'refreshes_after_401': 0,
+                      'shared_refreshes': 0, 'refresh_failures': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tokens (
+                realm TEXT PRIMARY KEY,
+                access_token TEXT NOT NULL,
+                refresh_token TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                refresh_expires_at REAL,
+                updated_at TEXT NOT NULL,
+                refresh_claimed_until REAL
+            )
+        """)
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(tokens)")]
+        if 'refresh_claimed_until' not in columns:
+            conn.execute("ALTER TABLE tokens ADD COLUMN refresh_claimed_until REAL")
+
+    def _conn(self):
+        """One autocommit connection per thread; transactions are explicit"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _realm_lock(self, company_id):
+        with self._lock:
+            return self._realm_locks.setdefault(company_id, threading.Lock())
+
+    def _load(self, conn, company_id):
+        row = conn.execute("SELECT * FROM tokens WHERE realm = ?", (company_id,)).fetchone()
+        tokens = dict(row) if row else None
+        with self._lock:
+            if tokens is None:
+                self._tokens.pop(company_id, None)
+            else:
+                self._tokens[company_id] = tokens
+        return tokens
+
+    def _write(self, conn, company_id, token_response):
+        now = time.time()
+        refresh_expires_in = token_response.get('x_refresh_token_expires_in')
+        tokens = {
+            'realm': company_id,
+            'access_token': token_response['access_token'],
+            'refresh_token': token_response['refresh_token'],
+            'expires_at': now + float(token_response.get('expires_in', 3600)),
+            'refresh_expires_at': now + float(refresh_expires_in) if refresh_expires_in else None,
+            'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+        conn.execute("""
+            INSERT OR REPLACE INTO tokens (realm, access_token, refresh_token, expires_at, refresh_expires_at, updated_at)
+            VALUES (:realm, :access_token, :refresh_token, :expires_at, :refresh_expires_at, :updated_at)
+        """, tokens)
+        with self._lock:
+            self._tokens[company_id] = tokens
+        return tokens
+
+    def save(self, company_id, token_response):
+        """Store the tokens returned by the OAuth code exchange (or a refresh)"""
+        return self._write(self._conn(), company_id, token_response)
+
+    def get(self, company_id):
+        """Stored tokens for a realm (dict), or None if it never connected"""
+        with self._lock:
+            tokens = self._tokens.get(company_id)
+        if tokens is None:
+            tokens = self._load(self._conn(), company_id)
+        return tokens
+
+    def remove(self, company_id):
+        self._conn().execute("DELETE FROM tokens WHERE realm = ?", (company_id,))
+        with self._lock:
+            self._tokens.pop(company_id, None)
+
+    def _expiring(self, tokens):
+        return tokens['expires_at'] - time.time() <= self.refresh_margin
+
+    def access_token(self, company_id):
+        """A valid access token for the realm, refreshing it first if it is about to expire"""
+        tokens = self.get(company_id)
+        if tokens is None:
+            return None
+        if not self._expiring(tokens):
+            return tokens['access_token']
+
+        return self.refresh(company_id, stale_token=tokens['access_token'], reason='proactive')
+
+    def refresh(self, company_id, stale_token=None, reason='after_401'):
+        """Refresh the realm's access token and return the new one
+
+        stale_token is the token the caller found unusable; if another thread
+        or process has already replaced it, that newer token is returned
+        without calling QuickBooks again. Returns None when the refresh token
+        is missing or rejected (the user has to reconnect). Raises
+        DeadlineExceeded if the current deadline runs out while another
+        thread or process is still refreshing.
+        """
+        deadline = current_deadline()
+        lock = self._realm_lock(company_id)
+        if not lock.acquire(timeout=deadline.remaining() if deadline is not None else -1):
+            raise DeadlineExceeded("Deadline passed waiting for a token refresh")
+
+        try:
+            conn = self._conn()
+            while True:
+                tokens, claim = self._claim_refresh(conn, company_id, stale_token)
+                if tokens is None:
+                    return None
+                if claim == 'claimed':
+                    break
+                if claim == 'shared':
+                    self._count('shared_refreshes')
+                    return tokens['access_token']
+                # Another process is refreshing this realm; wait for its result
+                if deadline is None:
+                    time.sleep(REFRESH_POLL_INTERVAL)
+                elif deadline.remaining() > 0:
+                    time.sleep(min(REFRESH_POLL_INTERVAL, deadline.remaining()))
+                else:
+                    raise DeadlineExceeded("Deadline passed waiting for another worker's token refresh")
+
+            token_response = self._request_refresh(company_id, tokens['refresh_token'])
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if token_response is None:
+                    conn.execute("UPDATE tokens SET refresh_claimed_until = NULL WHERE realm = ?", (company_id,))
+                    return None
+                tokens = self._write(conn, company_id, token_response)
+            finally:
+                conn.execute("COMMIT")
+        finally:
+            lock.release()
+
+        self._count('refreshes')
+        self._count('proactive_refreshes' if reason == 'proactive' else 'refreshes_after_401')
+        print(f"🔑 Refreshed access token for company {company_id} ({reason.replace('_', ' ')})")
+        return tokens['access_token']
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _claim_refresh(self, conn, company_id, stale_token):
+        """Re-read the realm's tokens and try to claim their refresh
+
+        Returns (tokens, claim): claim is 'shared' when another thread or
+        process already replaced stale_token, 'busy' while another process
+        holds the claim and 'claimed' when this caller should refresh.
+        tokens is None when the realm has no tokens.
+        """
+        # Serialise the check-and-claim with other worker processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens = self._load(conn, company_id)
+            if tokens is None:
+                return None, None
+            if stale_token and tokens['access_token'] != stale_token and not self._expiring(tokens):
+                return tokens, 'shared'
+
+            now = time.time()
+            if (tokens.get('refresh_claimed_until') or 0) > now:
+                return tokens, 'busy'
+            conn.execute("UPDATE tokens SET refresh_claimed_until = ? WHERE realm = ?",
+                         (now + REFRESH_CLAIM_SECONDS, company_id))
+            return tokens, 'claimed'
+        finally:
+            conn.execute("COMMIT")
+
+    def _request_refresh(self, company_id, refresh_token):
+        auth_string = f"{self.client_id}:{self.client_secret}"
+        headers = {
+            "Authorization": f"Basic {base64.b64encode(auth_string.encode('utf-8')).decode('utf-8')}",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+        data = {"grant_type": "refresh_token", "refresh_token": refresh_token}
+
+        try:
+            response = self.client.post(self.token_url, data=data, headers=headers)
+        except Exception as e:
+            print(f"❌ Token refresh failed for company {company_id}: {str(e)}")
+            self._count('refresh_failures')
+            return None
+
+        if response.status_code != 200:
+            print(f"❌ Token refresh failed for company {company_id}: {response.status_code} - {response.text[:200]}")
+            self._count('refresh_failures')
+            return None
+
+        return response.json()
+
+    def realms(self):
+        rows = self._conn().execute("SELECT realm FROM tokens ORDER BY realm").fetchall()
+        return [row['realm'] for row in rows]
+
+    def info(self):
+        """Token expiry per realm (never the tokens themselves)"""
+        now = time.time()
+        realms = {}
+        for company_id in self.realms():
+            tokens = self.get(company_id)
+            if tokens is None:
+                continue
+            refresh_expires_at = tokens.get('refresh_expires_at')
+            realms[company_id] = {
+                'access_token_expires_in': round(tokens['expires_at'] - now),
+                'refresh_token_expires_in': round(refresh_expires_at - now) if refresh_expires_at else None,
+                'updated_at': tokens['updated_at']
+            }
+        with self._lock:
+            stats = dict(self.stats)
+        return {'refresh_margin_seconds': self.refresh_margin, 'realms': realms, **stats}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_token_manager():
+    """Return the process-wide token manager"""
+    global _manager
+
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = TokenManager()
+
+    return _manager
@@ -0,0 +1,79 @@
+"""A connected test client in front of a fake QuickBooks API"""
+
+import json
+import os
+import tempfile
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+os.environ.setdefault('QB_DISK_CACHE_ENABLED', 'False')
+os.environ.setdefault('QB_SYNC_SCHEDULER_ENABLED', 'False')
+
+import pytest
+
+import app as datarift
+from qb_cache import CapabilityCache
+
+COMPANY_ID = '4620816365'
+
+RECORD = {'Id': '1', 'DocNumber': 'D1', 'TxnDate': '2025-01-02', 'TotalAmt': 10.0, 'Amount': 10.0,
+          'Line': [{'Amount': 10.0}],
+          'MetaData': {'CreateTime': '2025-01-02T10:00:00-08:00', 'LastUpdatedTime': '2025-01-02T10:00:00-08:00'}}
+
+PARSER_FAULT = json.dumps({"Fault": {"Error": [{"Message": "QueryParserError: Encountered \"Bogus\"",
+                                                "code": "4000"}], "type": "ValidationFault"}})
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(body) if not isinstance(body, str) else body
+        self.content = self.text.encode('utf-8')
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def query_entity(query):
+    return query.split(' FROM ')[1].split()[0]
+
+
+def query_response(query):
+    """COUNT(*) queries count one row; every other query returns RECORD"""
+    if 'COUNT(*)' in query:
+        return {'totalCount': 1}
+    return {query_entity(query): [RECORD]}
+
+
+def fake_quickbooks(method, url, hedge=False, **kwargs):
+    """Every entity has the same single record; queries naming the field Bogus get a parser fault"""
+    if method == 'POST':
+        queries = [item['Query'] for item in json.loads(kwargs['data'])['BatchItemRequest']]
+        return FakeResponse({'BatchItemResponse': [
+            {'bId': f"bid{i}", 'QueryResponse': query_response(query)} for i, query in enumerate(queries)
+        ]})
+
+    query = parse_qs(urlparse(url).query)['query'][0]
+    if 'Bogus' in query:
+        return FakeResponse(PARSER_FAULT, status_code=400)
+    return FakeResponse({'QueryResponse': query_response(query)})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(datarift.qb_client, '_read', fake_quickbooks)
+    monkeypatch.setattr(datarift.qb_client, 'capabilities', CapabilityCache())
+    if datarift.qb_client.cache is not None:
+        datarift.qb_client.cache.clear()
+
+    test_client = datarift.app.test_client()
+    with test_client.session_transaction() as session:
+        session['access_token'] = 'token'
+        session['company_id'] = COMPANY_ID
+    yield test_client
+
+    # Exports load entities into the local mirror; later tests start without it
+    store = datarift.sync_engine.store
+    for entity_type in store.loaded_entities(COMPANY_ID):
+        store.unload_entity(COMPANY_ID, entity_type)
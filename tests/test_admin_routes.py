@@ -0,0 +1,144 @@
+"""Admin routes act on the connected company unless the admin token is sent"""
+
+import os
+import tempfile
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+os.environ.setdefault('QB_DISK_CACHE_ENABLED', 'False')
+os.environ.setdefault('QB_SYNC_SCHEDULER_ENABLED', 'False')
+
+import pytest
+
+import app as datarift
+from qb_cache import QueryCache, query_key
+
+ADMIN_TOKEN = 'admin-secret'
+INVOICES_1 = query_key('1', 'SELECT * FROM Invoice', 65)
+INVOICES_2 = query_key('2', 'SELECT * FROM Invoice', 65)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = QueryCache()
+    cache.set(INVOICES_1, b'{}')
+    cache.set(INVOICES_2, b'{}')
+    monkeypatch.setattr(datarift.qb_client, 'cache', cache)
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+    return cache
+
+
+def connected_client(company_id='1'):
+    client = datarift.app.test_client()
+    with client.session_transaction() as session:
+        session['access_token'] = 'token'
+        session['company_id'] = company_id
+    return client
+
+
+def test_invalidate_needs_a_session_or_the_admin_token(cache):
+    client = datarift.app.test_client()
+
+    assert client.post('/api/admin/cache/invalidate').status_code == 401
+    assert client.post('/api/admin/cache/invalidate', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    assert cache.get(INVOICES_2) is not None
+
+
+def test_cache_stats_need_a_session_or_the_admin_token(cache):
+    assert datarift.app.test_client().get('/api/admin/cache').status_code == 401
+
+    response = connected_client('1').get('/api/admin/cache')
+    assert response.status_code == 200
+    assert response.get_json()['entries'] == 2
+
+
+def test_invalidate_is_limited_to_the_connected_company(cache):
+    client = connected_client('1')
+
+    assert client.post('/api/admin/cache/invalidate?realm=2').status_code == 403
+
+    response = client.post('/api/admin/cache/invalidate')
+    assert response.get_json()['realm'] == '1'
+    assert cache.get(INVOICES_1) is None
+    assert cache.get(INVOICES_2) is not None
+
+
+def test_admin_token_may_invalidate_any_company(cache):
+    client = datarift.app.test_client()
+
+    response = client.post('/api/admin/cache/invalidate?realm=2', headers={'X-Admin-Token': ADMIN_TOKEN})
+
+    assert response.status_code == 200
+    assert cache.get(INVOICES_2) is None
+
+
+def test_token_status_lists_only_the_connected_company(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+    for company_id in ('1', '2'):
+        datarift.token_manager.save(company_id, {'access_token': 'a', 'refresh_token': 'r', 'expires_in': 3600})
+
+    assert datarift.app.test_client().get('/api/admin/tokens').status_code == 401
+    assert set(connected_client('1').get('/api/admin/tokens').get_json()['realms']) == {'1'}
+
+    response = datarift.app.test_client().get('/api/admin/tokens', headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert {'1', '2'} <= set(response.get_json()['realms'])
+
+
+def test_scheduler_status_lists_only_the_connected_company(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+    for company_id in ('1', '2'):
+        datarift.sync_scheduler.sync_soon(company_id)
+
+    assert datarift.app.test_client().get('/api/admin/scheduler').status_code == 401
+    assert set(connected_client('2').get('/api/admin/scheduler').get_json()['realms']) == {'2'}
+
+    response = datarift.app.test_client().get('/api/admin/scheduler', headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert {'1', '2'} <= set(response.get_json()['realms'])
+
+
+def test_breaker_status_lists_only_the_connected_company(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+    for company_id in ('1', '2'):
+        datarift.qb_client.breakers.get(company_id)
+
+    assert datarift.app.test_client().get('/api/admin/breakers').status_code == 401
+    assert set(connected_client('1').get('/api/admin/breakers').get_json()['realms']) == {'1'}
+
+    response = datarift.app.test_client().get('/api/admin/breakers', headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert {'1', '2'} <= set(response.get_json()['realms'])
+
+
+def test_rate_limit_stats_list_only_the_connected_company(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+    for company_id in ('1', '2'):
+        datarift.qb_client.scheduler.realm(company_id)
+
+    assert datarift.app.test_client().get('/api/admin/rate-limit').status_code == 401
+    assert set(connected_client('2').get('/api/admin/rate-limit').get_json()['realms']) == {'2'}
+
+    response = datarift.app.test_client().get('/api/admin/rate-limit', headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert {'1', '2'} <= set(response.get_json()['realms'])
+
+
+def test_fetch_stats_need_a_session_or_the_admin_token(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+
+    assert datarift.app.test_client().get('/api/admin/fetch-stats').status_code == 401
+    assert connected_client('1').get('/api/admin/fetch-stats').status_code == 200
+    assert datarift.app.test_client().get('/api/admin/fetch-stats', headers={'X-Admin-Token': ADMIN_TOKEN}).status_code == 200
+
+
+def test_session_status_shows_only_counts_without_the_admin_token(monkeypatch):
+    monkeypatch.setattr(datarift, 'QB_ADMIN_TOKEN', ADMIN_TOKEN)
+
+    assert datarift.app.test_client().get('/api/admin/sessions').status_code == 401
+
+    info = connected_client('1').get('/api/admin/sessions').get_json()
+    assert all(name == 'backend' or isinstance(value, int) for name, value in info.items())
+
+    response = datarift.app.test_client().get('/api/admin/sessions', headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert response.status_code == 200
+
+
+def test_http_pool_stats_need_a_session_or_the_admin_token():
+    assert datarift.app.test_client().get('/api/admin/http-pool').status_code == 401
+    assert connected_client('1').get('/api/admin/http-pool').status_code == 200
@@ -0,0 +1,48 @@
+"""Many queries go to QuickBooks as /batch POSTs of up to 30 queries each"""
+
+import math
+
+import pytest
+
+import app as datarift
+from conftest import COMPANY_ID, fake_quickbooks
+from qb_client import QB_BATCH_MAX_ITEMS
+from qb_entities import entities_in
+
+
+@pytest.fixture
+def posts(client, monkeypatch):
+    sent = []
+
+    def read(method, url, hedge=False, **kwargs):
+        sent.append(method)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+    return sent
+
+
+@pytest.mark.parametrize('path', ['/api/counts', '/new_dashboard', '/api/export/summary-csv'])
+def test_page_queries_go_out_in_one_batch_post(client, posts, path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert posts == ['POST']
+
+
+def test_summary_export_counts_every_summary_entity(client, posts):
+    lines = client.get('/api/export/summary-csv').get_data(as_text=True).strip().splitlines()
+
+    assert lines[0] == 'Entity_Type,Total_Records,Status,Error_Message'
+    assert [line.split(',')[0] for line in lines[1:]] == list(entities_in('summary'))
+    assert all(line.split(',')[1:3] == ['1', 'Success'] for line in lines[1:])
+
+
+@pytest.mark.parametrize('count', [QB_BATCH_MAX_ITEMS, QB_BATCH_MAX_ITEMS + 1, 2 * QB_BATCH_MAX_ITEMS + 5])
+def test_one_post_per_chunk_of_30_queries(client, posts, count):
+    queries = [f"SELECT COUNT(*) FROM Invoice WHERE Id = '{i}'" for i in range(count)]
+
+    results = datarift.qb_client.batch(COMPANY_ID, 'token', queries)
+
+    assert posts == ['POST'] * math.ceil(count / QB_BATCH_MAX_ITEMS)
+    assert [result['QueryResponse']['totalCount'] for result in results] == [1] * count
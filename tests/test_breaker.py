@@ -0,0 +1,55 @@
+"""Circuit breaker state transitions"""
+
+import time
+
+from qb_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def breaker():
+    return CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=5,
+                          open_seconds=0.1, half_open_calls=2)
+
+
+def test_breaker_opens_probes_and_closes_again():
+    circuit = breaker()
+    for healthy in (True, False, True, False):
+        assert circuit.allow()
+        circuit.record(healthy)
+    assert circuit.state == OPEN
+    assert not circuit.allow()
+
+    time.sleep(0.15)
+    assert circuit.allow()
+    assert circuit.state == HALF_OPEN
+    assert circuit.allow()
+    # Only half_open_calls trial calls go out at once
+    assert not circuit.allow()
+
+    circuit.record(True)
+    circuit.record(True)
+    assert circuit.state == CLOSED
+    assert circuit.allow()
+
+
+def test_failed_trial_call_reopens_the_breaker():
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(False)
+    time.sleep(0.15)
+
+    assert circuit.allow()
+    circuit.record(False)
+
+    assert circuit.state == OPEN
+    assert circuit.stats['opened'] == 2
+
+
+def test_slow_calls_count_as_failures_and_throttling_does_not():
+    circuit = breaker()
+    circuit.throttled(10)
+    for _ in range(4):
+        circuit.record(True, latency=6)
+
+    assert circuit.state == OPEN
+    assert circuit.stats['throttled'] == 10
+    assert circuit.stats['last_failure'].startswith('slow call')
@@ -0,0 +1,113 @@
+"""Request deadlines cap QuickBooks calls and stop them once spent or cancelled"""
+
+import time
+
+import pytest
+
+import app as datarift
+from conftest import FakeResponse, fake_quickbooks
+from qb_client import DeadlineExceeded, QuickBooksClient, RequestCancelled
+from qb_deadline import QB_EXPORT_DEADLINE, QB_REQUEST_DEADLINE, Deadline, current_deadline, deadline_scope
+
+API_URL = 'https://example.invalid/v3/company/1/query?query=SELECT'
+
+
+@pytest.fixture
+def qb():
+    """A client whose HTTP session records what it would send"""
+    client = QuickBooksClient(pool_size=2, timeout=(5, 60))
+    client.sent = []
+
+    def request(method, url, **kwargs):
+        client.sent.append(kwargs)
+        return FakeResponse({'QueryResponse': {}})
+
+    client.session.request = request
+    yield client
+    client.close()
+
+
+def test_scope_sets_and_restores_the_current_deadline():
+    outer, inner = Deadline(10), Deadline(1)
+    with deadline_scope(outer):
+        with deadline_scope(inner):
+            assert current_deadline() is inner
+        assert current_deadline() is outer
+    assert current_deadline() is None
+
+
+def test_cancel_callback_is_polled_at_most_every_interval():
+    polls = []
+    deadline = Deadline(10, is_cancelled=lambda: polls.append(1) or False)
+
+    for _ in range(5):
+        assert not deadline.cancelled
+    assert len(polls) == 1
+
+    deadline.cancel()
+    assert deadline.cancelled and deadline.done
+
+
+def test_http_timeouts_are_capped_to_the_time_left(qb):
+    with deadline_scope(Deadline(2)):
+        qb.request('GET', API_URL)
+
+    connect, read = qb.sent[0]['timeout']
+    assert connect <= 2 and read <= 2
+
+
+def test_no_call_starts_once_the_deadline_is_spent(qb):
+    deadline = Deadline(0.05)
+    time.sleep(0.1)
+
+    with deadline_scope(deadline), pytest.raises(DeadlineExceeded):
+        qb.request('GET', API_URL)
+    assert qb.sent == []
+
+
+def test_no_call_starts_after_the_client_disconnected(qb):
+    deadline = Deadline(10)
+    deadline.cancel()
+
+    with deadline_scope(deadline), pytest.raises(RequestCancelled):
+        qb.request('GET', API_URL)
+    assert qb.sent == []
+
+
+def test_fan_out_workers_share_the_callers_deadline(qb, monkeypatch):
+    seen = []
+    monkeypatch.setattr(qb, 'query', lambda *args, **kwargs: seen.append(current_deadline()))
+    deadline = Deadline(10)
+
+    with deadline_scope(deadline):
+        qb.query_many('1', 'token', [f"SELECT * FROM Entity{i}" for i in range(4)])
+
+    assert seen == [deadline] * 4
+
+
+@pytest.mark.parametrize('path, seconds', [('/api/export/summary-csv', QB_EXPORT_DEADLINE),
+                                           ('/api/counts', QB_REQUEST_DEADLINE)])
+def test_bulk_exports_get_the_longer_deadline(client, monkeypatch, path, seconds):
+    seen = []
+
+    def read(method, url, hedge=False, **kwargs):
+        seen.append(current_deadline().seconds)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+
+    assert client.get(path).status_code == 200
+    assert seen and set(seen) == {seconds}
+
+
+def test_disconnected_client_gets_a_partial_response_without_calls(client, monkeypatch):
+    sent = []
+    monkeypatch.setattr(datarift.qb_client, '_read', QuickBooksClient._read.__get__(datarift.qb_client))
+    monkeypatch.setattr(datarift.qb_client.session, 'request', lambda *args, **kwargs: sent.append(args))
+    monkeypatch.setattr(datarift, 'client_disconnected', lambda environ: True)
+
+    response = client.get('/api/transactions/raw')
+
+    assert sent == []
+    assert response.headers['X-Partial-Response'] == 'true'
+    assert 'Invoice' in response.headers['X-Missing-Entities'].split(',')
@@ -0,0 +1,33 @@
+"""The disk tier is invalidated from disk and only written by cacheable reads"""
+
+import os
+import tempfile
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+from qb_cache import DiskCache, QueryCache, query_key
+
+INVOICES = query_key('1', 'SELECT * FROM Invoice', 65)
+CUSTOMERS = query_key('1', 'SELECT * FROM Customer', 65)
+
+
+def test_invalidate_deletes_entries_written_by_another_process(tmp_path):
+    this_worker = DiskCache(directory=str(tmp_path))
+    this_worker.info()   # index built before the other worker writes
+    other_worker = DiskCache(directory=str(tmp_path))
+    other_worker.set(INVOICES, b'{"invoices": []}', expires_at=2e9)
+    other_worker.set(CUSTOMERS, b'{"customers": []}', expires_at=2e9)
+
+    assert this_worker.invalidate(company_id='1', entity_type='Invoice') == 1
+    assert other_worker.get(INVOICES) is None
+    assert other_worker.get(CUSTOMERS) is not None
+
+
+def test_uncached_reads_stay_out_of_the_disk_tier(tmp_path):
+    disk = DiskCache(directory=str(tmp_path))
+    cache = QueryCache(l2=disk)
+
+    cache.set(INVOICES, b'{}', persist=False)
+
+    assert cache.get(INVOICES) == b'{}'
+    assert disk.get(INVOICES) is None
@@ -0,0 +1,81 @@
+"""List endpoints refresh only the entity they serve"""
+
+import threading
+
+import pytest
+
+import app as datarift
+from conftest import COMPANY_ID, RECORD, fake_quickbooks
+
+STORE = datarift.sync_engine.store
+
+
+def test_forced_refresh_queries_only_the_requested_entity(client, monkeypatch):
+    sent = []
+
+    def read(method, url, hedge=False, **kwargs):
+        sent.append(url)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+    STORE.replace_entity(COMPANY_ID, 'Customer', [RECORD])
+    STORE.set_entity_watermark(COMPANY_ID, 'Customer', '2025-01-01T00:00:00+00:00')
+    try:
+        response = client.get('/api/customers?refresh=true')
+    finally:
+        STORE.unload_entity(COMPANY_ID, 'Customer')
+
+    assert response.status_code == 200
+    assert 'X-Data-Age' in response.headers
+    assert sent and all('Customer' in url and 'LastUpdatedTime' in url for url in sent)
+
+
+def test_soft_stale_hit_refreshes_only_the_requested_entity_in_the_background(client, monkeypatch):
+    sent = []
+
+    def read(method, url, hedge=False, **kwargs):
+        sent.append(url)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    threads = []
+    revalidate = datarift.sync_scheduler.revalidate
+
+    def record_revalidate(*args):
+        threads.append(revalidate(*args))
+        return threads[-1]
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+    monkeypatch.setattr(datarift, 'QB_SWR_SOFT_TTL', 0)
+    monkeypatch.setattr(datarift.sync_scheduler, 'revalidate', record_revalidate)
+    monkeypatch.setattr(datarift.sync_scheduler, 'warm', lambda *args, **kwargs: pytest.fail("realm-wide sync"))
+    STORE.replace_entity(COMPANY_ID, 'Customer', [RECORD])
+    STORE.set_entity_watermark(COMPANY_ID, 'Customer', '2025-01-01T00:00:00+00:00')
+    try:
+        response = client.get('/api/customers')
+        assert response.headers['X-Data-Revalidating'] == 'true'
+        assert len(threads) == 1
+        threads[0].join(5)
+    finally:
+        STORE.unload_entity(COMPANY_ID, 'Customer')
+
+    assert response.status_code == 200
+    assert sent and all('Customer' in url and 'LastUpdatedTime' in url for url in sent)
+
+
+def test_soft_stale_refresh_runs_once_per_realm_and_entity(monkeypatch):
+    release = threading.Event()
+    refreshed = []
+
+    def refresh_entity(company_id, access_token, entity_type):
+        refreshed.append((company_id, entity_type))
+        release.wait(5)
+
+    monkeypatch.setattr(datarift.sync_scheduler.engine, 'refresh_entity', refresh_entity)
+    first = datarift.sync_scheduler.revalidate(COMPANY_ID, 'token', 'Customer')
+    assert datarift.sync_scheduler.revalidate(COMPANY_ID, 'token', 'Customer') is first
+    other = datarift.sync_scheduler.revalidate(COMPANY_ID, 'token', 'Vendor')
+    release.set()
+    first.join(5)
+    other.join(5)
+
+    assert sorted(refreshed) == [(COMPANY_ID, 'Customer'), (COMPANY_ID, 'Vendor')]
@@ -0,0 +1,19 @@
+"""Registry-driven views keep their established output"""
+
+
+def test_standardized_transactions_keep_their_labels(client):
+    transactions = client.get('/api/transactions/pandas').get_json()['transactions']
+    by_type = {transaction['type']: transaction for transaction in transactions}
+
+    assert by_type['Purchase']['description'] == 'Expense - D1'
+    assert by_type['Purchase']['status'] == 'Completed'
+    assert by_type['JournalEntry']['description'] == 'D1'
+    assert by_type['JournalEntry']['status'] == 'Unknown'
+    assert (by_type['Bill']['amount'], by_type['Bill']['description'], by_type['Bill']['status']) == (0, '', 'Unknown')
+
+
+def test_overview_dashboard_renders_every_overview_entity(client):
+    response = client.get('/new_dashboard')
+
+    assert response.status_code == 200
+    assert 'Customers (1)' in response.get_data(as_text=True)
@@ -0,0 +1,46 @@
+"""Exports run as background jobs and report what they had to leave out"""
+
+import time
+
+import pytest
+from flask import Response, g
+
+import app as datarift
+
+
+def finished_job(client, job_id):
+    for _ in range(200):
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['state'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+@pytest.mark.parametrize('kind', sorted(datarift.EXPORT_JOBS))
+def test_every_registered_export_runs_as_a_job(client, kind):
+    response = client.post(f'/api/jobs/exports/{kind}')
+    assert response.status_code == 202
+
+    job = finished_job(client, response.get_json()['job_id'])
+
+    assert job['state'] == 'succeeded', job['error']
+    assert job['progress']['entities_done'] > 0
+    download = client.get(response.get_json()['download_url'])
+    assert download.status_code == 200
+    assert download.data
+
+
+def test_job_records_missing_entities_of_a_partial_export(client, monkeypatch):
+    def partial_export():
+        g.partial_entities = ['Invoice']
+        return Response(b'data', mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=export.csv'})
+
+    monkeypatch.setitem(datarift.app.view_functions, datarift.EXPORT_JOBS['transactions-excel'], partial_export)
+
+    job = finished_job(client, client.post('/api/jobs/exports/transactions-excel').get_json()['job_id'])
+
+    assert job['state'] == 'succeeded'
+    assert job['partial'] is True
+    assert job['missing_entities'] == ['Invoice']
@@ -0,0 +1,75 @@
+"""Queries for several entities run concurrently and merge in query order"""
+
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_client import QB_MAX_CONCURRENT_REQUESTS, QuickBooksAPIError, QuickBooksClient
+from qb_ratelimit import PRIORITY_BULK, current_priority, request_priority
+
+
+@pytest.fixture
+def client():
+    client = QuickBooksClient(pool_size=2)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def in_flight(client, monkeypatch):
+    """Fake query() that records how many queries were running at once"""
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0, 'priorities': []}
+
+    def query(company_id, access_token, query, use_cache=True):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            state['priorities'].append(current_priority())
+        try:
+            # Later queries finish first, so the merge order cannot come from completion order
+            time.sleep(0.05 * (3 - int(query.split()[-1]) % 3))
+            if query.endswith(' 4'):
+                raise QuickBooksAPIError("Unsupported entity", status_code=400)
+            return {'QueryResponse': {'query': query}}
+        finally:
+            with lock:
+                state['running'] -= 1
+
+    monkeypatch.setattr(client, 'query', query)
+    return state
+
+
+def test_results_come_back_in_query_order_with_errors_in_place(client, in_flight):
+    queries = [f"SELECT * FROM Entity {i}" for i in range(6)]
+
+    results = client.query_many('1', 'token', queries)
+
+    assert isinstance(results[4], QuickBooksAPIError)
+    assert [result['QueryResponse']['query'] for i, result in enumerate(results) if i != 4] == \
+        [query for i, query in enumerate(queries) if i != 4]
+    assert in_flight['peak'] > 1
+
+
+def test_fan_out_never_exceeds_the_realm_concurrency_limit(client, in_flight):
+    client.query_many('1', 'token', [f"SELECT * FROM Entity {i}" for i in range(25)], max_workers=50)
+
+    assert 1 < in_flight['peak'] <= QB_MAX_CONCURRENT_REQUESTS
+
+
+def test_one_worker_fetches_sequentially(client, in_flight):
+    client.query_many('1', 'token', [f"SELECT * FROM Entity {i}" for i in range(4)], max_workers=1)
+
+    assert in_flight['peak'] == 1
+
+
+def test_worker_threads_keep_the_callers_priority(client, in_flight):
+    with request_priority(PRIORITY_BULK):
+        client.query_many('1', 'token', [f"SELECT * FROM Entity {i}" for i in range(4)])
+
+    assert in_flight['priorities'] == [PRIORITY_BULK] * 4
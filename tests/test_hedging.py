@@ -0,0 +1,85 @@
+"""A hedge is only sent when the primary itself is slow"""
+
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_client import QB_HEDGE_MIN_SAMPLES, CircuitOpen, DeadlineExceeded, QuickBooksAPIError, QuickBooksClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = QuickBooksClient(pool_size=2)
+    client.hedge_enabled = True
+    for _ in range(QB_HEDGE_MIN_SAMPLES):
+        client.latency.observe(0.05)
+    monkeypatch.setattr(client, '_timed', lambda method, url, **kwargs: 'response')
+    yield client
+    client.close()
+
+
+def test_fast_primary_queued_behind_other_calls_sends_no_hedge(client):
+    release = threading.Event()
+    for _ in range(client.pool_size):
+        client._hedge_pool.submit(release.wait)
+    threading.Timer(0.3, release.set).start()
+
+    assert client._hedged('GET', 'https://example.invalid/query') == 'response'
+    assert client.fetch_stats['hedges'] == 0
+
+
+def test_slow_primary_is_hedged(client, monkeypatch):
+    calls = []
+
+    def timed(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'primary'
+        return 'backup'
+
+    monkeypatch.setattr(client, '_timed', timed)
+
+    assert client._hedged('GET', 'https://example.invalid/query') == 'backup'
+    assert client.fetch_stats['hedges'] == 1
+
+
+@pytest.mark.parametrize('failure', [QuickBooksAPIError("throttled", status_code=429),
+                                     CircuitOpen('1', retry_after=30),
+                                     DeadlineExceeded()])
+def test_failed_primary_loses_to_a_successful_hedge(client, monkeypatch, failure):
+    calls = []
+
+    def timed(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise failure
+        # The primary fails while the hedge is still in flight
+        time.sleep(0.4)
+        return 'backup'
+
+    monkeypatch.setattr(client, '_timed', timed)
+
+    assert client._hedged('GET', 'https://example.invalid/query') == 'backup'
+    assert client.fetch_stats['hedge_wins'] == 1
+
+
+def test_hedged_call_fails_only_when_both_legs_fail(client, monkeypatch):
+    calls = []
+
+    def timed(method, url, **kwargs):
+        calls.append(url)
+        time.sleep(0.2 if len(calls) == 1 else 0)
+        raise QuickBooksAPIError(f"leg {len(calls)} failed", status_code=503)
+
+    monkeypatch.setattr(client, '_timed', timed)
+
+    with pytest.raises(QuickBooksAPIError):
+        client._hedged('GET', 'https://example.invalid/query')
+    assert len(calls) == 2
@@ -0,0 +1,66 @@
+"""One keep-alive connection serves many calls, and every call gets the default timeout"""
+
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+import requests
+
+from qb_client import QuickBooksClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.5)
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    client = QuickBooksClient(pool_size=2, timeout=(1, 0.2))
+    yield client
+    client.close()
+
+
+def test_sequential_calls_reuse_one_connection(client, server):
+    for _ in range(5):
+        assert client.request('GET', f"{server}/token").status_code == 200
+
+    stats = client.pool_stats()[server]
+    assert stats['connections_opened'] == 1
+    assert stats['requests'] == 5
+    assert stats['reused_requests'] == 4
+
+
+def test_calls_without_a_timeout_get_the_client_default(client, server):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.request('GET', f"{server}/slow")
+
+
+def test_an_explicit_timeout_overrides_the_default(client, server):
+    assert client.request('GET', f"{server}/slow", timeout=2).status_code == 200
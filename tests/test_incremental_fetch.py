@@ -0,0 +1,51 @@
+"""Exports refresh mirrored entities by watermark and flag copies they could not refresh"""
+
+import pytest
+
+import app as datarift
+from conftest import COMPANY_ID, RECORD, FakeResponse, fake_quickbooks
+
+STORE = datarift.sync_engine.store
+
+
+@pytest.fixture
+def queries(client, monkeypatch):
+    """Queries sent to QuickBooks; LastUpdatedTime queries fail with a 500"""
+    sent = []
+
+    def read(method, url, hedge=False, **kwargs):
+        sent.append(url)
+        if 'LastUpdatedTime' in url:
+            return FakeResponse('Internal Server Error', status_code=500)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+    unload_mirror()
+    yield sent
+    unload_mirror()
+
+
+def unload_mirror():
+    for entity_type in STORE.loaded_entities(COMPANY_ID):
+        STORE.unload_entity(COMPANY_ID, entity_type)
+
+
+def test_failed_refresh_marks_the_mirrored_entity_partial(client, queries):
+    STORE.replace_entity(COMPANY_ID, 'Invoice', [RECORD])
+    STORE.set_entity_watermark(COMPANY_ID, 'Invoice', '2025-01-01T00:00:00+00:00')
+
+    response = client.get('/api/transactions/export/pandas')
+
+    assert response.status_code == 200
+    assert any('LastUpdatedTime' in url for url in queries)
+    assert response.headers['X-Partial-Response'] == 'true'
+    assert 'Invoice' in response.headers['X-Missing-Entities'].split(',')
+
+
+def test_filtered_export_does_not_load_an_unmirrored_entity_in_full(client, queries):
+    response = client.get('/api/transactions/export/pandas?start_date=2025-01-01')
+
+    assert response.status_code == 200
+    assert not STORE.is_loaded(COMPANY_ID, 'Invoice')
+    invoice_queries = [url for url in queries if 'FROM%20Invoice' in url or 'FROM+Invoice' in url]
+    assert invoice_queries and all('TxnDate' in url for url in invoice_queries)
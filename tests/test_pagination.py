@@ -0,0 +1,67 @@
+"""COUNT(*)-planned page windows and the walk past rows added after the count"""
+
+import os
+import re
+import tempfile
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from conftest import FakeResponse
+from qb_client import QuickBooksClient
+
+
+@pytest.fixture
+def client():
+    client = QuickBooksClient()
+    yield client
+    client.close()
+
+
+def test_plan_pages_covers_the_count_in_full_pages(client):
+    assert client.plan_pages(0, page_size=1000) == []
+    assert client.plan_pages(2500, page_size=1000) == [(1, 1000), (1001, 1000), (2001, 1000)]
+
+
+def test_plan_pages_shrinks_only_the_last_window_to_max_records(client):
+    assert client.plan_pages(2500, page_size=1000, max_records=1500) == [(1, 1000), (1001, 500)]
+    # A short count still asks for a full page, so a full page reveals rows added since
+    assert client.plan_pages(300, page_size=1000, max_records=1500) == [(1, 1000)]
+
+
+def invoices_table(rows, counted):
+    """QuickBooks with `rows` invoices whose COUNT(*) still reports `counted`"""
+    sent = []
+
+    def read(method, url, hedge=False, **kwargs):
+        query = parse_qs(urlparse(url).query)['query'][0]
+        sent.append(query)
+        if 'COUNT(*)' in query:
+            return FakeResponse({'QueryResponse': {'totalCount': counted}})
+        start, size = map(int, re.search(r'STARTPOSITION (\d+) MAXRESULTS (\d+)', query).groups())
+        page = [{'Id': str(i)} for i in range(start, min(start + size, rows + 1))]
+        return FakeResponse({'QueryResponse': {'Invoice': page} if page else {}})
+
+    return read, sent
+
+
+def test_rows_added_after_the_count_are_walked(client, monkeypatch):
+    read, sent = invoices_table(rows=5, counted=2)
+    monkeypatch.setattr(client, '_read', read)
+
+    records = client.query_all('1', 'token', 'Invoice', page_size=2, use_cache=False)
+
+    assert [record['Id'] for record in records] == ['1', '2', '3', '4', '5']
+    assert sum('STARTPOSITION' in query for query in sent) == 3
+
+
+def test_walk_stops_at_max_records(client, monkeypatch):
+    read, sent = invoices_table(rows=10, counted=2)
+    monkeypatch.setattr(client, '_read', read)
+
+    records = client.query_all('1', 'token', 'Invoice', page_size=2, max_records=3, use_cache=False)
+
+    assert [record['Id'] for record in records] == ['1', '2', '3']
+    assert sum('STARTPOSITION' in query for query in sent) == 2
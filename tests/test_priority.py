@@ -0,0 +1,65 @@
+"""Interactive requests are admitted ahead of sync and bulk work"""
+
+import threading
+import time
+
+import pytest
+
+import app as datarift
+from conftest import fake_quickbooks
+from qb_ratelimit import (PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SYNC, RateScheduler, current_priority,
+                          request_priority)
+
+
+def test_priority_applies_only_inside_its_scope():
+    assert current_priority() == PRIORITY_INTERACTIVE
+    with request_priority(PRIORITY_SYNC):
+        assert current_priority() == PRIORITY_SYNC
+        with request_priority(PRIORITY_BULK):
+            assert current_priority() == PRIORITY_BULK
+        assert current_priority() == PRIORITY_SYNC
+    assert current_priority() == PRIORITY_INTERACTIVE
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with request_priority('urgent'):
+            pass
+
+
+@pytest.mark.parametrize('path, priority', [('/api/export/summary-csv', PRIORITY_BULK),
+                                            ('/api/counts', PRIORITY_INTERACTIVE)])
+def test_views_call_quickbooks_at_their_declared_priority(client, monkeypatch, path, priority):
+    seen = []
+
+    def read(method, url, hedge=False, **kwargs):
+        seen.append(current_priority())
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(datarift.qb_client, '_read', read)
+
+    assert client.get(path).status_code == 200
+    assert seen and set(seen) == {priority}
+
+
+def test_queued_interactive_request_goes_ahead_of_earlier_bulk_requests():
+    scheduler = RateScheduler(rate_per_minute=6000, burst=100, max_concurrent=1)
+    admitted = []
+
+    def call(priority):
+        with scheduler.slot('1', priority=priority, timeout=5):
+            admitted.append(priority)
+
+    with scheduler.slot('1'):
+        waiters = []
+        for priority in (PRIORITY_BULK, PRIORITY_BULK, PRIORITY_INTERACTIVE):
+            waiters.append(threading.Thread(target=call, args=(priority,)))
+            waiters[-1].start()
+            while sum(scheduler.realm('1').concurrency.queue_depths().values()) < len(waiters):
+                time.sleep(0.01)
+
+    for waiter in waiters:
+        waiter.join(5)
+
+    assert admitted == [PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BULK]
+    assert scheduler.realm('1').info()['by_priority'][PRIORITY_BULK]['requests'] == 2
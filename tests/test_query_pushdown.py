@@ -0,0 +1,43 @@
+"""A rejected field list fails the request without disabling the entity"""
+
+import pytest
+
+import app as datarift
+from conftest import COMPANY_ID, PARSER_FAULT, FakeResponse
+from qb_cache import CapabilityCache
+from qb_client import QuickBooksAPIError
+
+
+def test_bogus_field_is_a_bad_request_and_keeps_the_entity(client):
+    response = client.get('/api/transactions/raw?fields=Bogus')
+
+    assert response.status_code == 400
+    assert 'rejected' in response.get_json()['error']
+    assert datarift.qb_client.capabilities.get(COMPANY_ID, 'Invoice') is not False
+
+    response = client.get('/api/transactions/raw')
+
+    assert response.status_code == 200
+    assert 'Invoice' in response.get_json()['summary']['by_type']
+
+
+def test_bogus_field_fails_an_export_instead_of_emptying_it(client):
+    response = client.get('/api/transactions/export/pandas?fields=Bogus')
+
+    assert response.status_code == 400
+    assert 'rejected' in response.get_json()['error']
+
+
+def test_only_plain_probe_faults_mark_an_entity_unsupported(monkeypatch):
+    monkeypatch.setattr(datarift.qb_client, '_read', lambda *args, **kwargs: FakeResponse(PARSER_FAULT, status_code=400))
+    capabilities = CapabilityCache()
+    monkeypatch.setattr(datarift.qb_client, 'capabilities', capabilities)
+
+    for query in ("SELECT Id, Bogus FROM Invoice", "SELECT * FROM Invoice WHERE TxnDate >= '2025-01-01'"):
+        with pytest.raises(QuickBooksAPIError):
+            datarift.qb_client.query('1', 'token', query, use_cache=False)
+        assert capabilities.get('1', 'Invoice') is None
+
+    with pytest.raises(QuickBooksAPIError):
+        datarift.qb_client.query('1', 'token', "SELECT COUNT(*) FROM Invoice", use_cache=False)
+    assert capabilities.get('1', 'Invoice') is False
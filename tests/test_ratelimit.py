@@ -0,0 +1,87 @@
+"""AIMD concurrency limit, weighted admission of priority classes and rate tokens"""
+
+import pytest
+
+from qb_ratelimit import (PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_SYNC, AdaptiveLimit, RateScheduler,
+                          SlotTimeout, _Waiter)
+
+
+def test_congestion_halves_the_limit_and_healthy_responses_grow_it_back():
+    limit = AdaptiveLimit(initial=8, max_limit=10)
+
+    assert limit.acquire()
+    limit.release(congested=True)
+    assert limit.limit == 4
+
+    assert limit.acquire()
+    limit.release(latency=0.1)
+    assert limit.info()['concurrency_limit'] == 4
+
+    releases = 1
+    while limit.limit < 8:
+        assert limit.acquire()
+        limit.release(latency=0.1)
+        releases += 1
+
+    # About one step per full window of successes (4 + 5 + 6 + 7)
+    assert 20 <= releases <= 26
+
+
+def test_a_burst_of_congestion_signals_halves_the_limit_once():
+    limit = AdaptiveLimit(initial=8, max_limit=10)
+
+    for _ in range(3):
+        assert limit.acquire()
+    for _ in range(3):
+        limit.release(congested=True)
+
+    assert limit.limit == 4
+    assert limit.stats['decreases'] == 1
+
+
+def test_latency_spike_counts_as_congestion():
+    limit = AdaptiveLimit(initial=8, max_limit=10, latency_factor=3)
+    assert limit.acquire()
+    limit.release(latency=0.1)
+
+    assert limit.acquire()
+    limit.release(latency=1.0)
+
+    assert limit.stats['latency_spikes'] == 1
+    assert limit.limit < 8
+
+
+def test_freed_slots_go_to_priority_classes_by_weight():
+    limit = AdaptiveLimit(initial=1, max_limit=1,
+                          weights={PRIORITY_INTERACTIVE: 8, PRIORITY_SYNC: 3, PRIORITY_BULK: 1})
+    assert limit.acquire()
+    for priority in limit.weights:
+        limit._waiting[priority].extend(_Waiter() for _ in range(12))
+
+    granted = []
+    for _ in range(12):
+        depths = limit.queue_depths()
+        limit.cancel()
+        granted += [priority for priority, depth in limit.queue_depths().items() if depth < depths[priority]]
+
+    assert granted.count(PRIORITY_INTERACTIVE) == 8
+    assert granted.count(PRIORITY_SYNC) == 3
+    # Bulk work still gets its share while interactive requests are queued
+    assert granted.count(PRIORITY_BULK) == 1
+
+
+def test_slot_timeout_gives_its_rate_token_back():
+    scheduler = RateScheduler(rate_per_minute=6, burst=1)
+    with scheduler.slot('1', timeout=1):
+        pass
+    bucket = scheduler.realm('1').bucket
+    balance = bucket.tokens
+
+    # The next token is ten seconds away, so admission gives up without sending
+    with pytest.raises(SlotTimeout):
+        with scheduler.slot('1', timeout=0.1):
+            pass
+
+    assert balance <= bucket.tokens < balance + 0.1
+    # The next caller waits for one token, not for the abandoned one as well
+    assert bucket.reserve() < 11
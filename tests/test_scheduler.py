@@ -0,0 +1,155 @@
+"""Background syncs are spread out, deferred while the realm is busy and back off after failures"""
+
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_client import QuickBooksAPIError
+from qb_ratelimit import QB_BACKOFF_MAX, RateScheduler
+from qb_scheduler import BUSY_RETRY_SECONDS, SyncScheduler
+
+INTERVAL = 100
+JITTER = 0.2
+
+
+class FakeEngine:
+    def __init__(self):
+        self.last_sync = None
+        self.failing = False
+        self.syncs = []
+        self.retry_after = 0
+        self.client = SimpleNamespace(
+            scheduler=RateScheduler(),
+            breakers=SimpleNamespace(enabled=True, get=lambda company_id: SimpleNamespace(
+                retry_after=lambda: self.retry_after))
+        )
+        self.store = SimpleNamespace(status=lambda company_id: {'last_sync': self.last_sync})
+
+    def sync(self, company_id, access_token, first=()):
+        self.syncs.append((company_id, access_token, tuple(first)))
+        if self.failing:
+            raise QuickBooksAPIError("Service unavailable", status_code=503)
+        self.last_sync = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        return {'mode': 'cdc', 'added': 1, 'updated': 0, 'deleted': 0, 'duration_seconds': 0.1, 'errors': {}}
+
+
+class FakeTokens:
+    def __init__(self):
+        self.tokens = {'1': 'token'}
+
+    def access_token(self, company_id):
+        return self.tokens.get(company_id)
+
+    def realms(self):
+        return list(self.tokens)
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine()
+
+
+@pytest.fixture
+def scheduler(engine):
+    return SyncScheduler(engine=engine, tokens=FakeTokens(), interval=INTERVAL, jitter=JITTER)
+
+
+def due_in(scheduler, company_id='1'):
+    return scheduler._realms[company_id]['next_due'] - time.monotonic()
+
+
+def test_sync_intervals_are_jittered_around_the_interval(scheduler):
+    delays = [scheduler._next_delay() for _ in range(200)]
+
+    assert all(INTERVAL * (1 - JITTER) <= delay <= INTERVAL * (1 + JITTER) for delay in delays)
+    assert len({round(delay, 3) for delay in delays}) > 100
+
+
+def test_first_syncs_are_spread_over_the_jitter_window(scheduler):
+    for company_id in map(str, range(50)):
+        scheduler._state(company_id)
+
+    first = [due_in(scheduler, company_id) for company_id in map(str, range(50))]
+    assert all(-1 <= seconds <= INTERVAL * JITTER for seconds in first)
+    assert max(first) - min(first) > 1
+
+
+def test_successful_sync_schedules_the_next_one_an_interval_later(scheduler, engine):
+    scheduler._run('1')
+
+    info = scheduler.realm_info('1')
+    assert engine.syncs == [('1', 'token', ())]
+    assert info['runs'] == 1 and info['last_error'] is None
+    assert info['last_result']['mode'] == 'cdc'
+    assert INTERVAL * (1 - JITTER) - 1 <= due_in(scheduler) <= INTERVAL * (1 + JITTER)
+
+
+def test_failures_back_off_and_a_success_resets_the_backoff(scheduler, engine):
+    engine.failing = True
+    delays = []
+    for _ in range(3):
+        scheduler._run('1')
+        delays.append(due_in(scheduler))
+
+    state = scheduler._realms['1']
+    assert state['consecutive_failures'] == 3 and state['failures'] == 3
+    # Retries come sooner than the next regular sync, but never within BUSY_RETRY_SECONDS
+    assert all(BUSY_RETRY_SECONDS - 1 <= delay <= QB_BACKOFF_MAX for delay in delays)
+
+    engine.failing = False
+    scheduler._run('1')
+    assert state['consecutive_failures'] == 0 and state['last_error'] is None
+    assert due_in(scheduler) >= INTERVAL * (1 - JITTER) - 1
+
+
+def test_failure_backoff_never_exceeds_the_interval(engine):
+    scheduler = SyncScheduler(engine=engine, tokens=FakeTokens(), interval=20, jitter=JITTER)
+    engine.failing = True
+
+    for _ in range(3):
+        scheduler._run('1')
+        assert due_in(scheduler) <= 20
+
+
+def test_sync_waits_while_interactive_requests_are_queued(scheduler, engine):
+    engine.client.scheduler.realm('1').queued = 1
+
+    scheduler._run('1')
+
+    assert engine.syncs == []
+    assert scheduler._realms['1']['deferred'] == 1
+    assert BUSY_RETRY_SECONDS - 1 <= due_in(scheduler) <= BUSY_RETRY_SECONDS
+
+
+def test_sync_waits_for_an_open_circuit(scheduler, engine):
+    engine.retry_after = 42
+
+    scheduler._run('1')
+
+    assert engine.syncs == []
+    assert scheduler.realm_info('1')['last_result'] == 'deferred: circuit open'
+    assert 41 <= due_in(scheduler) <= 42
+
+
+def test_realm_synced_recently_by_another_worker_is_skipped(scheduler, engine):
+    engine.last_sync = (datetime.now(timezone.utc) - timedelta(seconds=10)).isoformat(timespec='seconds')
+
+    scheduler._run('1')
+
+    assert engine.syncs == []
+    assert due_in(scheduler) <= INTERVAL * (1 + JITTER) - 10 + 1
+
+
+def test_realm_without_a_usable_token_is_not_synced(scheduler, engine):
+    scheduler.tokens.tokens.clear()
+
+    scheduler._run('1')
+
+    assert engine.syncs == []
+    assert 'reconnect' in scheduler.realm_info('1')['last_error']
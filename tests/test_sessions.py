@@ -0,0 +1,129 @@
+"""Session data stays server-side; the cookie carries only an opaque id"""
+
+import os
+import tempfile
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+from flask import Flask, jsonify, session
+
+from qb_session import MemorySessionBackend, ServerSideSessionInterface, SQLiteSessionBackend
+
+COOKIE = 'session'
+
+
+def make_app(backend):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ServerSideSessionInterface(backend)
+
+    @app.route('/login')
+    def login():
+        session.regenerate()
+        session['company_id'] = '4620816365'
+        session['access_token'] = 'token-' + 'x' * 1000
+        return 'ok'
+
+    @app.route('/whoami')
+    def whoami():
+        return jsonify(company_id=session.get('company_id'))
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteSessionBackend(path=str(tmp_path / 'sessions.db'))
+    return MemorySessionBackend()
+
+
+@pytest.fixture
+def client(backend):
+    return make_app(backend).test_client()
+
+
+def sid(client):
+    cookie = client.get_cookie(COOKIE)
+    return cookie.value if cookie else None
+
+
+def test_cookie_carries_only_the_session_id(client, backend):
+    client.get('/login')
+
+    assert len(sid(client)) < 64
+    assert 'token' not in sid(client)
+    assert backend.load(sid(client)) is not None
+    assert client.get('/whoami').json == {'company_id': '4620816365'}
+
+
+def test_login_issues_a_fresh_id_and_drops_the_old_one(client, backend):
+    client.get('/whoami')
+    client.get('/login')
+    first = sid(client)
+
+    client.get('/login')
+
+    assert sid(client) != first
+    assert backend.load(first) is None
+    assert client.get('/whoami').json == {'company_id': '4620816365'}
+
+
+def test_a_planted_session_id_is_not_adopted(client, backend):
+    client.set_cookie(COOKIE, 'chosen-by-attacker')
+    client.get('/login')
+
+    assert sid(client) != 'chosen-by-attacker'
+    assert backend.load('chosen-by-attacker') is None
+
+
+def test_logout_deletes_the_server_side_session(client, backend):
+    client.get('/login')
+    old = sid(client)
+
+    client.get('/logout')
+
+    assert backend.load(old) is None
+    assert sid(client) is None
+
+
+def test_sessions_are_shared_across_worker_processes(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    first, second = SQLiteSessionBackend(path=path), SQLiteSessionBackend(path=path)
+    worker_a, worker_b = make_app(first).test_client(), make_app(second).test_client()
+
+    worker_a.get('/login')
+    worker_b.set_cookie(COOKIE, sid(worker_a))
+
+    assert worker_b.get('/whoami').json == {'company_id': '4620816365'}
+
+
+def test_unchanged_sessions_are_read_from_the_cache_without_writes(tmp_path):
+    backend = SQLiteSessionBackend(path=str(tmp_path / 'sessions.db'))
+    client = make_app(backend).test_client()
+    client.get('/login')
+    writes = backend.stats['writes']
+
+    for _ in range(3):
+        client.get('/whoami')
+
+    assert backend.stats['writes'] == writes
+    assert backend.stats['cache_hits'] >= 3
+    assert backend.stats['db_reads'] == 0
+
+
+def test_memory_backend_evicts_the_least_recently_used_session():
+    backend = MemorySessionBackend(max_entries=2)
+    for name in ('a', 'b'):
+        backend.save(name, '{}', expires_at=float('inf'))
+    backend.load('a')
+    backend.save('c', '{}', expires_at=float('inf'))
+
+    assert backend.load('b') is None
+    assert backend.load('a') is not None and backend.load('c') is not None
@@ -0,0 +1,152 @@
+"""Concurrent identical QuickBooks calls share one in-flight execution"""
+
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from conftest import fake_quickbooks
+from qb_cache import SingleFlight
+from qb_client import DeadlineExceeded, QuickBooksAPIError, QuickBooksClient, RequestCancelled
+from qb_deadline import Deadline, deadline_scope
+
+
+class Leader:
+    """Runs one SingleFlight call in a thread and holds it open until released"""
+
+    def __init__(self, flight, key='key', result='result', error=None):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.runs = 0
+        self.outcome = []
+
+        def fn():
+            self.runs += 1
+            self.entered.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+
+        self.fn = fn
+        self.thread = threading.Thread(target=self._run, args=(flight, key))
+        self.thread.start()
+        assert self.entered.wait(5)
+
+    def _run(self, flight, key):
+        try:
+            self.outcome.append(flight.do(key, self.fn))
+        except Exception as e:
+            self.outcome.append(e)
+
+
+def run_waiters(flight, count, fn=lambda: 'own result', key='key', deadline=None):
+    """Start `count` callers of the same key; returns (threads, outcomes) once all are waiting"""
+    outcomes = []
+    before = flight.stats['coalesced']
+
+    def call():
+        try:
+            with deadline_scope(deadline):
+                outcomes.append(flight.do(key, fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    while flight.stats['coalesced'] < before + count:
+        time.sleep(0.01)
+    return threads, outcomes
+
+
+def finish(leader, threads):
+    leader.release.set()
+    for thread in [leader.thread, *threads]:
+        thread.join(5)
+
+
+@pytest.fixture
+def flight():
+    client = QuickBooksClient(pool_size=2)
+    yield SingleFlight(client._check_deadline, local_errors=(DeadlineExceeded, RequestCancelled))
+    client.close()
+
+
+def test_concurrent_callers_share_the_leaders_result(flight):
+    leader = Leader(flight)
+    threads, outcomes = run_waiters(flight, 4)
+    finish(leader, threads)
+
+    assert leader.runs == 1
+    assert leader.outcome == [('result', False)]
+    assert outcomes == [('result', True)] * 4
+    assert flight.stats == {'executions': 1, 'coalesced': 4, 'taken_over': 0}
+
+
+def test_a_quickbooks_error_is_shared_too(flight):
+    error = QuickBooksAPIError("Service unavailable", status_code=503)
+    leader = Leader(flight, error=error)
+    threads, outcomes = run_waiters(flight, 2)
+    finish(leader, threads)
+
+    assert outcomes == [error, error]
+
+
+def test_waiter_takes_over_when_the_leader_ran_out_of_its_own_deadline(flight):
+    leader = Leader(flight, error=DeadlineExceeded())
+    threads, outcomes = run_waiters(flight, 1)
+    finish(leader, threads)
+
+    assert outcomes == [('own result', False)]
+    assert flight.stats['taken_over'] == 1
+
+
+def test_waiting_ends_with_the_waiters_deadline(flight):
+    leader = Leader(flight)
+    threads, outcomes = run_waiters(flight, 1, deadline=Deadline(0.2))
+    threads[0].join(2)
+
+    assert len(outcomes) == 1 and isinstance(outcomes[0], DeadlineExceeded)
+    finish(leader, threads)
+    assert leader.outcome == [('result', False)]
+
+
+def test_identical_queries_send_one_request_and_parse_separately(monkeypatch):
+    client = QuickBooksClient(pool_size=2)
+    sent = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    def read(method, url, hedge=False, **kwargs):
+        sent.append(url)
+        entered.set()
+        release.wait(5)
+        return fake_quickbooks(method, url, hedge=hedge, **kwargs)
+
+    monkeypatch.setattr(client, '_read', read)
+    results = []
+
+    def query():
+        results.append(client.query('1', 'token', "SELECT * FROM Invoice"))
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    threads[0].start()
+    assert entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while client.singleflight.stats['coalesced'] < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    client.close()
+
+    assert len(sent) == 1
+    assert len(results) == 3
+    results[0]['QueryResponse']['Invoice'].clear()
+    assert results[1]['QueryResponse']['Invoice'] and results[2]['QueryResponse']['Invoice']
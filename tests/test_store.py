@@ -0,0 +1,93 @@
+"""The SQLite mirror keeps one current version per record, per realm"""
+
+import os
+import tempfile
+import threading
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_store import EntityStore
+
+
+def invoice(record_id, sync_token='0', txn_date='2025-01-15', amount=10.0):
+    return {'Id': record_id, 'SyncToken': sync_token, 'TxnDate': txn_date, 'TotalAmt': amount,
+            'MetaData': {'LastUpdatedTime': f"{txn_date}T10:00:00-08:00"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EntityStore(path=str(tmp_path / 'mirror.db'))
+
+
+def test_replace_counts_added_updated_and_deleted_records(store):
+    assert store.replace_entity('1', 'Invoice', [invoice('1'), invoice('2')]) == (2, 0, 0)
+
+    assert store.replace_entity('1', 'Invoice', [invoice('1', sync_token='1', amount=20.0), invoice('3')]) == (1, 1, 1)
+    assert [(record['Id'], record['TotalAmt']) for record in store.get_records('1', 'Invoice')] == \
+        [('1', 20.0), ('3', 10.0)]
+    assert store.is_loaded('1', 'Invoice')
+    assert store.synced_at('1', 'Invoice') is not None
+
+
+def test_changes_keep_only_the_latest_version_of_a_record(store):
+    store.replace_entity('1', 'Invoice', [invoice('1'), invoice('2')])
+
+    counts = store.apply_changes('1', 'Invoice', [
+        invoice('1', sync_token='1', amount=30.0),
+        invoice('2'),  # same SyncToken: unchanged
+        invoice('5'),
+        {'Id': '2', 'status': 'Deleted'}
+    ])
+
+    assert counts == (1, 1, 1)
+    assert [(record['Id'], record['TotalAmt']) for record in store.get_records('1', 'Invoice')] == \
+        [('1', 30.0), ('5', 10.0)]
+    assert store.count('1', 'Invoice') == 2
+
+
+def test_records_filter_by_transaction_date_and_sort_by_numeric_id(store):
+    store.replace_entity('1', 'Invoice', [invoice('10', txn_date='2025-03-01'), invoice('9', txn_date='2025-02-01'),
+                                         invoice('2', txn_date='2025-01-01')])
+
+    assert [record['Id'] for record in store.get_records('1', 'Invoice')] == ['2', '9', '10']
+    assert [record['Id'] for record in store.get_records('1', 'Invoice', start_date='2025-02-01')] == ['9', '10']
+    assert [record['Id'] for record in store.get_records('1', 'Invoice', end_date='2025-02-01')] == ['2', '9']
+
+
+def test_realms_are_kept_apart(store):
+    store.replace_entity('1', 'Invoice', [invoice('1')])
+    store.replace_entity('2', 'Invoice', [invoice('1', amount=99.0), invoice('2')])
+
+    assert store.count('1', 'Invoice') == 1
+    assert store.get_records('1', 'Invoice')[0]['TotalAmt'] == 10.0
+    assert store.loaded_entities('2') == {'Invoice'}
+
+
+def test_unloaded_entity_keeps_its_rows_until_the_next_load(store):
+    store.replace_entity('1', 'Invoice', [invoice('1')])
+    store.set_entity_watermark('1', 'Invoice', '2025-01-01T00:00:00+00:00')
+
+    store.unload_entity('1', 'Invoice')
+
+    assert not store.is_loaded('1', 'Invoice')
+    assert store.get_entity_watermark('1', 'Invoice') is None
+    assert store.synced_at('1', 'Invoice') is None
+    assert store.count('1', 'Invoice') == 1
+
+
+def test_invalid_entity_names_never_reach_sql(store):
+    with pytest.raises(ValueError):
+        store.get_records('1', 'Invoice; DROP TABLE sync_state')
+
+
+def test_readers_in_other_threads_see_committed_writes(store):
+    store.replace_entity('1', 'Invoice', [invoice('1'), invoice('2')])
+    seen = []
+
+    reader = threading.Thread(target=lambda: seen.append(store.count('1', 'Invoice')))
+    reader.start()
+    reader.join()
+
+    assert seen == [2]
@@ -0,0 +1,91 @@
+"""CDC sync applies adds, updates and deletes and never trusts a failed reload"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_client import QuickBooksAPIError
+from qb_store import EntityStore
+from qb_sync import SyncEngine
+
+
+class FakeClient:
+    """Serves full loads from `tables` and CDC requests from `changes`"""
+
+    cache = None
+
+    def __init__(self):
+        self.tables = {'Invoice': [{'Id': '1', 'SyncToken': '0'}, {'Id': '2', 'SyncToken': '0'}],
+                       'Customer': [{'Id': '7', 'SyncToken': '0'}]}
+        self.changes = {}
+        self.failing = set()
+
+    def query_all(self, company_id, access_token, entity_type, use_cache=True, where=None):
+        if entity_type in self.failing:
+            raise QuickBooksAPIError("Service unavailable", status_code=503)
+        return list(self.tables[entity_type])
+
+    def cdc(self, company_id, access_token, entities, changed_since):
+        return self.changes
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def engine(client, tmp_path):
+    return SyncEngine(client=client, store=EntityStore(path=str(tmp_path / 'mirror.db')),
+                      entities=['Invoice', 'Customer'])
+
+
+def ids(engine, entity_type):
+    return sorted(record['Id'] for record in engine.get_records('1', entity_type))
+
+
+def test_cdc_sync_upserts_and_deletes_rows_and_advances_the_watermark(engine, client):
+    engine.sync('1', 'token')
+    an_hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat(timespec='seconds')
+    engine.store.set_watermark('1', an_hour_ago)
+
+    client.changes = {'Invoice': [{'Id': '2', 'SyncToken': '1'},
+                                  {'Id': '3', 'SyncToken': '0'},
+                                  {'Id': '1', 'status': 'Deleted'}]}
+    report = engine.sync('1', 'token')
+
+    assert report['mode'] == 'incremental'
+    assert (report['added'], report['updated'], report['deleted']) == (1, 1, 1)
+    assert ids(engine, 'Invoice') == ['2', '3']
+    assert [record['SyncToken'] for record in engine.get_records('1', 'Invoice') if record['Id'] == '2'] == ['1']
+    assert engine.watermark('1') > an_hour_ago
+
+
+def test_failed_reload_leaves_the_entity_unloaded_until_a_later_sync(engine, client):
+    client.failing = {'Invoice'}
+
+    report = engine.sync('1', 'token')
+
+    assert 'Invoice' in report['errors']
+    assert not engine.store.is_loaded('1', 'Invoice')
+    assert engine.get_records('1', 'Invoice') is None
+    assert ids(engine, 'Customer') == ['7']
+
+    client.failing = set()
+    client.changes = {'Invoice': [], 'Customer': []}
+    engine.sync('1', 'token')
+
+    assert ids(engine, 'Invoice') == ['1', '2']
+
+
+def test_failed_reload_of_a_loaded_entity_unloads_it(engine, client):
+    engine.sync('1', 'token')
+    client.failing = {'Invoice'}
+
+    engine.sync('1', 'token', full=True)
+
+    assert not engine.store.is_loaded('1', 'Invoice')
@@ -0,0 +1,39 @@
+"""Waiting on another worker's token refresh stays within the request deadline"""
+
+import os
+import tempfile
+import time
+
+os.environ.setdefault('QB_DATA_DIR', tempfile.mkdtemp(prefix='datarift-test-'))
+
+import pytest
+
+from qb_client import DeadlineExceeded
+from qb_deadline import Deadline, deadline_scope
+from qb_tokens import TokenManager
+
+
+@pytest.fixture
+def tokens(tmp_path):
+    manager = TokenManager(client=object(), client_id='id', client_secret='secret', path=str(tmp_path / 'tokens.db'))
+    manager.save('1', {'access_token': 'old', 'refresh_token': 'r', 'expires_in': 0})
+    # Another worker process claimed the refresh and has not finished it
+    manager._conn().execute("UPDATE tokens SET refresh_claimed_until = ? WHERE realm = '1'", (time.time() + 60,))
+    return manager
+
+
+def test_wait_for_another_workers_refresh_ends_with_the_deadline(tokens):
+    started = time.monotonic()
+    with deadline_scope(Deadline(0.3)), pytest.raises(DeadlineExceeded):
+        tokens.refresh('1', stale_token='old')
+
+    assert time.monotonic() - started < 2
+
+
+def test_refresh_finished_by_another_worker_is_shared(tokens):
+    tokens._conn().execute("UPDATE tokens SET access_token = 'new', expires_at = ?, refresh_claimed_until = NULL",
+                           (time.time() + 3600,))
+
+    with deadline_scope(Deadline(0.3)):
+        assert tokens.refresh('1', stale_token='old') == 'new'
+    assert tokens.info()['shared_refreshes'] == 1
@@ -0,0 +1,82 @@
+"""Connecting a company warms its local mirror, dashboard entities first"""
+
+import threading
+
+import pytest
+
+import app as datarift
+from conftest import FakeResponse
+from qb_entities import entities_in
+from qb_scheduler import SyncScheduler
+from qb_store import EntityStore
+from qb_sync import SyncEngine
+from test_scheduler import FakeEngine, FakeTokens
+
+TOKENS = {'access_token': 'new-token', 'refresh_token': 'refresh', 'expires_in': 3600}
+
+
+def test_oauth_callback_warms_the_new_company_and_rotates_the_session(client, monkeypatch):
+    warmed, saved = [], []
+    monkeypatch.setattr(datarift.qb_client, 'post', lambda url, **kwargs: FakeResponse(TOKENS))
+    monkeypatch.setattr(datarift.token_manager, 'save', lambda realm, tokens: saved.append(realm))
+    monkeypatch.setattr(datarift.sync_scheduler, 'warm', lambda *args: warmed.append(args))
+    with client.session_transaction() as session:
+        session['oauth_state'] = 'state'
+    before = client.get_cookie('session').value
+
+    response = client.get('/callback?code=code&state=state&realmId=123')
+
+    assert response.status_code == 302 and response.headers['Location'].endswith('/dashboard')
+    assert warmed == [('123', entities_in('warm'))]
+    assert saved == ['123']
+    assert client.get_cookie('session').value != before
+    with client.session_transaction() as session:
+        assert session['company_id'] == '123'
+        assert session['access_token'] == 'new-token'
+
+
+def test_callback_with_a_forged_state_warms_nothing(client, monkeypatch):
+    monkeypatch.setattr(datarift.sync_scheduler, 'warm', lambda *args: pytest.fail("warmed"))
+    with client.session_transaction() as session:
+        session['oauth_state'] = 'state'
+
+    assert client.get('/callback?code=code&state=other&realmId=123').status_code == 400
+
+
+def test_a_realm_being_warmed_is_not_warmed_twice():
+    release = threading.Event()
+    engine = FakeEngine()
+    sync = engine.sync
+
+    def slow_sync(*args, **kwargs):
+        release.wait(5)
+        return sync(*args, **kwargs)
+
+    engine.sync = slow_sync
+    scheduler = SyncScheduler(engine=engine, tokens=FakeTokens(), interval=100)
+
+    first = scheduler.warm('1', ('Invoice',))
+    assert scheduler.warm('1', ('Invoice',)) is first
+    release.set()
+    first.join(5)
+
+    assert engine.syncs == [('1', 'token', ('Invoice',))]
+    assert scheduler.realm_info('1')['runs'] == 1
+
+
+def test_warm_entities_are_loaded_before_the_rest(tmp_path):
+    loaded = []
+
+    class Client:
+        cache = None
+
+        def query_all(self, company_id, access_token, entity_type, use_cache=True, where=None):
+            loaded.append(entity_type)
+            return []
+
+    engine = SyncEngine(client=Client(), store=EntityStore(path=str(tmp_path / 'mirror.db')),
+                        entities=['Account', 'Vendor', 'Invoice', 'Customer'])
+
+    engine.sync('1', 'token', first=('Customer', 'Invoice'))
+
+    assert loaded == ['Customer', 'Invoice', 'Account', 'Vendor']
@@ -12,8 +12,8 @@ from flask import Flask, request, redirect, render_template_string, jsonify, ses
 import os
 import secrets
 import base64
-import requests
 from dotenv import load_dotenv
+from qb_client import get_client
 from urllib.parse import urlencode
 
 # Load environment variables
@@ -249,7 +249,7 @@ def test_api():
     }
     
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = get_client().get(url, headers=headers, params=params)
         
         if response.status_code == 200:
             return jsonify({
@@ -317,7 +317,7 @@ def exchange_code_for_tokens(auth_code, realm_id):
     }
     
     try:
-        response = requests.post(oauth_helper.token_url, headers=headers, data=data)
+        response = get_client().post(oauth_helper.token_url, headers=headers, data=data)
         
         if response.status_code == 200:
             token_data = response.json()